@@ -1,12 +1,9 @@
 # ai_assistant_page.py
-import requests
-from bs4 import BeautifulSoup
-import urllib.parse # 用于 URL 编码
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
     QTextEdit, QMessageBox, QListWidget, QListWidgetItem, QGroupBox, QApplication
 )
-from PyQt6.QtCore import Qt, QThread, pyqtSignal # 使用线程处理网络请求，避免界面卡顿
+from PyQt6.QtCore import Qt, QObject, pyqtSignal
 from PyQt6.QtGui import QFont
 
 # 假设 db_utils.py 在可访问路径
@@ -15,92 +12,57 @@ try:
 except ImportError as e:
     print(f"错误：导入数据库工具时出错 - {e}")
     def execute_query(query, params=None): return None
+from ai_search import SEARCH_SOURCES, start_fan_out, normalize_title
+from local_search import get_index, start_refresh, search_local_books
 
-# --- 负责执行网络搜索的线程 ---
-class SearchThread(QThread):
-    # 定义信号，参数类型为 list (搜索结果) 和 str (错误信息)
-    results_ready = pyqtSignal(list, str)
-
-    def __init__(self, query):
-        super().__init__()
-        self.query = query
-        self.headers = { # 模拟浏览器
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-        }
-        self.is_running = True
-
-    def run(self):
-        """执行搜索和解析"""
-        error_message = ""
-        results = []
-        if not self.is_running:
-            return
+HOLDINGS_ROLE = Qt.ItemDataRole.UserRole + 1 # 列表项上保存的本地馆藏记录
+SOURCES_ROLE = Qt.ItemDataRole.UserRole + 2 # 找到该书的数据源名称列表
 
-        # 构造百度搜索 URL
-        # 添加 "书籍" 或 "小说" 等关键词可能有助于缩小范围
-        search_term = f"{self.query} 书籍"
-        encoded_query = urllib.parse.quote(search_term)
-        url = f"https://www.baidu.com/s?wd={encoded_query}"
-        print(f"AI Assistant: Searching URL: {url}") # 调试输出
-
-        try:
-            response = requests.get(url, headers=self.headers, timeout=10)
-            response.raise_for_status()
-            response.encoding = response.apparent_encoding # 或者 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser') # 使用 Python 内建解析器，或尝试 'lxml'
-
-            # 解析百度搜索结果 - 这部分选择器可能因百度改版而失效，需要灵活调整
-            # 尝试查找包含标题的常见容器
-            # Baidu PC 结果通常在 class="result" 或 class="c-container" 的 div 中
-            result_containers = soup.find_all('div', class_=lambda x: x and ('result' in x or 'c-container' in x))
-
-            if not result_containers: # 如果没找到，尝试其他可能的 class
-                 result_containers = soup.find_all('div', class_='result-op')
-
-            print(f"AI Assistant: Found {len(result_containers)} result containers.") # 调试输出
-
-            for container in result_containers:
-                if not self.is_running: break # 允许提前停止
-
-                # 查找标题链接 <a>
-                title_tag = container.find('h3') # 标题通常在 h3 中
-                if not title_tag:
-                     title_tag = container.find('a') # 有时直接是 a 标签
-
-                if title_tag:
-                    title_text = title_tag.get_text(strip=True)
-                    # 简单规则：如果标题包含书名号《》，则很可能是书名
-                    if '《' in title_text and '》' in title_text:
-                        # 尝试提取书名号内的内容
-                        import re
-                        match = re.search(r'《([^》]+)》', title_text)
-                        if match:
-                            book_title = match.group(1).strip()
-                            if book_title and book_title not in results: # 避免重复
-                                print(f"AI Assistant: Found potential book: {book_title}") # 调试输出
-                                results.append(book_title)
-                    # (可选) 补充其他启发式规则，比如标题包含“著”、“作者”、“出版社”等
-
-            if not results:
-                 error_message = "未能从搜索结果中提取到明确的书名信息。"
-
-        except requests.exceptions.RequestException as e:
-            error_message = f"网络请求失败: {e}"
-        except Exception as e:
-            error_message = f"解析搜索结果时发生错误: {e}"
-        finally:
-            if self.is_running:
-                self.results_ready.emit(results, error_message) # 发送信号
-
-    def stop(self):
-        self.is_running = False
+# --- 把搜索交给 ai_search 的共享线程池，并把结果以信号送回界面线程 ---
+class SearchDispatcher(QObject):
+    # 每个数据源完成时发出: 搜索代号, 数据源名称, 结果条目列表, 错误信息
+    source_results = pyqtSignal(int, str, object, str)
+    search_done = pyqtSignal(int) # 搜索代号
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.generation = 0 # 每次搜索或取消加一，旧代号的结果一律丢弃
+
+    def start(self, query):
+        """开始一次搜索 (同时查询网络、馆藏检索和本地索引)，立即返回其代号；之前的搜索自动作废"""
+        self.generation += 1
+        generation = self.generation
+        print(f"AI Assistant: Searching for: {query}") # 调试输出
+        start_fan_out(query,
+                      lambda source, entries, error_message: self.source_results.emit(
+                          generation, source.label, entries, error_message),
+                      on_done=lambda: self.search_done.emit(generation),
+                      is_cancelled=lambda: generation != self.generation)
+        return generation
+
+    def cancel(self):
+        """作废当前搜索，不等待后台线程"""
+        self.generation += 1
+
+# --- 在后台检查并重建本地搜索索引，完成后以信号通知界面线程 ---
+class IndexRefresher(QObject):
+    index_ready = pyqtSignal(int) # 索引中的图书数量，索引不可用时为 -1
+
+    def start(self):
+        """启动后台刷新 (守护线程，关闭窗口时不需要等待)；已在刷新时不重复启动"""
+        start_refresh(lambda index: self.index_ready.emit(len(index.book_nos) if index is not None else -1))
 
 # --- AI 助手页面 ---
 class AIAssistantPage(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.search_thread = None # 初始化搜索线程变量
+        self.search_dispatcher = SearchDispatcher(self)
+        self.search_dispatcher.source_results.connect(self.show_source_results) # 连接信号到槽
+        self.search_dispatcher.search_done.connect(self.search_finished)
+        self.index_refresher = IndexRefresher(self)
+        self.index_refresher.index_ready.connect(self.local_index_ready)
+        self.result_items = {} # 归一化书名 -> 列表项，用于合并各数据源的重复结果
+        self.source_status = {} # 数据源名称 -> 完成情况
         self.setup_ui()
 
     def setup_ui(self):
@@ -126,6 +88,10 @@ class AIAssistantPage(QWidget):
         self.search_button.clicked.connect(self.start_search)
         search_layout.addWidget(self.query_input, 1) # 输入框占主要宽度
         search_layout.addWidget(self.search_button)
+        self.local_search_button = QPushButton("本地搜索")
+        self.local_search_button.setToolTip("在本地馆藏中离线检索 (不需要网络)")
+        self.local_search_button.clicked.connect(self.start_local_search)
+        search_layout.addWidget(self.local_search_button)
         main_layout.addLayout(search_layout)
 
         # 结果显示区域
@@ -152,59 +118,134 @@ class AIAssistantPage(QWidget):
             QMessageBox.warning(self, "提示", "请输入查询内容！")
             return
 
-        # 如果上一个线程还在运行，先停止它
-        if self.search_thread and self.search_thread.isRunning():
-            self.search_thread.stop()
-            self.search_thread.wait() # 等待线程结束
+        # 上一次搜索如果还没结束会自动作废 (结果被丢弃)，不需要等待它，界面不会卡住
+        self.clear_results()
+        self.source_status = {source.label: None for source in SEARCH_SOURCES}
+        self.update_search_status()
+        self.search_dispatcher.start(query)
 
-        # 禁用按钮，显示状态
-        self.search_button.setEnabled(False)
-        self.query_input.setEnabled(False)
-        self.status_label.setText("正在搜索，请稍候...")
-        self.status_label.setStyleSheet("font-style: normal; color: blue;")
-        self.results_list.clear() # 清空上次结果
 
-        # 创建并启动新线程
-        self.search_thread = SearchThread(query)
-        self.search_thread.results_ready.connect(self.show_results) # 连接信号到槽
-        self.search_thread.finished.connect(self.search_finished) # 线程结束后恢复按钮状态
-        self.search_thread.start()
+    def refresh_local_index(self):
+        """进入页面时在后台检查书目是否变化，必要时重建本地搜索索引"""
+        self.index_refresher.start()
 
+    def local_index_ready(self, book_count):
+        if book_count < 0:
+            self.local_search_button.setToolTip("本地搜索索引不可用 (无法连接数据库?)")
+        else:
+            self.local_search_button.setToolTip(f"在本地馆藏中离线检索 (索引 {book_count} 本书)")
 
-    def show_results(self, results, error_message):
-        """在列表中显示搜索结果"""
-        self.results_list.clear()
+    def start_local_search(self):
+        """用本地 BM25 索引检索，毫秒级完成，直接在界面线程执行。
 
-        if error_message:
-            self.status_label.setText(f"搜索出错: {error_message}")
-            self.status_label.setStyleSheet("font-style: normal; color: red;")
-        elif not results:
-            self.status_label.setText("未能找到相关的书籍信息。")
+        这里只读取已有的索引，从不在界面线程中重建；索引还没建好时提示稍后再试。
+        """
+        query = self.query_input.text().strip()
+        if not query:
+            QMessageBox.warning(self, "提示", "请输入查询内容！")
+            return
+        self.search_dispatcher.cancel() # 正在进行的智能搜索结果不再混入
+        self.clear_results()
+        if get_index() is None:
+            self.status_label.setText("本地搜索索引尚未就绪，正在后台建立，请稍后再试。")
             self.status_label.setStyleSheet("font-style: italic; color: gray;")
+            self.refresh_local_index()
+            return
+        books = search_local_books(query, top_k=20)
+        if not books:
+            self.status_label.setText("本地馆藏中没有找到相关的书籍。")
+            self.status_label.setStyleSheet("font-style: italic; color: gray;")
+            return
+        self.status_label.setText(f"本地馆藏中找到 {len(books)} 本相关书籍 (按相关度排序，双击查看详情):")
+        self.status_label.setStyleSheet("font-style: normal; color: green;")
+        self.add_results("本地索引", [{'title': book['BookName'], 'books': [book]} for book in books])
+
+    def clear_results(self):
+        self.results_list.clear()
+        self.result_items = {}
+
+    def add_results(self, source_label, entries):
+        """把一个数据源的结果追加到列表；归一化后同名的书合并到已有的列表项上"""
+        for entry in entries:
+            key = normalize_title(entry['title'])
+            item = self.result_items.get(key)
+            if item is None:
+                item = QListWidgetItem()
+                item.setData(Qt.ItemDataRole.UserRole, entry['title'])
+                item.setData(HOLDINGS_ROLE, entry['books'])
+                item.setData(SOURCES_ROLE, [source_label])
+                self.result_items[key] = item
+                self.results_list.addItem(item)
+            else:
+                sources = item.data(SOURCES_ROLE)
+                if source_label not in sources:
+                    item.setData(SOURCES_ROLE, sources + [source_label])
+                if entry['books'] is not None:
+                    # 合并馆藏记录 (按书号去重)；之前馆藏未知的条目也因此补上了馆藏
+                    books = {book['BookNo']: book for book in (item.data(HOLDINGS_ROLE) or [])}
+                    books.update((book['BookNo'], book) for book in entry['books'])
+                    item.setData(HOLDINGS_ROLE, list(books.values()))
+            self.render_item(item)
+
+    def render_item(self, item):
+        """列表项文字：书名、本地馆藏数量和可借库存、来源"""
+        title = item.data(Qt.ItemDataRole.UserRole)
+        books = item.data(HOLDINGS_ROLE)
+        sources = "、".join(item.data(SOURCES_ROLE))
+        if books is None:
+            item.setText(f"《{title}》  —  本地馆藏未知  [{sources}]")
+            item.setForeground(Qt.GlobalColor.black)
+        elif not books:
+            item.setText(f"《{title}》  —  本地无馆藏  [{sources}]")
+            item.setForeground(Qt.GlobalColor.gray)
         else:
-            self.status_label.setText(f"找到 {len(results)} 个可能相关的书名 (双击可在本地库搜索):")
+            storage = sum(book['Storage'] or 0 for book in books)
+            total = sum(book['Total'] or 0 for book in books)
+            item.setText(f"《{title}》  —  本地 {len(books)} 种，可借 {storage}/{total} 本  [{sources}]")
+            item.setForeground(Qt.GlobalColor.darkGreen if storage > 0 else Qt.GlobalColor.darkRed)
+
+    def show_source_results(self, generation, source_label, entries, error_message):
+        """某个数据源完成：立即显示它的结果，不等其他数据源"""
+        if generation != self.search_dispatcher.generation:
+            return # 已被新的搜索取代
+        self.source_status[source_label] = f"出错 ({error_message})" if error_message else f"{len(entries)} 条"
+        self.add_results(source_label, entries)
+        self.update_search_status()
+
+    def update_search_status(self):
+        """状态栏显示已找到的结果数和各数据源的进度"""
+        progress = "，".join(f"{label}: {status or '搜索中...'}" for label, status in self.source_status.items())
+        searching = any(status is None for status in self.source_status.values())
+        count = self.results_list.count()
+        if searching:
+            self.status_label.setText(f"正在搜索，已找到 {count} 本 | {progress}")
+            self.status_label.setStyleSheet("font-style: normal; color: blue;")
+        elif count:
+            self.status_label.setText(f"找到 {count} 本可能相关的书籍 (双击查看本地馆藏) | {progress}")
             self.status_label.setStyleSheet("font-style: normal; color: green;")
-            for title in results:
-                item = QListWidgetItem(f"《{title}》")
-                self.results_list.addItem(item)
+        else:
+            self.status_label.setText(f"未能找到相关的书籍信息。 | {progress}")
+            self.status_label.setStyleSheet("font-style: italic; color: gray;")
 
 
-    def search_finished(self):
-        """搜索线程结束后恢复界面状态"""
-        self.search_button.setEnabled(True)
-        self.query_input.setEnabled(True)
-        # 可以根据最终结果设置状态标签的最终文本，show_results 中已设置
+    def search_finished(self, generation):
+        """所有数据源都已报告 (或超时)"""
+        if generation == self.search_dispatcher.generation:
+            self.update_search_status()
 
 
     def search_local_db(self, item):
         """(可选增强) 双击结果列表项时，在本地数据库模糊搜索"""
-        book_title = item.text().strip('《》') # 获取书名
+        book_title = item.data(Qt.ItemDataRole.UserRole) # 获取书名
         if not book_title: return
 
-        query = "SELECT BookNo, BookName, Author, Storage FROM Books WHERE BookName LIKE %s"
-        # 使用更宽松的模糊匹配
-        search_pattern = f"%{book_title}%"
-        results = execute_query(query, (search_pattern,))
+        # 搜索完成后已批量查询过馆藏，直接使用；否则 (如数据库当时出错) 再单独查询一次
+        results = item.data(HOLDINGS_ROLE)
+        if results is None:
+            query = "SELECT BookNo, BookName, Author, Storage FROM Books WHERE BookName LIKE %s"
+            # 使用更宽松的模糊匹配
+            search_pattern = f"%{book_title}%"
+            results = execute_query(query, (search_pattern,))
 
         if results:
             # 可以弹出一个新对话框显示本地搜索结果，或在状态栏提示
@@ -218,9 +259,7 @@ class AIAssistantPage(QWidget):
 
     # 确保在窗口关闭时能正确停止线程
     def closeEvent(self, event):
-        if self.search_thread and self.search_thread.isRunning():
-            self.search_thread.stop()
-            self.search_thread.wait()
+        self.search_dispatcher.cancel() # 索引刷新在守护线程中进行，同样不需要等待
         super().closeEvent(event)
 
 
@@ -0,0 +1,324 @@
+# ai_search.py
+# 智能搜书助手的搜索逻辑（与界面无关）：进程内共享的 keep-alive 会话、
+# 查询结果缓存（TTL + LRU，持久化到磁盘）、基于 lxml 的书名提取，
+# 以及并发查询多个数据源 (网络、馆藏检索、本地索引) 的 fan_out_search。
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+import urllib.parse
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+from lxml import html as lxml_html
+
+try:
+    from db_utils import execute_query
+except ImportError as e:
+    print(f"错误：导入数据库工具时出错 - {e}")
+    def execute_query(query, params=None): return None
+from local_search import search_local_books
+import metrics
+
+HEADERS = { # 模拟浏览器
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+}
+SEARCH_URL = "https://www.baidu.com/s?wd={}"
+CONNECT_TIMEOUT = 3 # 建立连接的超时 (秒)
+REQUEST_TIMEOUT = 10 # 等待响应数据的超时 (秒)，作用于每次 socket 读取
+
+QUERY_CACHE_PATH = '.ai_search_cache.json'
+QUERY_CACHE_SIZE = 256 # 最多缓存的查询数 (超出后淘汰最久未使用的)
+QUERY_CACHE_TTL = 24 * 3600 # 缓存有效期 (秒)
+
+# 标题中书名号内的内容很可能是书名
+BOOK_TITLE_RE = re.compile(r'《([^》]+)》')
+# 百度 PC 结果通常在 class 含 "result" 或 "c-container" 的 div 中
+RESULT_CONTAINER_XPATH = "//div[contains(@class, 'result') or contains(@class, 'c-container')]"
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """进程内共享的 requests.Session：复用 TCP/TLS 连接，后续查询免去握手"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+class QueryCache:
+    """查询 → 书名列表 的缓存，带过期时间和 LRU 淘汰，每次写入后原子地保存到 JSON 文件"""
+
+    def __init__(self, path=QUERY_CACHE_PATH, max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # key -> [保存时间, 书名列表]，按最近使用排序
+        self._load()
+
+    @staticmethod
+    def normalize(query):
+        """大小写与多余空白不同的查询视为同一个"""
+        return " ".join(query.lower().split())
+
+    def get(self, query):
+        key = self.normalize(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self.entries[key]
+                entry = None
+            metrics.record_cache_lookup('ai_search_query', entry is not None)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return list(entry[1])
+
+    def put(self, query, titles):
+        key = self.normalize(query)
+        with self.lock:
+            self.entries[key] = [time.time(), list(titles)]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._save()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, (saved_at, titles) in saved:
+            if now - saved_at <= self.ttl:
+                self.entries[key] = [saved_at, titles]
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self.entries.items()), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"保存搜索缓存失败: {e}")
+
+_query_cache = None
+
+def get_query_cache():
+    global _query_cache
+    with _session_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache()
+        return _query_cache
+
+
+def extract_book_titles(page_html):
+    """从搜索结果页中提取书名号内的书名（去重，保持出现顺序）"""
+    if not page_html:
+        return []
+    tree = lxml_html.fromstring(page_html)
+    titles = []
+    for container in tree.xpath(RESULT_CONTAINER_XPATH):
+        # 标题通常在 h3 中，有时直接是 a 标签
+        title_tags = container.xpath('(.//h3)[1]') or container.xpath('(.//a)[1]')
+        if not title_tags:
+            continue
+        match = BOOK_TITLE_RE.search(title_tags[0].text_content())
+        if match:
+            book_title = match.group(1).strip()
+            if book_title and book_title not in titles:
+                titles.append(book_title)
+    return titles
+
+
+def search_web(query, cache=None, timeout=(CONNECT_TIMEOUT, REQUEST_TIMEOUT)):
+    """在网络上搜索与描述相关的书名，返回 (书名列表, 错误信息)；命中缓存时不发请求"""
+    cache = cache if cache is not None else get_query_cache()
+    cached = cache.get(query)
+    if cached is not None:
+        return cached, ""
+
+    # 添加 "书籍" 关键词有助于缩小范围
+    url = SEARCH_URL.format(urllib.parse.quote(f"{query} 书籍"))
+    try:
+        response = get_session().get(url, timeout=timeout)
+        response.raise_for_status()
+        response.encoding = response.apparent_encoding
+        titles = extract_book_titles(response.text)
+    except requests.exceptions.RequestException as e:
+        return [], f"网络请求失败: {e}"
+    except Exception as e:
+        return [], f"解析搜索结果时发生错误: {e}"
+
+    if not titles:
+        return [], "未能从搜索结果中提取到明确的书名信息。"
+    cache.put(query, titles) # 只缓存成功的结果，失败的查询下次会重新请求
+    return titles, ""
+
+
+def _like_pattern(text):
+    """构造 LIKE '%text%' 的参数，转义书名中的通配符"""
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def lookup_local_holdings(titles):
+    """用一次查询在本地 Books 表中查找所有书名的馆藏。
+
+    返回 {书名: [{'BookNo', 'BookName', 'Author', 'Total', 'Storage'}, ...]}，
+    书名没有对应馆藏时为空列表；数据库出错时返回 None。
+    匹配规则与原来的双击搜索相同 (书名包含该标题)，但 N 个标题只需扫描一次表。
+    """
+    titles = [title for title in dict.fromkeys(titles) if title]
+    if not titles:
+        return {}
+    conditions = " OR ".join(["BookName LIKE %s"] * len(titles))
+    query = f"SELECT BookNo, BookName, Author, Total, Storage FROM Books WHERE {conditions}"
+    rows = execute_query(query, tuple(_like_pattern(title) for title in titles))
+    if rows is None:
+        return None
+    holdings = {title: [] for title in titles}
+    for row in rows:
+        book_name = (row['BookName'] or '').casefold()
+        for title in titles:
+            if title.casefold() in book_name:
+                holdings[title].append(row)
+    return holdings
+
+
+# --- 多数据源并发搜索 ---
+# 每个数据源的 search(query) 返回结果条目 [{'title': 书名, 'books': 本地馆藏记录列表或 None}]，
+# 出错时抛出异常。timeout 为该数据源开始执行后的最长等待秒数 (在线程池中排队的时间不算)，
+# 超时的数据源结果被丢弃。
+SearchSource = namedtuple('SearchSource', ['name', 'label', 'search', 'timeout'])
+
+# 书名归一化：去掉括号内的版本/册数说明、标点和空白，统一全半角和大小写
+TITLE_NOTE_RE = re.compile(r'[（(\[【][^）)\]】]*[）)\]】]')
+TITLE_PUNCT_RE = re.compile(r'[\s·・:：,，.。!！?？\-—_《》"“”\'‘’]+')
+# 馆藏检索时按空白和常见标点把查询拆成关键词
+KEYWORD_SPLIT_RE = re.compile(r'[\s,，、;；]+')
+
+def normalize_title(title):
+    """用于去重的书名键：《三体（全集）》 与 三体 视为同一本"""
+    title = unicodedata.normalize('NFKC', title or '').casefold()
+    stripped = TITLE_PUNCT_RE.sub('', TITLE_NOTE_RE.sub('', title))
+    return stripped or TITLE_PUNCT_RE.sub('', title)
+
+
+def index_source(query):
+    """本地 BM25 索引 (见 local_search)"""
+    return [{'title': book['BookName'], 'books': [book]} for book in search_local_books(query, top_k=10)]
+
+
+def catalogue_source(query):
+    """馆藏检索：每个关键词都要出现在书名、作者、出版社或类别中"""
+    keywords = [keyword for keyword in KEYWORD_SPLIT_RE.split(query) if keyword]
+    if not keywords:
+        return []
+    conditions = " AND ".join(["CONCAT_WS(' ', BookName, Author, Publisher, BookType) LIKE %s"] * len(keywords))
+    rows = execute_query(f"SELECT BookNo, BookName, Author, Total, Storage FROM Books WHERE {conditions} LIMIT 20",
+                         tuple(_like_pattern(keyword) for keyword in keywords))
+    if rows is None:
+        raise RuntimeError("数据库查询失败")
+    return [{'title': row['BookName'], 'books': [row]} for row in rows]
+
+
+def web_source(query):
+    """网络搜索，书名再用一次批量查询补上本地馆藏"""
+    titles, error_message = search_web(query)
+    if error_message:
+        raise RuntimeError(error_message)
+    holdings = lookup_local_holdings(titles) or {}
+    return [{'title': title, 'books': holdings.get(title)} for title in titles]
+
+
+SEARCH_SOURCES = (
+    SearchSource('index', '本地索引', index_source, 2.0),
+    SearchSource('catalogue', '馆藏检索', catalogue_source, 3.0),
+    SearchSource('web', '网络', web_source, REQUEST_TIMEOUT),
+)
+
+_search_pool = None
+_fan_out_pool = None
+
+def get_search_pool():
+    """各数据源查询共用的线程池 (被放弃的慢查询在后台跑完，不阻塞调用方)"""
+    global _search_pool
+    with _session_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ai-search')
+        return _search_pool
+
+def get_fan_out_pool():
+    """运行 fan_out_search 本身的线程池；与数据源查询分开，避免互相占满线程"""
+    global _fan_out_pool
+    with _session_lock:
+        if _fan_out_pool is None:
+            _fan_out_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ai-search-fan-out')
+        return _fan_out_pool
+
+
+def fan_out_search(query, on_result, is_cancelled=lambda: False, sources=SEARCH_SOURCES, poll_interval=0.1):
+    """并发查询所有数据源，每个数据源一完成 (或超时、出错) 就调用 on_result(source, 条目列表, 错误信息)。
+
+    is_cancelled() 返回 True 时立即返回，不再报告剩余的数据源。
+    """
+    # 超时从查询真正开始执行时算起：线程池被之前放弃的慢查询占满时，
+    # 新查询在队列里等待不应被算作超时
+    started = {}
+    def run(source):
+        started[source.name] = time.monotonic()
+        return source.search(query)
+    futures = {get_search_pool().submit(run, source): source for source in sources}
+    for future in futures:
+        metrics.SEARCH_TASKS_IN_FLIGHT.inc()
+        future.add_done_callback(lambda _: metrics.SEARCH_TASKS_IN_FLIGHT.dec()) # 超时被放弃的查询结束时才减
+    pending = set(futures)
+    while pending and not is_cancelled():
+        done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                entries, error_message = future.result(), ""
+            except Exception as e:
+                entries, error_message = [], str(e)
+            if not is_cancelled():
+                on_result(futures[future], entries, error_message)
+        now = time.monotonic()
+        for future in [f for f in pending if now - started.get(futures[f].name, now) >= futures[f].timeout]:
+            pending.discard(future)
+            future.cancel() # 已经开始执行的查询无法中止，其结果会被丢弃
+            if not is_cancelled():
+                on_result(futures[future], [], f"超时 (超过 {futures[future].timeout:g} 秒)")
+    for future in pending:
+        future.cancel()
+
+
+def start_fan_out(query, on_result, on_done=None, is_cancelled=lambda: False, sources=SEARCH_SOURCES):
+    """在后台线程池中运行 fan_out_search，立即返回 Future；结束 (包括被取消) 后调用 on_done()。
+
+    取消只需让 is_cancelled() 返回 True：调度在 poll 间隔内退出，
+    还在进行的数据源查询被放弃，由各自的 socket 超时收尾，调用方无需等待。
+    """
+    def run():
+        try:
+            fan_out_search(query, on_result, is_cancelled, sources)
+        finally:
+            if on_done is not None:
+                on_done()
+    return get_fan_out_pool().submit(run)
@@ -0,0 +1,134 @@
+# bench_borrow.py
+# 借书热点路径的延迟基准：对比「每次调用新建连接 + 文本协议」与「线程长连接 + 预处理语句缓存」
+# 用法: python bench_borrow.py [-n 次数]   (使用 db_utils 当前加载的配置，可用 LIBRARY_CONFIG 指定测试库)
+import argparse
+import datetime
+import statistics
+import time
+
+import db_utils
+from db_utils import (
+    execute_query, execute_modify, execute_prepared_query, execute_prepared_modify,
+    close_thread_connection
+)
+
+BENCH_CARD_NO = 'BENCH_CARD'
+BENCH_BOOK_NO = 'BENCH_BOOK'
+
+# 与 BorrowPage.perform_borrow 完全相同的语句
+BOOK_QUERY = "SELECT BookName, Storage FROM Books WHERE BookNo = %s"
+ALREADY_BORROWED_QUERY = "SELECT FID FROM LibraryRecords WHERE CardNo = %s AND BookNo = %s AND ReturnDate IS NULL"
+UPDATE_STOCK_SQL = "UPDATE Books SET Storage = Storage - 1 WHERE BookNo = %s AND Storage > 0"
+INSERT_RECORD_SQL = "INSERT INTO LibraryRecords (CardNo, BookNo, LentDate, Operator) VALUES (%s, %s, %s, %s)"
+# 每次借书后立即还回，保证每轮的数据状态一致 (不计入耗时)
+RETURN_RECORD_SQL = "UPDATE LibraryRecords SET ReturnDate = %s WHERE FID = %s"
+RETURN_STOCK_SQL = "UPDATE Books SET Storage = Storage + 1 WHERE BookNo = %s"
+
+
+def borrow_once(query, modify):
+    """按借书页面的顺序执行一次借书，返回新借阅记录的 FID"""
+    book_info = query(BOOK_QUERY, (BENCH_BOOK_NO,))
+    if not book_info or book_info[0]['Storage'] <= 0:
+        raise RuntimeError("基准测试图书库存不足")
+    if query(ALREADY_BORROWED_QUERY, (BENCH_CARD_NO, BENCH_BOOK_NO)):
+        raise RuntimeError("基准测试借书证存在未还记录")
+    lent_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    modify(UPDATE_STOCK_SQL, (BENCH_BOOK_NO,))
+    return modify(INSERT_RECORD_SQL, (BENCH_CARD_NO, BENCH_BOOK_NO, lent_date, None))
+
+
+def return_once(fid):
+    return_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    execute_prepared_modify(RETURN_RECORD_SQL, (return_date, fid))
+    execute_prepared_modify(RETURN_STOCK_SQL, (BENCH_BOOK_NO,))
+
+
+def persistent_text_mode():
+    """长连接但仍走文本协议，用于把「连接复用」与「免去 SQL 解析」两部分收益分开"""
+    connection = db_utils.create_connection()
+    connection.autocommit = True
+
+    def query(sql, params):
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def modify(sql, params):
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        row_id = cursor.lastrowid
+        cursor.close()
+        return row_id
+
+    return connection, query, modify
+
+
+def run_mode(query, modify, iterations, warmup=5):
+    """执行 iterations 次借书，返回每次借书的耗时 (毫秒)"""
+    for _ in range(warmup):
+        return_once(borrow_once(query, modify))
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fid = borrow_once(query, modify)
+        timings.append((time.perf_counter() - start) * 1000)
+        return_once(fid)
+    return timings
+
+
+def setup_bench_data():
+    cleanup_bench_data()
+    execute_modify("INSERT INTO LibraryCard (CardNo, Name, Department, CardType) VALUES (%s, %s, %s, %s)",
+                   (BENCH_CARD_NO, '基准测试读者', '基准测试', '学生'))
+    execute_modify("INSERT INTO Books (BookNo, BookType, BookName, Total, Storage) VALUES (%s, %s, %s, %s, %s)",
+                   (BENCH_BOOK_NO, '基准测试', '基准测试图书', 10, 10))
+
+
+def cleanup_bench_data():
+    execute_modify("DELETE FROM LibraryRecords WHERE CardNo = %s", (BENCH_CARD_NO,))
+    execute_modify("DELETE FROM Books WHERE BookNo = %s", (BENCH_BOOK_NO,))
+    execute_modify("DELETE FROM LibraryCard WHERE CardNo = %s", (BENCH_CARD_NO,))
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return statistics.mean(timings), statistics.median(timings), p95
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="借书热点路径延迟基准 (预处理语句 vs 普通查询)")
+    parser.add_argument('-n', '--iterations', type=int, default=200, help="每种模式的借书次数")
+    args = parser.parse_args()
+
+    probe = db_utils.create_connection()
+    if not probe:
+        print("数据库连接失败，无法运行基准测试。")
+        raise SystemExit(1)
+    db_utils.close_connection(probe)
+
+    print(f"基准测试数据库: {db_utils.DB_CONFIG.get('database')}，每种模式借书 {args.iterations} 次")
+    setup_bench_data()
+    text_connection, text_query, text_modify = persistent_text_mode()
+    try:
+        results = {
+            "每次新建连接 (execute_query/execute_modify)": run_mode(execute_query, execute_modify, args.iterations),
+            "长连接 + 文本协议": run_mode(text_query, text_modify, args.iterations),
+            "长连接 + 预处理语句缓存 (execute_prepared_*)": run_mode(execute_prepared_query, execute_prepared_modify, args.iterations),
+        }
+    finally:
+        db_utils.close_connection(text_connection)
+        cleanup_bench_data()
+        close_thread_connection()
+
+    baseline_mean = None
+    for label, timings in results.items():
+        mean, p50, p95 = summarize(timings)
+        line = f"{label}: 平均 {mean:.3f} ms, p50 {p50:.3f} ms, p95 {p95:.3f} ms"
+        if baseline_mean is None:
+            baseline_mean = mean
+        else:
+            line += f"  (相对第一种: 每次借书 {mean - baseline_mean:+.3f} ms, {mean / baseline_mean:.1%})"
+        print(line)
@@ -0,0 +1,163 @@
+# bench_parser.py
+# Parser micro-benchmark: items/sec for the original parser (a copy is kept below as
+# the baseline) versus the refactored full-tree BeautifulSoup parse, the
+# SoupStrainer path and the lxml XPath fast path.
+# Usage: python bench_parser.py [-r ROUNDS] [--cache-dir .crawler_cache] [files ...]
+import argparse
+import glob
+import os
+import random
+import re
+import time
+
+from bs4 import BeautifulSoup
+
+from web_crawler import extract_douban_id, parse_book_info, parse_book_info_soup
+from http_cache import HttpCache
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def parse_book_info_original(html):
+    """The crawler's parser as it was before the fast path, unchanged apart from
+    dropping commented-out debug lines: full tree, repeated item.find, regexes
+    compiled per item and prettify() on every failing item."""
+    if not html:
+        return []
+
+    soup = BeautifulSoup(html, 'lxml')
+    book_list = []
+    items = soup.find_all('tr', class_='item')
+
+    for item in items:
+        book_data = {}
+        try:
+            title_tag = item.find('div', class_='pl2').find('a')
+            if title_tag:
+                book_data['BookName'] = title_tag.get('title', '').strip()
+                if not book_data['BookName']:
+                    book_data['BookName'] = title_tag.get_text(strip=True)
+
+                detail_url = title_tag.get('href', '')
+                if detail_url:
+                    book_data['BookNo'] = extract_douban_id(detail_url)
+            else:
+                continue
+
+            pub_info_tag = item.find('p', class_='pl')
+            if pub_info_tag:
+                pub_info_text = pub_info_tag.get_text(strip=True)
+                parts = [p.strip() for p in pub_info_text.split('/') if p.strip()]
+
+                if len(parts) > 0:
+                    author_text = re.sub(r'^\s*\[.*?\]\s*|\s*\(.*?\)\s*|\s*/.*', '', parts[0]).strip()
+                    book_data['Author'] = author_text if len(author_text) < 100 else author_text[:100]
+
+                publisher = None
+                year = None
+                price_str = None
+                price_decimal = None
+
+                possible_publisher_parts = []
+                for part in reversed(parts[1:]):
+                    price_match = re.search(r'(?:CNY|RMB|￥|\$|USD|元)?\s*(\d+(?:\.\d{1,2})?)', part, re.IGNORECASE)
+                    if price_match and not price_str:
+                        price_str = part
+                        price_decimal = float(price_match.group(1))
+                        continue
+
+                    year_match = re.search(r'^\b(\d{4})\b(?:-\d{1,2})?$', part)
+                    if year_match and not year:
+                        year = int(year_match.group(1))
+                        continue
+
+                    possible_publisher_parts.insert(0, part)
+
+                if possible_publisher_parts:
+                    full_publisher_text = " / ".join(possible_publisher_parts)
+                    publisher = full_publisher_text if len(full_publisher_text) < 100 else full_publisher_text[:100]
+
+                book_data['Publisher'] = publisher
+                book_data['Year'] = year
+                book_data['Price'] = price_decimal
+
+            else:
+                print(f"Could not find publication info tag for: {book_data.get('BookName')}")
+
+            rating_tag = item.find('span', class_='rating_nums')
+
+            book_data['BookType'] = '综合推荐'
+
+            initial_stock = random.randint(5, 15)
+            book_data['Total'] = initial_stock
+            book_data['Storage'] = initial_stock
+
+            if book_data.get('BookNo') and book_data.get('BookName'):
+                book_list.append(book_data)
+            else:
+                print(f"信息不完整，跳过: BookNo='{book_data.get('BookNo')}', BookName='{book_data.get('BookName')}'")
+
+        except Exception as e:
+            item_html_snippet = item.prettify()[:500]
+            print(f"解析图书条目时发生意外错误: {e}")
+
+    return book_list
+
+
+PARSERS = [
+    ("original parser", parse_book_info_original),
+    ("soup, full tree (refactored)", lambda html: parse_book_info_soup(html, only_items=False)),
+    ("soup + SoupStrainer(tr.item)", parse_book_info_soup),
+    ("lxml XPath (default)", parse_book_info),
+]
+
+
+def load_pages(paths, cache_dir=None):
+    """Collects HTML pages from the given files, the fixtures directory and, optionally, the crawler cache."""
+    pages = []
+    for path in paths or sorted(glob.glob(os.path.join(FIXTURE_DIR, '*.html'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append(f.read())
+    if cache_dir and os.path.isdir(cache_dir):
+        cache = HttpCache(cache_dir)
+        for url in cache.urls():
+            entry = cache.get(url)
+            if entry:
+                pages.append(entry['body'])
+    return pages
+
+
+def bench(parse, pages, rounds):
+    """Parses every page `rounds` times and returns (items parsed, elapsed seconds)."""
+    items = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            items += len(parse(html))
+    return items, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the crawler's list-page parsers")
+    parser.add_argument('files', nargs='*', help="HTML files to parse (default: fixtures/*.html)")
+    parser.add_argument('-r', '--rounds', type=int, default=50, help="Passes over the page set per parser")
+    parser.add_argument('--cache-dir', default=None, help="Also parse every page stored in this crawler cache")
+    args = parser.parse_args()
+
+    pages = load_pages(args.files, args.cache_dir)
+    if not pages:
+        print("No HTML pages found to benchmark.")
+        raise SystemExit(1)
+
+    print(f"{len(pages)} page(s), {args.rounds} round(s) per parser")
+    baseline_rate = None
+    for label, parse in PARSERS:
+        parse(pages[0])  # warm-up (imports, lxml/bs4 internals)
+        items, elapsed = bench(parse, pages, args.rounds)
+        rate = items / elapsed if elapsed else float('inf')
+        line = f"{label:<30} {items:>7} items in {elapsed:6.3f}s  -> {rate:10.0f} items/sec"
+        if baseline_rate is None:
+            baseline_rate = rate
+        else:
+            line += f"  ({rate / baseline_rate:.1f}x)"
+        print(line)
@@ -0,0 +1,371 @@
+# bench_queries.py
+# 图书馆热点 SQL 的基准套件：按页面的原样语句和调用方式 (execute_query / iter_query / execute_prepared_*)
+# 在当前数据库 (通常是 data_generator.py 生成的数据) 上反复执行，统计 p50/p95/p99 延迟和吞吐量，
+# 每次运行的结果保存为 JSON，并与保存的基线比较，发现性能回退时以非零状态退出。
+# 用法: LIBRARY_CONFIG=test_config.py python bench_queries.py [-n 200] [--only borrow,return] [--save-baseline]
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import time
+
+import numpy as np
+
+import db_utils
+from db_utils import (
+    execute_query, iter_query, execute_prepared_query, execute_prepared_modify,
+    close_thread_connection
+)
+
+RESULTS_DIR = 'bench_results'
+BASELINE_FILE = 'baseline.json'
+REGRESSION_THRESHOLD = 0.2 # p50/p95 比基线慢 20% 以上视为回退
+REGRESSION_MIN_DELTA_MS = 0.5 # 且至少慢这么多毫秒 (忽略亚毫秒级的抖动)
+BORROW_DURATION_DAYS = 30 # 与 OverduePage / CardManagePage 相同
+SAMPLE_SIZE = 200 # 每种参数 (卡号、书号、书名片段) 随机抽取的数量
+
+# --- 以下语句与各页面中的完全相同 ---
+# QueryPage.perform_search
+SEARCH_BASE_QUERY = "SELECT BookNo, BookType, BookName, Publisher, Year, Author, Price, Total, Storage FROM Books WHERE 1=1"
+SEARCH_ORDER = " ORDER BY UpdateTime DESC LIMIT 500"
+# QueryPage.load_borrow_ranking
+RANKING_QUERY = """
+        SELECT
+            lr.BookNo,
+            b.BookName,
+            b.Author,
+            COUNT(lr.FID) AS BorrowCount
+        FROM LibraryRecords lr
+        JOIN Books b ON lr.BookNo = b.BookNo
+        GROUP BY lr.BookNo, b.BookName, b.Author
+        ORDER BY BorrowCount DESC
+        LIMIT %s
+        """
+# OverduePage.build_overdue_query
+OVERDUE_QUERY = f"""
+        SELECT
+            lr.FID, lr.CardNo, lc.Name AS BorrowerName, lr.BookNo, b.BookName, lr.LentDate,
+            DATEDIFF(CURDATE(), lr.LentDate) AS OverdueDays -- 计算借出天数 (MySQL DATEDIFF)
+        FROM LibraryRecords lr
+        JOIN Books b ON lr.BookNo = b.BookNo
+        JOIN LibraryCard lc ON lr.CardNo = lc.CardNo
+        WHERE lr.ReturnDate IS NULL
+          AND lr.LentDate < DATE_SUB(CURDATE(), INTERVAL {BORROW_DURATION_DAYS} DAY) -- 只查询借出日期早于截止日期的
+        ORDER BY OverdueDays DESC, lr.LentDate ASC
+        """
+# CardManagePage.display_reader_stats
+TOTAL_BORROW_QUERY = "SELECT COUNT(FID) AS TotalCount FROM LibraryRecords WHERE CardNo = %s"
+CURRENT_BORROW_QUERY = "SELECT COUNT(FID) AS CurrentCount FROM LibraryRecords WHERE CardNo = %s AND ReturnDate IS NULL"
+OVERDUE_COUNT_QUERY = f"""
+        SELECT COUNT(FID) AS OverdueCount
+        FROM LibraryRecords
+        WHERE CardNo = %s
+          AND ReturnDate IS NULL
+          AND LentDate < DATE_SUB(CURDATE(), INTERVAL {BORROW_DURATION_DAYS} DAY)
+        """
+# BorrowPage.find_borrower_and_records (ReturnPage 查询借阅中图书的语句相同)
+CARD_QUERY = "SELECT Name, Department, CardType FROM LibraryCard WHERE CardNo = %s"
+CURRENT_RECORDS_QUERY = """
+        SELECT lr.FID, lr.BookNo, b.BookName, b.Author, lr.LentDate
+        FROM LibraryRecords lr
+        JOIN Books b ON lr.BookNo = b.BookNo
+        WHERE lr.CardNo = %s AND lr.ReturnDate IS NULL
+        ORDER BY lr.LentDate DESC
+        """
+HABIT_QUERY = """
+        SELECT b.BookType, COUNT(lr.FID) AS BorrowCount
+        FROM LibraryRecords lr
+        JOIN Books b ON lr.BookNo = b.BookNo
+        WHERE lr.CardNo = %s AND b.BookType IS NOT NULL AND b.BookType != ''
+        GROUP BY b.BookType
+        ORDER BY BorrowCount DESC
+        LIMIT 1
+        """
+RECOMMENDATION_QUERY = """
+        SELECT b.BookNo, b.BookName, b.Author
+        FROM Books b
+        WHERE b.BookType = %s
+          AND b.Storage > 0
+          AND b.BookNo NOT IN (
+              SELECT DISTINCT lr.BookNo
+              FROM LibraryRecords lr
+              WHERE lr.CardNo = %s
+          )
+        ORDER BY b.Year DESC
+        LIMIT %s
+        """
+# BorrowPage.perform_borrow
+BOOK_QUERY = "SELECT BookName, Storage FROM Books WHERE BookNo = %s"
+ALREADY_BORROWED_QUERY = "SELECT FID FROM LibraryRecords WHERE CardNo = %s AND BookNo = %s AND ReturnDate IS NULL"
+UPDATE_STOCK_SQL = "UPDATE Books SET Storage = Storage - 1 WHERE BookNo = %s AND Storage > 0"
+INSERT_RECORD_SQL = "INSERT INTO LibraryRecords (CardNo, BookNo, LentDate, Operator) VALUES (%s, %s, %s, %s)"
+# ReturnPage.perform_return
+RETURN_RECORD_SQL = "UPDATE LibraryRecords SET ReturnDate = %s WHERE FID = %s AND ReturnDate IS NULL"
+RETURN_STOCK_SQL = "UPDATE Books SET Storage = Storage + 1 WHERE BookNo = %s"
+
+
+def sample_parameters(seed=42):
+    """从当前数据库随机抽取查询参数：卡号、有库存的书号、书名片段和一个经手人。
+
+    用 RAND(seed) 抽样，同一份数据上每次抽到相同的参数。
+    """
+    cards = execute_query("SELECT CardNo FROM LibraryCard ORDER BY RAND(%s) LIMIT %s", (seed, SAMPLE_SIZE))
+    books = execute_query("SELECT BookNo, BookName FROM Books WHERE Storage > 0 ORDER BY RAND(%s) LIMIT %s",
+                          (seed, SAMPLE_SIZE))
+    operators = execute_query("SELECT UserID FROM Users LIMIT 1")
+    if not cards or not books:
+        raise RuntimeError("数据库中没有借书证或有库存的图书，请先用 data_generator.py 生成数据")
+    return {
+        'card_nos': [row['CardNo'] for row in cards],
+        'book_nos': [row['BookNo'] for row in books],
+        # 书名片段: 取书名的前两个字，模拟按书名模糊查询
+        'name_fragments': [row['BookName'][:2] for row in books if row['BookName']],
+        'operator': operators[0]['UserID'] if operators else None,
+    }
+
+
+class BenchContext:
+    """一个执行者 (基准进程或模拟的借还台) 的查询参数和随机数状态 (按种子可复现)"""
+
+    def __init__(self, seed=42, sample=None):
+        self.rng = random.Random(seed)
+        sample = sample or sample_parameters(seed)
+        self.card_nos = sample['card_nos']
+        self.book_nos = sample['book_nos']
+        self.name_fragments = sample['name_fragments']
+        self.operator = sample['operator']
+        self.pending_returns = [] # (FID, BookNo)：借书场景借出、等待还书场景归还的记录
+
+    def pick(self, values):
+        return self.rng.choice(values)
+
+
+# --- 各场景的一次操作 (与页面的调用方式相同) ---
+
+def search_initial(ctx):
+    """QueryPage 初次加载：无条件，按更新时间取最新 500 本"""
+    execute_query(SEARCH_BASE_QUERY + SEARCH_ORDER, (), row_format='tuple')
+
+
+def search_by_name(ctx):
+    """QueryPage 按书名模糊查询"""
+    query = SEARCH_BASE_QUERY + " AND " + "BookName LIKE %s" + SEARCH_ORDER
+    execute_query(query, (f"%{ctx.pick(ctx.name_fragments)}%",), row_format='tuple')
+
+
+def borrow_ranking(ctx):
+    execute_query(RANKING_QUERY, (10,))
+
+
+def overdue_records(ctx):
+    """OverduePage 流式读取全部逾期记录"""
+    for _ in iter_query(OVERDUE_QUERY, row_format='record'):
+        pass
+
+
+def reader_stats(ctx):
+    card_no = ctx.pick(ctx.card_nos)
+    execute_query(TOTAL_BORROW_QUERY, (card_no,))
+    execute_query(CURRENT_BORROW_QUERY, (card_no,))
+    execute_query(OVERDUE_COUNT_QUERY, (card_no,))
+
+
+def card_lookup(ctx):
+    """BorrowPage.find_borrower_and_records：借书证、借阅中图书、借阅习惯和推荐"""
+    card_no = ctx.pick(ctx.card_nos)
+    if not execute_prepared_query(CARD_QUERY, (card_no,)):
+        return
+    execute_query(CURRENT_RECORDS_QUERY, (card_no,))
+    habit = execute_query(HABIT_QUERY, (card_no,))
+    if habit:
+        execute_query(RECOMMENDATION_QUERY, (habit[0]['BookType'], card_no, 5))
+
+
+# 借还操作的结果：完成 / 被业务规则拒绝 (无库存、已借未还) / 数据库写入失败
+OK, REFUSED, FAILED = 'ok', 'refused', 'failed'
+
+
+def borrow(ctx, card_no=None, book_no=None):
+    """BorrowPage.perform_borrow 的全部检查和写入；借出的记录留给还书场景归还"""
+    card_no, book_no = card_no or ctx.pick(ctx.card_nos), book_no or ctx.pick(ctx.book_nos)
+    book_info = execute_prepared_query(BOOK_QUERY, (book_no,))
+    if not book_info or book_info[0]['Storage'] <= 0:
+        return REFUSED
+    if execute_prepared_query(ALREADY_BORROWED_QUERY, (card_no, book_no)):
+        return REFUSED
+    lent_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if execute_prepared_modify(UPDATE_STOCK_SQL, (book_no,)) is None:
+        return FAILED
+    fid = execute_prepared_modify(INSERT_RECORD_SQL, (card_no, book_no, lent_date, ctx.operator))
+    if fid is None:
+        return FAILED
+    ctx.pending_returns.append((fid, book_no))
+    return OK
+
+
+def return_record(fid, book_no):
+    """ReturnPage.perform_return 的两条写入"""
+    return_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    if execute_prepared_modify(RETURN_RECORD_SQL, (return_date, fid)) is None:
+        return FAILED
+    if execute_prepared_modify(RETURN_STOCK_SQL, (book_no,)) is None:
+        return FAILED
+    return OK
+
+
+def return_book(ctx):
+    """归还借书场景借出的记录"""
+    if not ctx.pending_returns:
+        borrow(ctx) # 借书场景未运行时先借一本 (计入本次耗时，仅在 --only return 时发生)
+        if not ctx.pending_returns:
+            return REFUSED
+    return return_record(*ctx.pending_returns.pop())
+
+
+# 名称 -> (函数, 是否为整表扫描类的重查询；重查询只跑十分之一的次数)
+SCENARIOS = {
+    'search_initial': (search_initial, False),
+    'search_by_name': (search_by_name, False),
+    'borrow_ranking': (borrow_ranking, True),
+    'overdue_records': (overdue_records, True),
+    'reader_stats': (reader_stats, False),
+    'card_lookup': (card_lookup, False),
+    'borrow': (borrow, False),
+    'return': (return_book, False),
+}
+
+
+def summarize(timings_ms, elapsed_s):
+    """单个场景的统计：次数、平均、p50/p95/p99 (毫秒) 和吞吐量 (次/秒)"""
+    timings = np.asarray(timings_ms, dtype=np.float64)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {
+        'count': int(timings.size), 'mean_ms': float(timings.mean()),
+        'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+        'throughput_ops': float(timings.size / elapsed_s) if elapsed_s > 0 else 0.0,
+    }
+
+
+def run_scenario(func, ctx, iterations, warmup):
+    """预热后执行 iterations 次，返回统计"""
+    for _ in range(warmup):
+        func(ctx)
+    timings = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        begin = time.perf_counter()
+        func(ctx)
+        timings.append((time.perf_counter() - begin) * 1000)
+    return summarize(timings, time.perf_counter() - start)
+
+
+def compare_to_baseline(scenarios, baseline_scenarios, threshold=REGRESSION_THRESHOLD,
+                        min_delta_ms=REGRESSION_MIN_DELTA_MS):
+    """返回回退列表 [(场景, 指标, 基线毫秒, 本次毫秒)]：p50 或 p95 超出基线 threshold 比例且超过 min_delta_ms"""
+    regressions = []
+    for name, stats in scenarios.items():
+        base = baseline_scenarios.get(name)
+        if not base:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if stats[metric] > base[metric] * (1 + threshold) and stats[metric] - base[metric] > min_delta_ms:
+                regressions.append((name, metric, base[metric], stats[metric]))
+    return regressions
+
+
+def dataset_info():
+    """结果文件中记录的数据规模，便于判断两次结果是否可比"""
+    info = {'database': db_utils.DB_CONFIG.get('database')}
+    for table in ('Books', 'LibraryCard', 'LibraryRecords'):
+        rows = execute_query(f"SELECT COUNT(*) AS Count FROM {table}")
+        info[table] = rows[0]['Count'] if rows else None
+    return info
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def save_results(results, results_dir=RESULTS_DIR, baseline=False):
+    """写入 results_dir/<时间戳>.json；baseline=True 时同时写为基线"""
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{datetime.datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    paths = [path] + ([os.path.join(results_dir, BASELINE_FILE)] if baseline else [])
+    for target in paths:
+        with open(target, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_baseline(results_dir=RESULTS_DIR):
+    try:
+        with open(os.path.join(results_dir, BASELINE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图书馆热点 SQL 基准 (p50/p95/p99 延迟、吞吐量、基线回退检查)")
+    parser.add_argument('-n', '--iterations', type=int, default=200, help="每个场景的执行次数 (重查询为其十分之一)")
+    parser.add_argument('--warmup', type=int, default=3, help="每个场景的预热次数")
+    parser.add_argument('--only', help=f"只运行这些场景 (逗号分隔): {', '.join(SCENARIOS)}")
+    parser.add_argument('--seed', type=int, default=42, help="参数抽样的随机种子")
+    parser.add_argument('--results-dir', default=RESULTS_DIR, help="结果 JSON 的保存目录")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为新的基线")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help="判定回退的相对阈值")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的场景: {', '.join(unknown)}")
+
+    probe = db_utils.create_connection()
+    if not probe:
+        print("数据库连接失败，无法运行基准测试。")
+        raise SystemExit(1)
+    db_utils.close_connection(probe)
+
+    context = BenchContext(args.seed)
+    results = {'started_at': datetime.datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+               'dataset': dataset_info(), 'iterations': args.iterations, 'scenarios': {}}
+    print(f"基准测试数据库: {results['dataset']}")
+    try:
+        for name in names:
+            func, heavy = SCENARIOS[name]
+            iterations = max(5, args.iterations // 10) if heavy else args.iterations
+            stats = run_scenario(func, context, iterations, args.warmup)
+            results['scenarios'][name] = stats
+            print(f"{name:16s} n={stats['count']:<5d} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms  "
+                  f"p99 {stats['p99_ms']:9.3f} ms  {stats['throughput_ops']:9.1f} 次/秒")
+        # 借书场景借出而还书场景没有还完的记录，在这里还回，保持数据不变
+        while context.pending_returns:
+            return_book(context)
+    finally:
+        close_thread_connection()
+
+    baseline = load_baseline(args.results_dir)
+    path = save_results(results, args.results_dir, baseline=args.save_baseline)
+    print(f"结果已保存到 {path}")
+    if args.save_baseline:
+        print("已保存为新的基线。")
+    elif baseline is None:
+        print("尚无基线，可用 --save-baseline 保存本次结果作为基线。")
+    else:
+        # 借阅记录数每次运行都会因借书场景略有增长，不参与比较
+        comparable = ('database', 'Books', 'LibraryCard')
+        if any(baseline.get('dataset', {}).get(key) != results['dataset'][key] for key in comparable):
+            print(f"注意: 基线的数据规模不同 ({baseline.get('dataset')})，比较结果仅供参考。")
+        regressions = compare_to_baseline(results['scenarios'], baseline.get('scenarios', {}), args.threshold)
+        for name, metric, base_ms, current_ms in regressions:
+            print(f"性能回退: {name} {metric} {base_ms:.3f} ms -> {current_ms:.3f} ms ({current_ms / base_ms - 1:+.0%})")
+        if regressions:
+            raise SystemExit(1)
+        print("与基线相比没有性能回退。")
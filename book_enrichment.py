@@ -0,0 +1,151 @@
+# book_enrichment.py
+# Second crawl stage: fetch the Douban subject page of each crawled book and store
+# its ISBN, page count and tags in BookDetails (see schema.sql).
+# Usage: python book_enrichment.py [--limit N] [--workers 4] [--rate 1.0] [--job enrich.sqlite]
+import argparse
+import re
+
+from lxml import html as lxml_html
+
+from crawl_frontier import CrawlFrontier
+from web_crawler import (
+    DEFAULT_BOOK_TYPE, PageHandler, run_crawl_job, extract_douban_id,
+    enable_http_cache, add_counts
+)
+from db_utils import execute_query, transaction, Error as DBError
+
+SUBJECT_URL = "https://book.douban.com/subject/{}/"
+MAX_TAGS = 8 # Tags kept per book
+TAGS_MAX_LENGTH = 255 # BookDetails.Tags is VARCHAR(255)
+
+# The #info block is "label: value<br/>" pairs; its text content is matched line by line
+ISBN_RE = re.compile(r'ISBN:\s*([0-9Xx-]{10,17})')
+PAGES_RE = re.compile(r'页数:\s*(\d+)')
+# Tags also appear in an inline script as criteria = '7:tag|7:tag|3:/subject/...'
+CRITERIA_TAG_RE = re.compile(r"criteria\s*=\s*'([^']*)'")
+TAG_XPATH = "//div[@id='db-tags-section']//a[contains(concat(' ', normalize-space(@class), ' '), ' tag ')]"
+
+
+def parse_subject_page(html, url):
+    """Extracts {'BookNo', 'ISBN', 'Pages', 'Tags'} from a subject page; returns [] or [details]."""
+    book_no = extract_douban_id(url)
+    if not book_no:
+        return []
+    tree = lxml_html.fromstring(html)
+
+    isbn = pages = None
+    info = tree.xpath("//div[@id='info']")
+    if info:
+        info_text = info[0].text_content()
+        isbn_match = ISBN_RE.search(info_text)
+        if isbn_match:
+            isbn = isbn_match.group(1).replace('-', '').upper()
+        pages_match = PAGES_RE.search(info_text)
+        if pages_match:
+            pages = int(pages_match.group(1))
+
+    tags = [a.text_content().strip() for a in tree.xpath(TAG_XPATH)]
+    if not tags:
+        criteria = CRITERIA_TAG_RE.search(html)
+        if criteria:
+            tags = [part[2:] for part in criteria.group(1).split('|') if part.startswith('7:')]
+    tags = list(dict.fromkeys(tag for tag in tags if tag))[:MAX_TAGS]
+
+    if isbn is None and pages is None and not tags:
+        return [] # Not a book page (or a captcha/blocked page): leave it for a retry
+    return [{'BookNo': book_no, 'ISBN': isbn, 'Pages': pages, 'Tags': tags}]
+
+
+def books_missing_details(limit=None):
+    """BookNo (= Douban subject ID) of books that have no BookDetails row yet, oldest first."""
+    query = """
+    SELECT b.BookNo FROM Books b
+    LEFT JOIN BookDetails d ON d.BookNo = b.BookNo
+    WHERE d.BookNo IS NULL AND b.BookNo REGEXP '^[0-9]+$'
+    ORDER BY b.UpdateTime
+    """
+    params = None
+    if limit:
+        query += "LIMIT %s"
+        params = (limit,)
+    rows = execute_query(query, params, row_format='tuple')
+    return [book_no for (book_no,) in rows or []]
+
+
+def join_tags(tags, max_length=TAGS_MAX_LENGTH):
+    """Comma-joins tags, dropping whole tags from the end until the result fits in max_length."""
+    tags = list(tags)
+    while tags and len(",".join(tags)) > max_length:
+        tags.pop()
+    return ",".join(tags)
+
+
+def save_book_details(details_list):
+    """Writes a batch of parsed details in one transaction.
+
+    Books still carrying the listing placeholder category get the first tag as
+    their BookType; categories set by a librarian are left alone.
+    Returns counts: enriched / reclassified / failed.
+    """
+    if not details_list:
+        return {'enriched': 0, 'reclassified': 0, 'failed': 0}
+    detail_rows = [(d['BookNo'], d['ISBN'], d['Pages'], join_tags(d['Tags'])) for d in details_list]
+    type_rows = [(d['Tags'][0][:50], d['BookNo'], DEFAULT_BOOK_TYPE) for d in details_list if d['Tags']]
+    try:
+        with transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO BookDetails (BookNo, ISBN, Pages, Tags) VALUES (%s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE ISBN = VALUES(ISBN), Pages = VALUES(Pages), Tags = VALUES(Tags)",
+                detail_rows)
+            reclassified = 0
+            if type_rows:
+                cursor.executemany("UPDATE Books SET BookType = %s WHERE BookNo = %s AND BookType = %s", type_rows)
+                reclassified = max(cursor.rowcount, 0)
+    except DBError as e:
+        print(f"保存图书详情失败，本批 {len(details_list)} 本已回滚: {e}")
+        return {'enriched': 0, 'reclassified': 0, 'failed': len(details_list)}
+    return {'enriched': len(detail_rows), 'reclassified': reclassified, 'failed': 0}
+
+
+def enrichment_handlers():
+    return {'detail': PageHandler(parse=parse_subject_page, save=save_book_details)}
+
+
+def enrich_books(frontier, limit=None, max_workers=4, rate_per_host=1.0, max_attempts=3):
+    """Queues every book missing details and fetches their subject pages; returns the save counts.
+
+    Incremental: books that already have a BookDetails row are never queued, and
+    with a persistent frontier, pages already saved or out of attempts are skipped too.
+    """
+    book_nos = books_missing_details(limit)
+    added = frontier.add([SUBJECT_URL.format(book_no) for book_no in book_nos], 'detail')
+    print(f"{len(book_nos)} 本图书缺少详情，新加入抓取队列 {added} 个页面")
+    return run_crawl_job(frontier, enrichment_handlers(), max_workers=max_workers,
+                         rate_per_host=rate_per_host, max_attempts=max_attempts)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="抓取豆瓣图书详情页，补充 ISBN、页数和分类标签")
+    parser.add_argument('--limit', type=int, default=None, help="本次最多补充的图书数")
+    parser.add_argument('--workers', type=int, default=4, help="抓取线程数")
+    parser.add_argument('--rate', type=float, default=1.0, help="每个主机每秒最多请求数")
+    parser.add_argument('--job', metavar='STATE_FILE', default=':memory:',
+                        help="抓取进度文件 (默认不保存；指定后失败的页面在下次运行时重试)")
+    parser.add_argument('--max-attempts', type=int, default=3, help="每个页面最多尝试的次数")
+    parser.add_argument('--cache-dir', default='.crawler_cache', help="HTTP 缓存目录")
+    parser.add_argument('--no-cache', action='store_true', help="不使用 HTTP 缓存")
+    parser.add_argument('--offline', action='store_true', help="离线回放: 只从 HTTP 缓存读取页面")
+    args = parser.parse_args()
+    if args.offline and args.no_cache:
+        parser.error("--offline 需要使用 HTTP 缓存，不能与 --no-cache 同时使用")
+    if not args.no_cache:
+        enable_http_cache(args.cache_dir, offline=args.offline)
+
+    frontier = CrawlFrontier(args.job)
+    try:
+        totals = add_counts({'enriched': 0, 'reclassified': 0, 'failed': 0},
+                            enrich_books(frontier, args.limit, args.workers, args.rate, args.max_attempts))
+        print(f"详情补充完成: {totals['enriched']} 本写入详情，{totals['reclassified']} 本更新了分类，"
+              f"{totals['failed']} 本保存失败。抓取进度: {frontier.stats('detail')}")
+    finally:
+        frontier.close()
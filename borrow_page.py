@@ -8,13 +8,22 @@ from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont, QColor
 import datetime
 
+import metrics
+
 # 假设 db_utils.py 在可访问路径
 try:
-    from db_utils import execute_query, execute_modify
+    from db_utils import execute_query, execute_modify, execute_prepared_query, execute_prepared_modify
 except ImportError as e:
     print(f"错误：导入数据库工具时出错 - {e}")
     def execute_query(query, params=None): return None
     def execute_modify(query, params=None): return None
+    def execute_prepared_query(query, params=None): return None
+    def execute_prepared_modify(query, params=None): return None
+try:
+    from desk_replica import get_desk
+except ImportError as e:
+    print(f"错误：导入借还台离线模式时出错 - {e}")
+    def get_desk(): return None
 
 class BorrowPage(QWidget):
     def __init__(self, parent=None):
@@ -122,8 +131,13 @@ class BorrowPage(QWidget):
             self.reset_borrow_state()
             return
 
-        card_query = "SELECT Name, Department, CardType FROM LibraryCard WHERE CardNo = %s"
-        card_info = execute_query(card_query, (card_no,))
+        desk = get_desk()
+        if desk is not None: # 离线借还模式：从本地副本读取
+            card = desk.find_card(card_no)
+            card_info = [card] if card else None
+        else:
+            card_query = "SELECT Name, Department, CardType FROM LibraryCard WHERE CardNo = %s"
+            card_info = execute_prepared_query(card_query, (card_no,))
         if not card_info:
             QMessageBox.warning(self, "查询失败", f"未找到卡号为 '{card_no}' 的借书证！")
             self.reset_borrow_state()
@@ -137,6 +151,11 @@ class BorrowPage(QWidget):
         self.book_no_input.setFocus()
 
         self.load_current_borrowed_books(card_no)
+        if desk is not None and desk.online is False: # 中心库不可用时跳过借阅习惯和推荐，避免等待连接超时
+            self.most_common_book_type = None
+            self.habit_label.setText("最常借阅类别: 中心库连接中断，暂不可用")
+            self.recommendation_group.setVisible(False)
+            return
         self.load_borrowing_habit(card_no)
 
         if self.most_common_book_type:
@@ -147,6 +166,10 @@ class BorrowPage(QWidget):
 
     def load_current_borrowed_books(self, card_no):
         """根据卡号加载当前借阅中的图书列表"""
+        desk = get_desk()
+        if desk is not None:
+            self.populate_borrowed_table(desk.open_loans(card_no, newest_first=True))
+            return
         records_query = """
         SELECT lr.FID, lr.BookNo, b.BookName, b.Author, lr.LentDate
         FROM LibraryRecords lr
@@ -174,6 +197,8 @@ class BorrowPage(QWidget):
                         display_text = value.strftime('%Y-%m-%d %H:%M')
                     else:
                         display_text = str(value)
+                elif key == "FID" and row_data.get('SyncStatus'): # 离线模式下尚未同步到中心库的借书
+                    display_text = "冲突" if row_data['SyncStatus'] == 'conflict' else "待同步"
                 item = QTableWidgetItem(display_text)
                 if col_index == 0:
                      item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
@@ -254,8 +279,18 @@ class BorrowPage(QWidget):
             QMessageBox.warning(self, "输入错误", "请输入要借阅的图书书号(ID)！")
             return
 
+        desk = get_desk()
+        if desk is not None: # 离线借还模式：写入本地副本和待同步队列，由后台线程同步到中心库
+            book_name, error = desk.borrow(self.current_card_no, book_no, self.operator_id)
+            if error:
+                QMessageBox.warning(self, "操作失败", error)
+                return
+            metrics.CIRCULATION.inc(operation='borrow')
+            self.borrow_succeeded(book_no, book_name)
+            return
+
         book_query = "SELECT BookName, Storage FROM Books WHERE BookNo = %s"
-        book_info = execute_query(book_query, (book_no,))
+        book_info = execute_prepared_query(book_query, (book_no,))
         if not book_info:
             QMessageBox.warning(self, "操作失败", f"未找到书号为 '{book_no}' 的图书！")
             return
@@ -267,7 +302,7 @@ class BorrowPage(QWidget):
             return
 
         already_borrowed_query = "SELECT FID FROM LibraryRecords WHERE CardNo = %s AND BookNo = %s AND ReturnDate IS NULL"
-        already_borrowed = execute_query(already_borrowed_query, (self.current_card_no, book_no))
+        already_borrowed = execute_prepared_query(already_borrowed_query, (self.current_card_no, book_no))
         if already_borrowed:
              QMessageBox.warning(self, "操作失败", f"您已借阅图书 '{book_name}' (ID: {book_no}) 且尚未归还！")
              return
@@ -280,16 +315,10 @@ class BorrowPage(QWidget):
         params_insert = (self.current_card_no, book_no, lent_date, operator)
 
         try:
-            execute_modify(update_stock_sql, (book_no,))
-            execute_modify(insert_record_sql, params_insert)
-
-            QMessageBox.information(self, "操作成功", f"图书 '{book_name}' (ID: {book_no})\n已成功借给卡号 {self.current_card_no}！")
-            self.book_no_input.clear()
-            self.load_current_borrowed_books(self.current_card_no) # 刷新借阅列表
-            # 借阅成功后可以考虑重新加载推荐，因为已借阅列表变了
-            if self.most_common_book_type:
-                 self.load_recommendations(self.current_card_no, self.most_common_book_type)
-            self.book_no_input.setFocus()
+            execute_prepared_modify(update_stock_sql, (book_no,))
+            execute_prepared_modify(insert_record_sql, params_insert)
+            metrics.CIRCULATION.inc(operation='borrow')
+            self.borrow_succeeded(book_no, book_name)
 
         except Exception as e:
             QMessageBox.critical(self, "数据库错误", f"借阅操作失败：\n{e}")
@@ -305,6 +334,16 @@ class BorrowPage(QWidget):
                 print(f"!!! 严重错误：回滚书号 {book_no} 的库存失败：{rollback_e} !!! 数据可能不一致！")
                 QMessageBox.critical(self, "严重错误", "借阅操作失败，且库存回滚失败！请联系管理员处理。")
 
+    def borrow_succeeded(self, book_no, book_name):
+        """借书成功后提示并刷新借阅列表和推荐"""
+        QMessageBox.information(self, "操作成功", f"图书 '{book_name}' (ID: {book_no})\n已成功借给卡号 {self.current_card_no}！")
+        self.book_no_input.clear()
+        self.load_current_borrowed_books(self.current_card_no) # 刷新借阅列表
+        # 借阅成功后可以考虑重新加载推荐，因为已借阅列表变了
+        if self.most_common_book_type:
+            self.load_recommendations(self.current_card_no, self.most_common_book_type)
+        self.book_no_input.setFocus()
+
 # --- 用于独立测试页面 ---
 if __name__ == '__main__':
     import sys
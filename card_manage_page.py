@@ -10,15 +10,18 @@ import datetime # 需要 datetime 来比较日期
 
 # 假设 db_utils.py 在可访问路径
 try:
-    from db_utils import execute_query, execute_modify
+    from db_utils import execute_query, execute_modify, iter_query
 except ImportError as e:
     print(f"错误：导入数据库工具时出错 - {e}")
     def execute_query(query, params=None): return None
     def execute_modify(query, params=None): return None
+    def iter_query(query, params=None, batch_size=500, row_format='dict'): return iter(())
 
 class CardManagePage(QWidget):
     # 假设借阅期限（天），与 OverduePage 一致
     BORROW_DURATION_DAYS = 30
+    # 流式填充表格时每次扩展的行数
+    ROW_GROW_STEP = 500
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -136,23 +139,26 @@ class CardManagePage(QWidget):
         main_layout.addWidget(right_widget, 1) # 右侧占 1 份宽度
 
     def load_cards(self):
-        """加载所有借书证信息到表格"""
+        """加载所有借书证信息到表格 (流式读取，不把整张表一次性读入内存)"""
         query = "SELECT CardNo, Name, Department, CardType, UpdateTime FROM LibraryCard ORDER BY UpdateTime DESC"
-        results = execute_query(query)
-        self.populate_table(results)
+        try:
+            self.populate_table(iter_query(query, row_format='record'))
+        except Exception as e:
+            QMessageBox.critical(self, "查询错误", f"获取借书证列表时发生错误！\n{e}")
 
     def populate_table(self, data):
-        """填充借书证表格"""
+        """填充借书证表格 (data 可以是列表，也可以是 iter_query 返回的生成器)"""
         self.table_widget.setRowCount(0) # 清空旧数据
         if data is None:
             QMessageBox.critical(self, "查询错误", "获取借书证列表时发生错误！")
             return
-        if not data:
-            return # 没有数据则显示空表
 
-        self.table_widget.setRowCount(len(data))
+        row_count = 0
         column_keys = ["CardNo", "Name", "Department", "CardType", "UpdateTime"]
         for row_index, row_data in enumerate(data):
+            if row_index >= self.table_widget.rowCount():
+                # 行数未知，按批扩展，避免逐行 insertRow
+                self.table_widget.setRowCount(row_index + self.ROW_GROW_STEP)
             for col_index, key in enumerate(column_keys):
                 value = row_data.get(key)
                 display_text = ""
@@ -166,6 +172,8 @@ class CardManagePage(QWidget):
                 item = QTableWidgetItem(display_text)
                 item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
                 self.table_widget.setItem(row_index, col_index, item)
+            row_count = row_index + 1
+        self.table_widget.setRowCount(row_count) # 去掉多扩展的空行
 
     def validate_add_input(self):
         """校验添加借书证的输入"""
@@ -0,0 +1,109 @@
+# crawl_frontier.py
+# Persistent crawl frontier: per-URL progress stored in SQLite so a crawl can resume.
+import json
+import sqlite3
+import threading
+import time
+
+# Lifecycle of a URL: pending -> fetched -> parsed -> saved. A URL that fails at any
+# stage becomes 'failed' and is retried on later runs until it reaches max_attempts.
+STATUSES = ('pending', 'fetched', 'parsed', 'saved', 'failed')
+
+
+class CrawlFrontier:
+    """Tracks every URL of a crawl job and how far it got.
+
+    The state lives in a single SQLite file (WAL mode, one commit per status
+    change), so killing the crawler at any point loses at most the page in
+    flight. Parsed items are checkpointed with the URL, so a page that was
+    parsed but not yet saved is written on resume without being fetched again.
+    Safe to share between the fetch threads and the DB writer thread.
+    """
+
+    def __init__(self, path='crawl_job.sqlite'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS frontier (
+                url        TEXT PRIMARY KEY,
+                kind       TEXT NOT NULL,
+                status     TEXT NOT NULL DEFAULT 'pending',
+                attempts   INTEGER NOT NULL DEFAULT 0,
+                items      INTEGER,
+                payload    TEXT,
+                error      TEXT,
+                updated_at REAL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS frontier_status ON frontier (status, kind)")
+        self.conn.commit()
+
+    def add(self, urls, kind='list'):
+        """Queues URLs that are not in the frontier yet; returns how many were new."""
+        now = time.time()
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO frontier (url, kind, updated_at) VALUES (?, ?, ?)",
+                [(url, kind, now) for url in urls])
+            self.conn.commit()
+            return self.conn.total_changes - before
+
+    def todo(self, kinds=None, max_attempts=3, exclude=()):
+        """Returns [(url, kind)] that still need fetching, in the order they were added.
+
+        'fetched' counts as not done: the page body is not kept here (the HTTP
+        cache makes the refetch cheap). 'parsed' pages are handled by parsed_items().
+        """
+        sql = ("SELECT url, kind FROM frontier WHERE (status IN ('pending', 'fetched') "
+               "OR (status = 'failed' AND attempts < ?))")
+        params = [max_attempts]
+        if kinds:
+            sql += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params.extend(kinds)
+        with self.lock:
+            rows = self.conn.execute(sql + " ORDER BY rowid", params).fetchall()
+        return [(url, kind) for url, kind in rows if url not in exclude]
+
+    def parsed_items(self, kinds=None):
+        """Returns [(url, kind, items)] for pages parsed but not yet saved."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url, kind, payload FROM frontier WHERE status = 'parsed' ORDER BY rowid").fetchall()
+        return [(url, kind, json.loads(payload)) for url, kind, payload in rows
+                if not kinds or kind in kinds]
+
+    def mark_fetched(self, url):
+        self._set(url, "status = 'fetched', error = NULL")
+
+    def mark_parsed(self, url, items):
+        self._set(url, "status = 'parsed', items = ?, payload = ?",
+                  (len(items), json.dumps(items, ensure_ascii=False)))
+
+    def mark_saved(self, url):
+        self._set(url, "status = 'saved', payload = NULL, error = NULL")
+
+    def mark_failed(self, url, error):
+        self._set(url, "status = 'failed', attempts = attempts + 1, error = ?", (str(error),))
+
+    def _set(self, url, assignments, params=()):
+        with self.lock:
+            self.conn.execute(f"UPDATE frontier SET {assignments}, updated_at = ? WHERE url = ?",
+                              (*params, time.time(), url))
+            self.conn.commit()
+
+    def stats(self, kind=None):
+        """Returns {status: count} (every status present, zero if unused)."""
+        sql = "SELECT status, COUNT(*) FROM frontier"
+        params = ()
+        if kind:
+            sql += " WHERE kind = ?"
+            params = (kind,)
+        with self.lock:
+            counts = dict(self.conn.execute(sql + " GROUP BY status", params).fetchall())
+        return {status: counts.get(status, 0) for status in STATUSES}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,171 @@
+# crawler_sources.py
+# Catalogue sources for the crawler. Each source says which pages to fetch, how to
+# parse them and how to map the parsed items onto the Books schema; the shared
+# engine (web_crawler.run_crawl_job) does the concurrent fetching, rate limiting,
+# checkpointing and batched DB writes for all sources at once.
+# Usage: python crawler_sources.py [--douban-pages 3] [--fixtures DIR] [--workers 4] [--rate 1.0]
+import argparse
+import glob
+import os
+import pathlib
+from abc import ABC, abstractmethod
+from urllib.parse import urlsplit, unquote
+from urllib.request import url2pathname
+
+from crawl_frontier import CrawlFrontier
+from web_crawler import (
+    PageHandler, run_crawl_job, parse_book_info, save_books_batch, enable_http_cache, add_counts
+)
+
+
+class CrawlSource(ABC):
+    """Base class for a catalogue source.
+
+    Subclasses set `name` (unique; used as the frontier kind) and implement
+    the abstract fetch_plan() and parse(), so an incomplete source fails when
+    it is instantiated rather than mid-crawl. to_book() maps one parsed item
+    to a Books row dict (keys as in save_books_batch) or returns None to drop
+    it. Override fetch() only for pages that do not come over HTTP; the
+    default is the engine's cached, rate-limited fetch.
+    """
+
+    name = None
+    fetch = None
+
+    @abstractmethod
+    def fetch_plan(self):
+        """Start URLs of this source."""
+
+    @abstractmethod
+    def parse(self, html, url):
+        """Parsed items of one page."""
+
+    def to_book(self, item):
+        return item
+
+    def follow(self, books):
+        """Further pages to crawl, as {kind: [urls]} (optional)."""
+        return {}
+
+    def save(self, books, update_existing=False):
+        return save_books_batch(books, update_existing)
+
+    def handler(self, update_existing=False):
+        def parse_books(html, url):
+            return [book for book in map(self.to_book, self.parse(html, url)) if book]
+        return PageHandler(parse=parse_books, save=lambda books: self.save(books, update_existing),
+                           follow=self.follow, fetch=self.fetch)
+
+
+class DoubanTop250Source(CrawlSource):
+    """The Douban Top 250 book list (25 books per page)."""
+
+    name = 'douban_top250'
+    BASE_URL = "https://book.douban.com/top250?start={}"
+
+    def __init__(self, pages=3):
+        self.pages = pages
+
+    def fetch_plan(self):
+        return [self.BASE_URL.format(i * 25) for i in range(self.pages)]
+
+    def parse(self, html, url):
+        return parse_book_info(html) # Already Books rows, so to_book stays the identity
+
+
+class LocalFixtureSource(CrawlSource):
+    """Saved HTML pages on disk, parsed with a listing parser (Douban Top 250 by default).
+
+    Reads files directly instead of going through HTTP, so it needs neither the
+    network nor rate limiting: meant for tests and offline demos.
+    """
+
+    name = 'local_fixture'
+
+    def __init__(self, path, pattern='*.html', parser=parse_book_info):
+        if os.path.isdir(path):
+            self.files = sorted(glob.glob(os.path.join(path, pattern)))
+        else:
+            self.files = [path]
+        self.parser = parser
+
+    def fetch_plan(self):
+        return [pathlib.Path(path).resolve().as_uri() for path in self.files]
+
+    def fetch(self, url):
+        try:
+            with open(url2pathname(unquote(urlsplit(url).path)), 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError as e:
+            print(f"读取本地页面失败: {e}")
+            return None
+
+    def parse(self, html, url):
+        return self.parser(html)
+
+
+def run_sources(sources, frontier=None, update_existing=False, max_workers=4, rate_per_host=1.0,
+                burst=2, max_rate=None, max_attempts=3):
+    """Crawls all `sources` in parallel through one engine; returns {source name: save counts}.
+
+    All sources share the worker pool, the per-host limiter, the optional global
+    max_rate budget and the DB writer. Pass a persistent frontier to make the run resumable.
+    """
+    names = [source.name for source in sources]
+    if len(set(names)) != len(names):
+        raise ValueError(f"数据源名称重复: {names}")
+    own_frontier = frontier is None
+    if own_frontier:
+        frontier = CrawlFrontier(':memory:')
+    totals = {}
+    try:
+        for source in sources:
+            frontier.add(source.fetch_plan(), source.name)
+        handlers = {source.name: source.handler(update_existing) for source in sources}
+        # run_crawl_job sums counts over all kinds; count per source by wrapping each save
+        for name, handler in handlers.items():
+            def counted_save(books, save=handler.save, name=name):
+                counts = save(books)
+                add_counts(totals.setdefault(name, {}), counts)
+                return counts
+            handlers[name] = handler._replace(save=counted_save)
+        run_crawl_job(frontier, handlers, max_workers=max_workers, rate_per_host=rate_per_host,
+                      burst=burst, max_attempts=max_attempts, max_rate=max_rate)
+    finally:
+        if own_frontier:
+            frontier.close()
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从多个图书数据源并行抓取并存入数据库")
+    parser.add_argument('--douban-pages', type=int, default=3, help="豆瓣 Top250 抓取的页数 (0 表示不抓取)")
+    parser.add_argument('--fixtures', metavar='DIR', help="同时导入该目录下保存的列表页 HTML")
+    parser.add_argument('--workers', type=int, default=4, help="抓取线程数")
+    parser.add_argument('--rate', type=float, default=1.0, help="每个主机每秒最多请求数")
+    parser.add_argument('--max-rate', type=float, default=None, help="所有数据源合计每秒最多请求数")
+    parser.add_argument('--job', metavar='STATE_FILE', help="可恢复的抓取任务进度文件")
+    parser.add_argument('--update', action='store_true', help="更新已存在图书的书目信息")
+    parser.add_argument('--cache-dir', default='.crawler_cache', help="HTTP 缓存目录")
+    parser.add_argument('--no-cache', action='store_true', help="不使用 HTTP 缓存")
+    args = parser.parse_args()
+    if not args.no_cache:
+        enable_http_cache(args.cache_dir)
+
+    sources = []
+    if args.douban_pages > 0:
+        sources.append(DoubanTop250Source(args.douban_pages))
+    if args.fixtures:
+        sources.append(LocalFixtureSource(args.fixtures))
+    if not sources:
+        parser.error("没有要抓取的数据源")
+
+    job_frontier = CrawlFrontier(args.job) if args.job else None
+    try:
+        results = run_sources(sources, job_frontier, args.update, args.workers, args.rate, max_rate=args.max_rate)
+    finally:
+        if job_frontier is not None:
+            job_frontier.close()
+    for name, counts in results.items():
+        print(f"{name}: 新增 {counts.get('inserted', 0)} 本，更新 {counts.get('updated', 0)} 本，"
+              f"跳过 {counts.get('skipped', 0)} 本，失败 {counts.get('failed', 0)} 本")
@@ -0,0 +1,319 @@
+# data_generator.py
+# 规模测试用的合成数据生成器：按 schema.sql 的表结构生成管理员、借书证、图书和借阅记录，
+# 用 NumPy 向量化地抽样 (图书热度服从 Zipf 分布、借阅时长服从对数正态分布、读者按部门分布且偏好本部门的图书类别)，
+# 再以批量写入的方式导入数据库。相同的种子、规模和截止日期生成完全相同的数据。
+# 用法: python data_generator.py --scale 100 --seed 42 --reset    (规模 100 ≈ 100 万本书、2000 万条借阅记录)
+#       LIBRARY_CONFIG=test_config.py python data_generator.py ...  (导入测试库)
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+import mysql.connector
+
+import db_utils
+from db_utils import Error
+
+# 规模为 1 时各表的行数，其他规模按比例缩放
+SCALE_BASE = {'books': 10_000, 'cards': 1_000, 'records': 200_000}
+OPERATOR_COUNT = 5
+HISTORY_DAYS = 3 * 365 # 借阅记录覆盖的天数 (截止日期之前)
+RECORD_CHUNK_SIZE = 1_000_000 # 借阅记录按块生成和导入，内存占用与总规模无关
+INSERT_BATCH_SIZE = 5_000 # executemany 每批行数 (mysql.connector 会改写成一条多行 INSERT)
+LOAD_METHODS = ('insert', 'infile')
+
+ZIPF_EXPONENT = 0.8 # 图书热度 ~ 1 / 排名^s
+TYPE_AFFINITY = 0.5 # 借阅中选择本部门偏好类别的比例
+LOAN_MEDIAN_DAYS = 14
+LOAN_SIGMA = 0.7
+LOST_RATE = 0.01 # 一直未还的比例 (构成大部分逾期记录)
+
+# 图书类别及其在馆藏中的占比
+BOOK_TYPES = ['文学', '计算机', '历史', '经济管理', '数学', '物理', '外国文学', '艺术', '哲学', '法律', '医学', '教育']
+BOOK_TYPE_WEIGHTS = [0.18, 0.14, 0.09, 0.1, 0.07, 0.06, 0.1, 0.05, 0.05, 0.05, 0.06, 0.05]
+# 部门、读者占比及其偏好的图书类别
+DEPARTMENTS = [
+    ('计算机学院', 0.16, '计算机'), ('文学院', 0.12, '文学'), ('外国语学院', 0.08, '外国文学'),
+    ('历史学院', 0.06, '历史'), ('经济管理学院', 0.14, '经济管理'), ('数学学院', 0.08, '数学'),
+    ('物理学院', 0.07, '物理'), ('艺术学院', 0.05, '艺术'), ('哲学系', 0.03, '哲学'),
+    ('法学院', 0.07, '法律'), ('医学院', 0.09, '医学'), ('教育学院', 0.05, '教育'),
+]
+CARD_TYPES = ['学生', '教师', '职工', '其他']
+CARD_TYPE_WEIGHTS = [0.75, 0.12, 0.1, 0.03]
+PUBLISHERS = ['人民文学出版社', '机械工业出版社', '清华大学出版社', '高等教育出版社', '中华书局', '上海译文出版社',
+              '商务印书馆', '科学出版社', '北京大学出版社', '中信出版社', '电子工业出版社', '三联书店']
+
+SURNAMES = list('王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹')
+GIVEN_CHARS = list('伟芳娜敏静丽强磊军洋勇艳杰涛明超秀霞平刚桂英华玉兰红飞鹏宇浩然文博思远晨')
+TITLE_WORDS = ['春天', '城市', '河流', '算法', '历史', '远方', '星辰', '秘密', '时间', '世界', '故事', '原理',
+               '数据', '结构', '系统', '设计', '经济', '哲学', '花园', '记忆', '旅程', '海洋', '山谷', '黎明',
+               '战争', '和平', '艺术', '科学', '思想', '未来', '文明', '梦想', '风景', '光影', '语言', '法则']
+TITLE_SUFFIXES = ['', '', '', '导论', '简史', '研究', '入门', '（第2版）', '精解', '札记']
+
+# 导入顺序 (导入时关闭外键检查，顺序只影响可读性)
+TABLE_COLUMNS = {
+    'Users': ('UserID', 'Password', 'Name'),
+    'LibraryCard': ('CardNo', 'Name', 'Department', 'CardType'),
+    'LibraryRecords': ('CardNo', 'BookNo', 'LentDate', 'ReturnDate', 'Operator'),
+    'Books': ('BookNo', 'BookType', 'BookName', 'Publisher', 'Year', 'Author', 'Price', 'Total', 'Storage'),
+}
+
+
+def dataset_sizes(scale):
+    """给定规模因子的各表行数"""
+    return {name: max(1, int(round(count * scale))) for name, count in SCALE_BASE.items()}
+
+
+def _normalized(weights):
+    weights = np.asarray(weights, dtype=np.float64)
+    return weights / weights.sum()
+
+
+def _pick(rng, choices, size, weights=None):
+    """按权重抽样，返回字符串数组"""
+    return np.asarray(choices)[rng.choice(len(choices), size=size, p=None if weights is None else _normalized(weights))]
+
+
+def _ids(prefix, count, width):
+    return np.char.add(prefix, np.char.zfill(np.arange(1, count + 1).astype(str), width))
+
+
+def _person_names(rng, size):
+    """姓 + 一到两个名字用字"""
+    names = np.char.add(_pick(rng, SURNAMES, size), _pick(rng, GIVEN_CHARS, size))
+    second = _pick(rng, GIVEN_CHARS, size)
+    return np.where(rng.random(size) < 0.6, np.char.add(names, second), names)
+
+
+def _datetime_strings(start, seconds):
+    """start (datetime64[s]) 加上秒数数组，格式化为 'YYYY-MM-DD HH:MM:SS'"""
+    stamps = start + seconds.astype(np.int64).astype('timedelta64[s]')
+    return np.char.replace(np.datetime_as_string(stamps, unit='s'), 'T', ' ')
+
+
+def generate_cards(rng, count):
+    """借书证各列，以及每个读者的部门下标和借阅活跃度 (对数正态)"""
+    departments = rng.choice(len(DEPARTMENTS), size=count, p=_normalized([weight for _, weight, _ in DEPARTMENTS]))
+    return {
+        'CardNo': _ids('GC', count, 7),
+        'Name': _person_names(rng, count),
+        'Department': np.array([name for name, _, _ in DEPARTMENTS])[departments],
+        'CardType': _pick(rng, CARD_TYPES, count, CARD_TYPE_WEIGHTS),
+        'department_index': departments,
+        'activity': _normalized(rng.lognormal(0.0, 1.0, count)),
+    }
+
+
+def generate_catalogue(rng, count, end_year):
+    """图书的书目信息和热度 (被借阅的概率，按随机排名服从 Zipf 分布)"""
+    ranks = rng.permutation(count) + 1
+    type_index = rng.choice(len(BOOK_TYPES), size=count, p=_normalized(BOOK_TYPE_WEIGHTS))
+    titles = np.char.add(_pick(rng, TITLE_WORDS, count), _pick(rng, TITLE_WORDS, count))
+    return {
+        'BookNo': _ids('GB', count, 7),
+        'BookType': np.asarray(BOOK_TYPES)[type_index],
+        'BookName': np.char.add(titles, _pick(rng, TITLE_SUFFIXES, count)),
+        'Publisher': _pick(rng, PUBLISHERS, count, np.arange(len(PUBLISHERS), 0, -1)),
+        'Year': end_year - np.minimum(rng.gamma(2.0, 6.0, count), 70).astype(np.int64),
+        'Author': _person_names(rng, count),
+        'Price': np.round(rng.lognormal(np.log(45), 0.4, count), 2),
+        'type_index': type_index,
+        'popularity': _normalized(1.0 / ranks ** ZIPF_EXPONENT),
+    }
+
+
+class BookSampler:
+    """按热度抽书，可限定在某个类别内 (对按类别排序后的累积热度做二分查找)"""
+
+    def __init__(self, catalogue):
+        self.order = np.argsort(catalogue['type_index'], kind='stable')
+        self.cumulative = np.cumsum(catalogue['popularity'][self.order])
+        bounds = np.searchsorted(catalogue['type_index'][self.order], np.arange(len(BOOK_TYPES) + 1))
+        starts = np.concatenate(([0.0], self.cumulative))
+        self.type_low, self.type_high = starts[bounds[:-1]], starts[bounds[1:]]
+
+    def sample(self, rng, type_index):
+        """type_index 为每次抽样限定的类别下标数组 (-1 表示不限)；返回图书下标数组"""
+        u = rng.random(len(type_index))
+        low = np.where(type_index >= 0, self.type_low[type_index], 0.0)
+        high = np.where(type_index >= 0, self.type_high[type_index], self.cumulative[-1])
+        empty = high <= low # 该类别下没有书
+        low, high = np.where(empty, 0.0, low), np.where(empty, self.cumulative[-1], high)
+        positions = np.searchsorted(self.cumulative, low + u * (high - low), side='right')
+        return self.order[np.minimum(positions, len(self.order) - 1)]
+
+
+def generate_loan_chunks(rng, cards, catalogue, count, end_time, open_counts, chunk_size=RECORD_CHUNK_SIZE):
+    """按借出时间顺序分块生成借阅记录，每块 yield 一个列字典。
+
+    借出时间在 [end_time - HISTORY_DAYS, end_time) 内均匀分布；借阅时长服从对数正态分布，
+    到截止时间还没到归还时间的、以及少量丢失的记录未还 (ReturnDate 为 None)。
+    同一读者对同一本书最多一条未还记录 (与借书页面的规则一致)。
+    每本书的未还册数累加到 open_counts，生成图书时用于计算库存。
+    """
+    sampler = BookSampler(catalogue)
+    preferred_type = np.array([BOOK_TYPES.index(book_type) for _, _, book_type in DEPARTMENTS])
+    operators = np.array([user_id for user_id, _, _ in generate_users()])
+    span = HISTORY_DAYS * 86400
+    start = np.datetime64(end_time, 's') - np.timedelta64(span, 's')
+    n_books = len(catalogue['BookNo'])
+    chunk_count = max(1, -(-count // chunk_size))
+    open_keys = np.empty(0, dtype=np.int64)
+    for chunk in range(chunk_count):
+        size = count // chunk_count + (1 if chunk < count % chunk_count else 0)
+        card = rng.choice(len(cards['CardNo']), size=size, p=cards['activity'])
+        prefers = rng.random(size) < TYPE_AFFINITY
+        book = sampler.sample(rng, np.where(prefers, preferred_type[cards['department_index'][card]], -1))
+        lent = np.sort(rng.random(size)) * (span / chunk_count) + chunk * (span / chunk_count)
+        returned = lent + rng.lognormal(np.log(LOAN_MEDIAN_DAYS * 86400), LOAN_SIGMA, size)
+        is_open = (returned >= span) | (rng.random(size) < LOST_RATE)
+
+        # 同一读者同一本书的重复未还记录改为在截止时间归还
+        keys = card.astype(np.int64) * n_books + book
+        open_positions = np.flatnonzero(is_open)
+        _, first = np.unique(keys[open_positions], return_index=True)
+        duplicate = np.ones(len(open_positions), dtype=bool)
+        duplicate[first] = False
+        duplicate |= np.isin(keys[open_positions], open_keys)
+        is_open[open_positions[duplicate]] = False
+        returned = np.minimum(returned, span - 1)
+        open_keys = np.union1d(open_keys, keys[is_open])
+        open_counts += np.bincount(book[is_open], minlength=n_books)
+
+        return_dates = _datetime_strings(start, returned).astype(object)
+        return_dates[is_open] = None
+        yield {
+            'CardNo': cards['CardNo'][card],
+            'BookNo': catalogue['BookNo'][book],
+            'LentDate': _datetime_strings(start, lent),
+            'ReturnDate': return_dates,
+            'Operator': operators[rng.integers(len(operators), size=size)],
+        }
+
+
+def generate_users():
+    """经手人 (管理员)，借阅记录的 Operator 引用这些账号"""
+    return [(f"GOP{i:02d}", 'password', f"管理员{i:02d}") for i in range(1, OPERATOR_COUNT + 1)]
+
+
+def _rows(columns, table):
+    """列数组 -> 行元组列表 (转换为 Python 原生类型，数据库驱动才能识别)"""
+    return list(zip(*(np.asarray(columns[name]).tolist() for name in TABLE_COLUMNS[table])))
+
+
+def iter_dataset(scale=1.0, seed=42, end_time=None, chunk_size=RECORD_CHUNK_SIZE):
+    """按导入顺序 yield (表名, 行元组列表)；借阅记录分多块给出，图书最后给出 (库存取决于未还记录)"""
+    end_time = end_time or datetime.datetime.combine(datetime.date.today(), datetime.time())
+    sizes = dataset_sizes(scale)
+    rng = np.random.default_rng(seed)
+    cards = generate_cards(rng, sizes['cards'])
+    catalogue = generate_catalogue(rng, sizes['books'], end_time.year)
+
+    yield 'Users', generate_users()
+    yield 'LibraryCard', _rows(cards, 'LibraryCard')
+    open_counts = np.zeros(sizes['books'], dtype=np.int64)
+    for chunk in generate_loan_chunks(rng, cards, catalogue, sizes['records'], end_time, open_counts, chunk_size):
+        yield 'LibraryRecords', _rows(chunk, 'LibraryRecords')
+    # 热门的书藏书多；总数至少覆盖未还的册数
+    total = 1 + rng.poisson(np.minimum(catalogue['popularity'] * sizes['books'] * 1.5, 15))
+    catalogue['Total'] = np.maximum(total, open_counts)
+    catalogue['Storage'] = catalogue['Total'] - open_counts
+    yield 'Books', _rows(catalogue, 'Books')
+
+
+def connect(local_infile=False):
+    """导入专用连接 (LOAD DATA LOCAL INFILE 需要在连接时开启)"""
+    return mysql.connector.connect(**db_utils.DB_CONFIG, allow_local_infile=local_infile)
+
+
+def load_rows(cursor, table, rows, method='insert'):
+    """批量写入一张表的若干行。
+
+    'insert': executemany 多行 INSERT，每批 INSERT_BATCH_SIZE 行，任何服务器都可用；
+    'infile': 先写成临时 TSV 文件再 LOAD DATA LOCAL INFILE，最快，需要服务器开启 local_infile。
+    """
+    columns = TABLE_COLUMNS[table]
+    if method == 'insert':
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+        for i in range(0, len(rows), INSERT_BATCH_SIZE):
+            cursor.executemany(sql, rows[i:i + INSERT_BATCH_SIZE])
+        return
+    fd, path = tempfile.mkstemp(suffix='.tsv')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+            # 生成的数据中不含制表符、换行和反斜杠，无需转义；NULL 写作 \N
+            f.writelines("\t".join('\\N' if value is None else str(value) for value in row) + "\n" for row in rows)
+        cursor.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 "
+                       f"FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' ({', '.join(columns)})", (path,))
+    finally:
+        os.remove(path)
+
+
+def reset_tables(cursor):
+    """清空所有业务表 (schema.sql 中的全部表)"""
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in ('LibraryRecords', 'BookDetails', 'Books', 'LibraryCard', 'Users'):
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+def load_dataset(scale=1.0, seed=42, end_time=None, method='insert', reset=False, chunk_size=RECORD_CHUNK_SIZE):
+    """生成并导入整套数据，返回 {表名: 行数}。
+
+    导入期间关闭本会话的外键和唯一性检查，每块数据单独提交。
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f"未知的导入方式: {method}")
+    connection = connect(local_infile=(method == 'infile'))
+    counts = {}
+    try:
+        cursor = connection.cursor()
+        if reset:
+            reset_tables(cursor)
+        cursor.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+        for table, rows in iter_dataset(scale, seed, end_time, chunk_size):
+            start = time.perf_counter()
+            load_rows(cursor, table, rows, method)
+            connection.commit()
+            elapsed = time.perf_counter() - start
+            counts[table] = counts.get(table, 0) + len(rows)
+            print(f"{table}: 导入 {len(rows)} 行，耗时 {elapsed:.2f} 秒 ({len(rows) / max(elapsed, 1e-9):.0f} 行/秒)")
+        cursor.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+        cursor.close()
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成可复现的合成图书馆数据并批量导入数据库")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help=f"规模因子 (1 = {SCALE_BASE['books']} 本书、{SCALE_BASE['cards']} 张借书证、"
+                             f"{SCALE_BASE['records']} 条借阅记录)")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat, default=None,
+                        help="借阅记录的截止日期 YYYY-MM-DD (默认今天；复现同一份数据时需指定相同日期)")
+    parser.add_argument('--method', choices=LOAD_METHODS, default='insert',
+                        help="导入方式: insert = 多行 INSERT，infile = LOAD DATA LOCAL INFILE (需服务器开启 local_infile)")
+    parser.add_argument('--reset', action='store_true', help="导入前清空所有表 (会删除库中的全部数据!)")
+    parser.add_argument('--chunk-size', type=int, default=RECORD_CHUNK_SIZE, help="借阅记录每块的行数")
+    args = parser.parse_args()
+
+    end = datetime.datetime.combine(args.end_date, datetime.time()) if args.end_date else None
+    sizes = dataset_sizes(args.scale)
+    print(f"目标数据库: {db_utils.DB_CONFIG.get('database')}，种子 {args.seed}，"
+          f"图书 {sizes['books']} 本，借书证 {sizes['cards']} 张，借阅记录 {sizes['records']} 条")
+    start_time = time.perf_counter()
+    try:
+        loaded = load_dataset(args.scale, args.seed, end, args.method, args.reset, args.chunk_size)
+    except Error as e:
+        print(f"导入失败: {e}")
+        if getattr(e, 'errno', None) == 1062:
+            print("库中已有生成的数据，可加 --reset 清空后重新导入。")
+        raise SystemExit(1)
+    print(f"导入完成: {loaded}，总耗时 {time.perf_counter() - start_time:.1f} 秒")
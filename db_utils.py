@@ -1,55 +1,392 @@
 from pickletools import read_unicodestringnl
 
+import os
+import sys
+import json
+import time
+import logging
+import logging.handlers
+import importlib
+import threading
+import functools
+import itertools
+import contextlib
+from collections import OrderedDict, Counter
+
 import mysql.connector
-from mysql.connector import Error
-from config import DB_CONFIG # 从配置文件导入数据库信息
+from mysql.connector import Error, InterfaceError, OperationalError
+
+import metrics
+from startup_trace import TRACE
+# 从配置文件导入数据库信息；可用环境变量 LIBRARY_CONFIG 指定其他配置文件（如测试用的 test_config.py）
+_config = importlib.import_module(os.path.splitext(os.environ.get('LIBRARY_CONFIG', 'config.py'))[0])
+DB_CONFIG = _config.DB_CONFIG
+# 慢查询阈值 (毫秒) 和日志文件，可在配置文件中用同名变量覆盖
+SLOW_QUERY_MS = getattr(_config, 'SLOW_QUERY_MS', 200)
+SLOW_QUERY_LOG = getattr(_config, 'SLOW_QUERY_LOG', 'slow_queries.log')
+SLOW_QUERY_LOG_BYTES = 5 * 1024 * 1024 # 单个日志文件的大小上限，超过后滚动
+SLOW_QUERY_LOG_BACKUPS = 3
+
+# --- 数据库后端 ---
+# 'mysql' (默认) 连接 DB_CONFIG 指定的服务器；'sqlite' 使用本地文件 <SQLITE_DIR>/<数据库名>.sqlite3 (见 sqlite_backend)，
+# 无需服务器即可运行程序和测试。由环境变量 LIBRARY_DB_BACKEND 或配置文件中的 DB_BACKEND 选择。
+BACKEND_ENV = 'LIBRARY_DB_BACKEND'
+DB_BACKEND = (os.environ.get(BACKEND_ENV) or getattr(_config, 'DB_BACKEND', 'mysql')).lower()
+SQLITE_DIR = getattr(_config, 'SQLITE_DIR', os.path.dirname(os.path.abspath(__file__)))
+if DB_BACKEND == 'sqlite':
+    import sqlite_backend
+    sqlite_backend.check_sqlite_version()
+elif DB_BACKEND != 'mysql':
+    raise ValueError(f"未知的数据库后端: {DB_BACKEND} (可选 mysql / sqlite)")
+
+# 借还台离线模式的本地副本文件 (见 desk_replica)；未设置时借还台直接读写中心库
+DESK_REPLICA_PATH = os.environ.get('LIBRARY_DESK_REPLICA') or getattr(_config, 'DESK_REPLICA', None)
+
+def sqlite_path(database=None):
+    """SQLite 后端下某个数据库对应的文件路径 (默认为 DB_CONFIG 中的数据库)"""
+    return os.path.join(SQLITE_DIR, f"{database or DB_CONFIG['database']}.sqlite3")
+
+def _connect():
+    if DB_BACKEND == 'sqlite':
+        return sqlite_backend.connect(sqlite_path())
+    return mysql.connector.connect(**DB_CONFIG) # 使用字典解包传递参数
 
 def create_connection():
-    """创建数据库连接"""
+    """创建数据库连接 (测试事务中返回共享连接的保存点视图，见 begin_test_transaction)"""
+    if _test_connection is not None:
+        metrics.DB_CONNECTIONS_OPEN.inc()
+        return _SavepointConnection(_test_connection)
     connection = None
     try:
-        connection = mysql.connector.connect(**DB_CONFIG) # 使用字典解包传递参数
+        start = time.perf_counter()
+        connection = _connect()
         if connection.is_connected():
-            #print("成功连接到MySQL数据库") # 可以取消注释以用于测试
+            TRACE.event('db.first_connection', time.perf_counter() - start)
+            metrics.DB_CONNECTIONS_OPENED.inc()
+            metrics.DB_CONNECTIONS_OPEN.inc()
+            #print("成功连接到数据库") # 可以取消注释以用于测试
             return connection
     except Error as e:
-        print(f"连接MySQL时发生错误:{e}")
+        print(f"连接数据库 ({DB_BACKEND}) 时发生错误:{e}")
         return None
 
 def close_connection(connection):
     """关闭数据库连接"""
+    if connection:
+        metrics.DB_CONNECTIONS_OPEN.dec()
     if connection and connection.is_connected():
         connection.close()
         #print("MySQL连接关闭") # 可以取消注释以用于测试
 
+# --- 测试隔离：所有连接共用一个最终回滚的事务 ---
+# begin_test_transaction() 之后，create_connection 不再新建连接，而是在同一个共享连接上建立保存点并返回其视图：
+# commit 只释放保存点 (数据仍留在外层事务中，之后的查询都能看到)，rollback 回滚到保存点，close 不断开共享连接。
+# rollback_test_transaction() 回滚整个外层事务，测试之间无需 TRUNCATE。只能在单个线程中使用。
+
+_test_connection = None
+_savepoint_ids = itertools.count()
+
+class _SavepointConnection:
+    """共享测试连接上的一次“连接”：第一次取游标时 (以及每次 commit 之后) 建立新的保存点"""
+
+    def __init__(self, connection):
+        object.__setattr__(self, '_connection', connection)
+        object.__setattr__(self, '_savepoint', None)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        if name != 'autocommit': # 共享连接必须停留在外层事务中，忽略 autocommit 设置
+            setattr(self._connection, name, value)
+
+    def _execute(self, statement):
+        cursor = self._connection.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    def cursor(self, *args, **kwargs):
+        if self._savepoint is None:
+            object.__setattr__(self, '_savepoint', f"test_sp_{next(_savepoint_ids)}")
+            self._execute(f"SAVEPOINT {self._savepoint}")
+        return self._connection.cursor(*args, **kwargs)
+
+    def commit(self):
+        savepoint = self._savepoint
+        object.__setattr__(self, '_savepoint', None)
+        if savepoint is not None:
+            try:
+                self._execute(f"RELEASE SAVEPOINT {savepoint}")
+            except Error:
+                pass # 更早的保存点被回滚时，本保存点已随之删除
+
+    def rollback(self):
+        if self._savepoint is not None:
+            try:
+                self._execute(f"ROLLBACK TO SAVEPOINT {self._savepoint}")
+            except Error:
+                pass
+
+    def close(self):
+        if self._connection.unread_result: # 提前结束的流式查询
+            self._connection.consume_results()
+
+def begin_test_transaction():
+    """(测试用) 打开共享连接并开始外层事务；已在测试事务中时什么也不做"""
+    global _test_connection
+    if _test_connection is None:
+        connection = create_connection()
+        if not connection:
+            raise Error(msg="无法连接数据库，测试事务未开始")
+        connection.autocommit = False
+        connection.start_transaction()
+        _test_connection = connection
+
+def rollback_test_transaction():
+    """(测试用) 回滚外层事务并关闭共享连接，丢弃测试期间的全部修改"""
+    global _test_connection
+    connection, _test_connection = _test_connection, None
+    close_thread_connection() # 线程长连接持有的是共享连接的视图，不能留到下一个测试
+    if connection is not None:
+        try:
+            connection.rollback()
+        finally:
+            close_connection(connection)
+
 # --- 更多数据库操作的辅助函数，如执行查询、插入等（可选）  ---
 
-def execute_query(query, params=None):
-    """执行SELECT查询"""
+# --- 查询结果的行格式 ---
+# 'dict'  : 每行一个字典 (默认，兼容旧代码)
+# 'tuple' : 每行一个普通元组，整个结果共享一份列名索引 (TupleRows.index)，内存和分配开销最小
+# 'record': 每行一个按查询形状生成的轻量记录对象，既可 row['BookName'] / row.get('BookName')，
+#           也可 row.BookName 或 row[0]，可直接替换页面里按列名取值的字典
+ROW_FORMATS = ('dict', 'tuple', 'record')
+
+class TupleRows(list):
+    """row_format='tuple' 的查询结果：元组列表，附带共享的列名及列名到下标的索引"""
+    def __init__(self, rows, column_names):
+        super().__init__(rows)
+        self.columns = tuple(column_names)
+        self.index = {name: i for i, name in enumerate(self.columns)}
+
+@functools.lru_cache(maxsize=256)
+def record_class(column_names):
+    """为一种查询结果形状 (列名元组) 生成记录类，相同形状复用同一个类"""
+    index = {name: i for i, name in enumerate(column_names)}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, index[key])
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        position = index.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def __repr__(self):
+        return "Record(" + ", ".join(f"{name}={value!r}" for name, value in zip(column_names, self)) + ")"
+
+    namespace = {
+        '__slots__': (), # 不为每个实例分配 __dict__，实例大小与普通元组相同
+        '_fields': column_names,
+        '__getitem__': __getitem__,
+        'get': get,
+        'keys': lambda self: column_names,
+        '__repr__': __repr__,
+    }
+    for name, position in index.items():
+        if name.isidentifier() and name not in namespace:
+            namespace[name] = property(lambda self, position=position: tuple.__getitem__(self, position))
+    return type('Record', (tuple,), namespace)
+
+def _convert_rows(rows, column_names, row_format):
+    """把非字典游标取回的元组行转换为指定的行格式"""
+    if row_format == 'tuple':
+        return TupleRows(rows, column_names)
+    record = record_class(tuple(column_names))
+    return [record(row) for row in rows]
+
+# --- 语句计时、慢查询日志与聚合统计 ---
+# 经由本模块执行的每条语句都记录连接 (建立与关闭)、执行、取数三段耗时、行数和调用位置 (模块.函数)。
+# 总耗时超过 SLOW_QUERY_MS 的语句以 JSON 行写入滚动日志 (不记录参数，避免密码等敏感信息落盘)；
+# 所有语句按 SQL 文本聚合到 query_stats，界面中的「查询统计」对话框按总耗时排序显示。
+
+CONNECT, EXECUTE, FETCH = 0, 1, 2 # 计时阶段
+QUERY_STATS_MAX_STATEMENTS = 500 # 聚合的不同语句数上限，超出后归入 OTHER_STATEMENTS
+OTHER_STATEMENTS = "(其他语句)"
+
+@functools.lru_cache(maxsize=1024)
+def statement_key(query):
+    """聚合用的语句文本：合并空白，使多行 SQL 显示为一行"""
+    return " ".join(query.split())
+
+def _caller():
+    """调用本模块的第一个外部函数，如 'query_page.perform_search'"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') in (__name__, 'contextlib'):
+        frame = frame.f_back
+    if frame is None:
+        return "?"
+    return f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}"
+
+class QueryStats:
+    """按语句聚合的耗时统计 (线程安全)"""
+
+    def __init__(self, max_statements=QUERY_STATS_MAX_STATEMENTS):
+        self.max_statements = max_statements
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def record(self, timer):
+        key = statement_key(timer.query)
+        total_ms = sum(timer.phases)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                if len(self.entries) >= self.max_statements:
+                    key = OTHER_STATEMENTS
+                    entry = self.entries.get(key)
+                if entry is None:
+                    entry = self.entries[key] = {
+                        'statement': key, 'count': 0, 'errors': 0, 'rows': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                        'connect_ms': 0.0, 'execute_ms': 0.0, 'fetch_ms': 0.0, 'callers': Counter(),
+                    }
+            entry['count'] += 1
+            entry['errors'] += timer.error is not None
+            entry['rows'] += timer.rows
+            entry['total_ms'] += total_ms
+            entry['max_ms'] = max(entry['max_ms'], total_ms)
+            entry['connect_ms'] += timer.phases[CONNECT]
+            entry['execute_ms'] += timer.phases[EXECUTE]
+            entry['fetch_ms'] += timer.phases[FETCH]
+            entry['callers'][timer.caller] += 1
+
+    def top(self, n=20, key='total_ms'):
+        """按 key 降序的前 n 条语句统计 (副本，callers 为 [(调用位置, 次数)] 列表)"""
+        with self.lock:
+            entries = sorted(self.entries.values(), key=lambda entry: entry[key], reverse=True)[:n]
+            return [dict(entry, callers=entry['callers'].most_common()) for entry in entries]
+
+    def reset(self):
+        with self.lock:
+            self.entries.clear()
+
+query_stats = QueryStats()
+
+_slow_log = None
+_slow_log_lock = threading.Lock()
+
+def _get_slow_log():
+    """慢查询日志 (首次写入时才创建文件)"""
+    global _slow_log
+    with _slow_log_lock:
+        if _slow_log is None:
+            _slow_log = logging.getLogger('library.slow_query')
+            _slow_log.propagate = False
+            _slow_log.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(
+                SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS,
+                encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _slow_log.addHandler(handler)
+        return _slow_log
+
+def configure_slow_query_log(threshold_ms=None, path=None):
+    """运行时修改慢查询阈值 (毫秒) 或日志文件路径"""
+    global SLOW_QUERY_MS, SLOW_QUERY_LOG, _slow_log
+    with _slow_log_lock:
+        if threshold_ms is not None:
+            SLOW_QUERY_MS = threshold_ms
+        if path is not None and path != SLOW_QUERY_LOG:
+            SLOW_QUERY_LOG = path
+            if _slow_log is not None:
+                for handler in list(_slow_log.handlers):
+                    _slow_log.removeHandler(handler)
+                    handler.close()
+                _slow_log = None
+
+class _StatementTimer:
+    """一条语句的分段计时：lap(阶段) 把距上次计时的时间计入该阶段"""
+    __slots__ = ('query', 'kind', 'caller', 'last', 'phases', 'rows', 'error')
+
+    def __init__(self, query, kind):
+        self.query = query
+        self.kind = kind # 调用方式，用作指标的标签: query / modify / stream / prepared_query / prepared_modify
+        self.caller = _caller()
+        self.last = time.perf_counter()
+        self.phases = [0.0, 0.0, 0.0]
+        self.rows = 0
+        self.error = None
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] += (now - self.last) * 1000
+        self.last = now
+
+    def restart(self):
+        """不计入任何阶段的等待 (如流式查询中调用方处理上一批行的时间) 之后调用"""
+        self.last = time.perf_counter()
+
+    def finish(self):
+        query_stats.record(self)
+        total_ms = sum(self.phases)
+        metrics.DB_STATEMENT_SECONDS.observe(total_ms / 1000, kind=self.kind)
+        if self.error is not None:
+            metrics.DB_STATEMENT_ERRORS.inc(kind=self.kind)
+        if total_ms >= SLOW_QUERY_MS:
+            _get_slow_log().info(json.dumps({
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'caller': self.caller,
+                'total_ms': round(total_ms, 3), 'connect_ms': round(self.phases[CONNECT], 3),
+                'execute_ms': round(self.phases[EXECUTE], 3), 'fetch_ms': round(self.phases[FETCH], 3),
+                'rows': self.rows, 'error': self.error, 'statement': statement_key(self.query),
+            }, ensure_ascii=False))
+
+def execute_query(query, params=None, row_format='dict'):
+    """执行SELECT查询，row_format 取值见 ROW_FORMATS"""
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"未知的行格式: {row_format}")
+    timer = _StatementTimer(query, 'query')
     connection = create_connection()
+    timer.lap(CONNECT)
     cursor = None
     result = None
     if connection:
         try:
-            cursor = connection.cursor(dictionary=True) # 让结果以字典形式返回
+            cursor = connection.cursor(dictionary=(row_format == 'dict')) # 默认让结果以字典形式返回
             if params:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
+            timer.lap(EXECUTE)
             result = cursor.fetchall()
+            if row_format != 'dict':
+                result = _convert_rows(result, cursor.column_names, row_format)
+            timer.lap(FETCH)
+            timer.rows = len(result)
             return result
         except Error as e:
+            timer.lap(EXECUTE) # 出错前的耗时计入执行阶段
+            timer.error = str(e)
             print(f"执行查询时出错:{e}")
             return None
         finally:
+            timer.restart()
             if cursor:
                 cursor.close()
             close_connection(connection)
+            timer.lap(CONNECT)
+            timer.finish()
+    timer.error = "无法连接数据库"
+    timer.finish()
     return None
 
 def execute_modify(query, params=None):
     """执行INSERT,UPDATE,DELETE等修改操作"""
+    timer = _StatementTimer(query, 'modify')
     connection = create_connection()
+    timer.lap(CONNECT)
     cursor = None
     if connection:
         try:
@@ -59,18 +396,222 @@ def execute_modify(query, params=None):
             else:
                 cursor.execute(query)
             connection.commit() # 提交事务
+            timer.lap(EXECUTE)
+            timer.rows = max(cursor.rowcount, 0)
             #print("修改操作执行成功") # 可以取消注释用于测试
             return cursor.lastrowid # 对于INSERT，可以返回最后插入行的ID
         except Error as e:
+            timer.lap(EXECUTE) # 出错前的耗时计入执行阶段
+            timer.error = str(e)
             print(f"执行修改操作时出错：{e}")
             connection.rollback() # 出错时回滚
             return None
         finally:
+            timer.restart()
             if cursor:
                 cursor.close()
             close_connection(connection)
+            timer.lap(CONNECT)
+            timer.finish()
+    timer.error = "无法连接数据库"
+    timer.finish()
     return None
 
+# --- 事务 / 批量写入 ---
+# execute_modify 每条语句都新建连接并单独提交；批量导入时改用 transaction()，
+# 在同一连接、同一事务中完成查询与 executemany 写入，结束时一次提交。
+
+@contextlib.contextmanager
+def transaction(dictionary=False):
+    """在一个事务中执行多条语句：with transaction() as cursor: ...
+
+    代码块正常结束时提交，抛出异常时回滚并继续向外抛出（包括 mysql.connector.Error）。
+    """
+    connection = create_connection()
+    if not connection:
+        raise Error(msg="无法连接数据库，事务未执行")
+    cursor = connection.cursor(dictionary=dictionary)
+    try:
+        yield cursor
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+        close_connection(connection)
+
+# --- 流式查询（非缓冲游标）---
+# execute_query 会把整个结果集 fetchall 到内存；导出、报表这类可能很大的读取改用 iter_query，
+# 服务器按需发送行，客户端每次只保留 batch_size 行。
+
+STREAM_BATCH_SIZE = 500 # 默认每批从服务器读取的行数
+
+def iter_query(query, params=None, batch_size=STREAM_BATCH_SIZE, row_format='dict'):
+    """流式执行 SELECT 查询，逐行产出字典 (或 row_format 指定的行格式，'tuple' 时为普通元组)。
+
+    使用独占连接上的非缓冲游标按批 fetchmany，内存占用与结果集大小无关。
+    与 execute_query 不同，出错时会抛出 mysql.connector.Error（调用方可能已经处理了部分行）。
+    """
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"未知的行格式: {row_format}")
+    timer = _StatementTimer(query, 'stream')
+    connection = create_connection()
+    timer.lap(CONNECT)
+    if not connection:
+        timer.error = "无法连接数据库"
+        timer.finish()
+        raise Error(msg="无法连接数据库，流式查询未执行")
+    try:
+        cursor = connection.cursor(dictionary=(row_format == 'dict'), buffered=False)
+        cursor.execute(query, params or ())
+        timer.lap(EXECUTE)
+        record = record_class(tuple(cursor.column_names)) if row_format == 'record' else None
+        while True:
+            timer.restart() # 调用方处理上一批行的时间不计入
+            rows = cursor.fetchmany(batch_size)
+            if record is not None and rows:
+                rows = [record(row) for row in rows]
+            timer.lap(FETCH)
+            if not rows:
+                break
+            timer.rows += len(rows)
+            yield from rows
+    except Error as e:
+        timer.error = str(e)
+        print(f"流式查询时出错: {e}")
+        raise
+    finally:
+        # 调用方提前结束迭代时结果集尚未读完，cursor.close()/is_connected() 会因
+        # "Unread result found" 失败，这里直接断开连接，服务器会丢弃剩余的行
+        timer.restart()
+        metrics.DB_CONNECTIONS_OPEN.dec()
+        try:
+            connection.close()
+        except Error:
+            pass
+        timer.lap(CONNECT)
+        timer.finish()
+
+# --- 预处理语句（服务器端 prepared statement）---
+# 预处理语句只在创建它的连接上有效，所以每个线程持有一条长连接，
+# 并在该连接上按 SQL 文本缓存已 prepare 的游标。借还书这类高频语句
+# 第二次执行起只需发送参数，服务器不再重新解析 SQL。
+
+PREPARED_CACHE_SIZE = 64 # 每个连接最多缓存的预处理语句数 (超出后按 LRU 关闭)
+IDLE_PING_SECONDS = 60 # 长连接空闲超过该秒数后，使用前先 ping 一次检查是否已被服务器断开
+
+_thread_state = threading.local()
+
+def _get_thread_connection():
+    """获取当前线程的长连接及其预处理语句缓存"""
+    connection = getattr(_thread_state, 'connection', None)
+    if connection is not None and time.monotonic() - _thread_state.last_used > IDLE_PING_SECONDS:
+        try:
+            connection.ping(reconnect=False)
+        except Error:
+            # 服务器已断开 (如 wait_timeout)，旧连接上的预处理语句也随之失效
+            close_thread_connection()
+            connection = None
+    if connection is None:
+        connection = create_connection()
+        if not connection:
+            return None, None
+        connection.autocommit = True # 长连接不能停留在旧事务快照中，否则会读到过期数据
+        _thread_state.connection = connection
+        _thread_state.statements = OrderedDict()
+        metrics.DB_THREAD_CONNECTIONS.inc()
+    _thread_state.last_used = time.monotonic()
+    return connection, _thread_state.statements
+
+def close_thread_connection():
+    """关闭当前线程的长连接，并释放其上缓存的全部预处理语句"""
+    connection = getattr(_thread_state, 'connection', None)
+    statements = getattr(_thread_state, 'statements', None) or {}
+    for _, cursor in statements.values():
+        try:
+            cursor.close()
+        except Error:
+            pass
+    _thread_state.connection = None
+    _thread_state.statements = None
+    if connection is not None:
+        metrics.DB_THREAD_CONNECTIONS.dec()
+    close_connection(connection)
+
+def _get_prepared_cursor(query, dictionary):
+    """返回 (SQL, 游标)：同一线程内相同 SQL 复用同一个已 prepare 的游标"""
+    connection, statements = _get_thread_connection()
+    if connection is None:
+        return None, None
+    key = (query, dictionary)
+    entry = statements.get(key)
+    metrics.record_cache_lookup('prepared_statement', entry is not None)
+    if entry is None:
+        # 游标首次 execute 时才向服务器发送 PREPARE；之后只要传入同一个 SQL 对象就直接执行
+        entry = (query, connection.cursor(prepared=True, dictionary=dictionary))
+        statements[key] = entry
+        if len(statements) > PREPARED_CACHE_SIZE:
+            _, (_, evicted) = statements.popitem(last=False)
+            evicted.close() # 同时在服务器端 DEALLOCATE 该语句
+    else:
+        statements.move_to_end(key)
+    return entry
+
+def execute_prepared_query(query, params=None):
+    """使用预处理语句执行 SELECT 查询，返回字典列表（与 execute_query 相同）"""
+    timer = _StatementTimer(query, 'prepared_query')
+    sql, cursor = _get_prepared_cursor(query, True)
+    timer.lap(CONNECT) # 复用长连接时接近 0，只有首次或重连时才有连接耗时
+    if cursor is None:
+        timer.error = "无法连接数据库"
+        timer.finish()
+        return None
+    try:
+        cursor.execute(sql, params or ())
+        timer.lap(EXECUTE)
+        rows = cursor.fetchall()
+        timer.lap(FETCH)
+        timer.rows = len(rows)
+        return rows
+    except (InterfaceError, OperationalError) as e:
+        timer.error = str(e)
+        print(f"执行预处理查询时连接出错: {e}")
+        close_thread_connection() # 丢弃已损坏的连接，下次调用时重建
+        return None
+    except Error as e:
+        timer.error = str(e)
+        print(f"执行预处理查询时出错: {e}")
+        return None
+    finally:
+        timer.finish()
+
+def execute_prepared_modify(query, params=None):
+    """使用预处理语句执行 INSERT/UPDATE/DELETE（长连接为 autocommit），返回 lastrowid"""
+    timer = _StatementTimer(query, 'prepared_modify')
+    sql, cursor = _get_prepared_cursor(query, False)
+    timer.lap(CONNECT)
+    if cursor is None:
+        timer.error = "无法连接数据库"
+        timer.finish()
+        return None
+    try:
+        cursor.execute(sql, params or ())
+        timer.lap(EXECUTE)
+        timer.rows = max(cursor.rowcount, 0)
+        return cursor.lastrowid
+    except (InterfaceError, OperationalError) as e:
+        timer.error = str(e)
+        print(f"执行预处理修改操作时连接出错: {e}")
+        close_thread_connection()
+        return None
+    except Error as e:
+        timer.error = str(e)
+        print(f"执行预处理修改操作时出错: {e}")
+        return None
+    finally:
+        timer.finish()
+
 # 测试连接（可以直接运行这个文件进行测试）
 if __name__ == "__main__":
     conn = create_connection()
@@ -2,9 +2,13 @@
 import mysql.connector
 from mysql.connector import Error
 import os
+import shutil
 import importlib.util
 import sys
 
+import db_utils
+from sqlite_backend import load_schema_statements # 两种后端共用同一份 schema.sql 拆分逻辑
+
 def get_config_module_path():
     """根据环境变量决定加载哪个配置文件"""
     config_filename = os.environ.get('LIBRARY_CONFIG', 'config.py') # 默认为 config.py
@@ -35,6 +39,8 @@ else:
 def create_connection():
     """ 创建数据库连接 """
     # ... (连接逻辑不变, 使用 DB_CONFIG) ...
+    if db_utils._test_connection is not None or db_utils.DB_BACKEND != 'mysql': # 测试事务中与 db_utils 共用同一个连接
+        return db_utils.create_connection()
     connection = None
     if not DB_CONFIG:
         print("数据库配置未加载，无法创建连接。")
@@ -106,76 +112,100 @@ def execute_modify(query, params=None):
             close_connection(connection)
     return None # Return None if connection failed
 
-def setup_test_database():
-    """ (仅用于测试) 创建测试数据库表结构 """
-    connection = mysql.connector.connect(
-        host=DB_CONFIG['host'],
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password']
-    )
-    cursor = connection.cursor()
-    try:
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;")
-        cursor.execute(f"USE {DB_CONFIG['database']};")
-        print(f"正在设置测试数据库 '{DB_CONFIG['database']}'...")
+TEMPLATE_SUFFIX = '_template' # 并行测试时先建一个模板库，再为每个进程复制一份
+TABLES = ['BookDetails', 'LibraryRecords', 'Books', 'LibraryCard', 'Users']
 
-        # 删除已存在的表 (确保每次测试都是干净的)
-        cursor.execute("SET FOREIGN_KEY_CHECKS = 0;")
-        tables = ['LibraryRecords', 'Books', 'LibraryCard', 'Users']
-        for table in tables:
-            cursor.execute(f"DROP TABLE IF EXISTS {table};")
-            print(f" - 已删除表 (如果存在): {table}")
-        cursor.execute("SET FOREIGN_KEY_CHECKS = 1;")
+def _server_connection():
+    """ 不指定数据库的连接，用于建库 """
+    return mysql.connector.connect(host=DB_CONFIG['host'], user=DB_CONFIG['user'], password=DB_CONFIG['password'])
+
+def _reset_database(cursor, database):
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}` CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;")
+    cursor.execute(f"USE `{database}`;")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0;")
+    for table in TABLES:
+        cursor.execute(f"DROP TABLE IF EXISTS {table};")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1;")
 
-        # 创建表结构 (与主程序一致)
-        sql_commands = """
-            CREATE TABLE Books (
-                BookNo VARCHAR(50) PRIMARY KEY, BookType VARCHAR(50), BookName VARCHAR(100) NOT NULL,
-                Publisher VARCHAR(100), Year INT, Author VARCHAR(100), Price DECIMAL(10, 2),
-                Total INT DEFAULT 0, Storage INT DEFAULT 0,
-                UpdateTime DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            );
-            CREATE TABLE LibraryCard (
-                CardNo VARCHAR(50) PRIMARY KEY, Name VARCHAR(50) NOT NULL, Department VARCHAR(50),
-                CardType VARCHAR(50), UpdateTime DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            );
-            CREATE TABLE Users (
-                UserID VARCHAR(50) PRIMARY KEY, Password VARCHAR(255) NOT NULL, Name VARCHAR(50),
-                Contact VARCHAR(50), UpdateTime DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-            );
-            CREATE TABLE LibraryRecords (
-                FID INT AUTO_INCREMENT PRIMARY KEY, CardNo VARCHAR(50) NOT NULL, BookNo VARCHAR(50) NOT NULL,
-                LentDate DATETIME DEFAULT CURRENT_TIMESTAMP, ReturnDate DATETIME NULL, Operator VARCHAR(50),
-                FOREIGN KEY (CardNo) REFERENCES LibraryCard(CardNo) ON DELETE CASCADE ON UPDATE CASCADE,
-                FOREIGN KEY (BookNo) REFERENCES Books(BookNo) ON DELETE CASCADE ON UPDATE CASCADE,
-                FOREIGN KEY (Operator) REFERENCES Users(UserID) ON DELETE SET NULL ON UPDATE CASCADE
-            );
-        """
-        for command in sql_commands.split(';'):
-             if command.strip():
-                 cursor.execute(command.strip() + ';')
-                 print(f" - 已执行: {command.strip()[:50]}...") # 打印部分命令
+def _remove_sqlite_database(database):
+    """ 删除 SQLite 后端的数据库文件 (连同 WAL 日志) """
+    path = db_utils.sqlite_path(database)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db_utils.sqlite_backend.forget(path)
 
+def setup_test_database(database=None):
+    """ (仅用于测试) 按 schema.sql 重建测试数据库的表结构 """
+    database = database or DB_CONFIG['database']
+    if db_utils.DB_BACKEND == 'sqlite': # 删除旧文件，第一次连接时按 schema.sql 建表
+        print(f"正在设置测试数据库 '{database}' (SQLite)...")
+        _remove_sqlite_database(database)
+        db_utils.sqlite_backend.connect(db_utils.sqlite_path(database)).close()
+        print("测试数据库表结构设置完成。")
+        return
+    connection = _server_connection()
+    cursor = connection.cursor()
+    try:
+        print(f"正在设置测试数据库 '{database}'...")
+        _reset_database(cursor, database)
+        for statement in load_schema_statements():
+            cursor.execute(statement)
         connection.commit()
         print("测试数据库表结构设置完成。")
-
     except Error as e:
         print(f"设置测试数据库时出错: {e}")
     finally:
         cursor.close()
         connection.close()
 
+def worker_database_name(worker):
+    return f"{DB_CONFIG['database']}_w{worker}"
+
+def setup_worker_databases(workers):
+    """ (仅用于测试) 按 schema.sql 建一次模板库，再按模板的表定义为每个并行测试进程复制一个库，返回库名列表 """
+    template = DB_CONFIG['database'] + TEMPLATE_SUFFIX
+    setup_test_database(template)
+    if db_utils.DB_BACKEND == 'sqlite': # 直接复制模板文件
+        databases = [worker_database_name(worker) for worker in range(workers)]
+        for database in databases:
+            _remove_sqlite_database(database)
+            shutil.copyfile(db_utils.sqlite_path(template), db_utils.sqlite_path(database))
+        return databases
+    connection = _server_connection()
+    cursor = connection.cursor()
+    try:
+        definitions = []
+        for table in TABLES:
+            cursor.execute(f"SHOW CREATE TABLE `{template}`.{table};")
+            definitions.append(cursor.fetchone()[1])
+        databases = [worker_database_name(worker) for worker in range(workers)]
+        for database in databases:
+            _reset_database(cursor, database)
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0;") # 表之间有外键，按任意顺序建表
+            for definition in definitions:
+                cursor.execute(definition)
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1;")
+        connection.commit()
+        return databases
+    finally:
+        cursor.close()
+        connection.close()
+
 # (可选) 添加一个清理函数
 def cleanup_test_database():
     """ (仅用于测试) 删除测试数据库中的所有表 """
+    if db_utils.DB_BACKEND == 'sqlite':
+        _remove_sqlite_database(DB_CONFIG['database'])
+        print("测试数据库清理完成。")
+        return
     connection = create_connection()
     if not connection: return
     cursor = connection.cursor()
     try:
         print(f"正在清理测试数据库 '{DB_CONFIG['database']}'...")
         cursor.execute("SET FOREIGN_KEY_CHECKS = 0;")
-        tables = ['LibraryRecords', 'Books', 'LibraryCard', 'Users']
-        for table in tables:
+        for table in TABLES:
             cursor.execute(f"DROP TABLE IF EXISTS {table};")
             print(f" - 已删除表: {table}")
         cursor.execute("SET FOREIGN_KEY_CHECKS = 1;")
@@ -0,0 +1,443 @@
+# desk_replica.py
+# 借还台离线模式：中心库 (MySQL) 变慢或断开时借还照常进行。
+# - 本地副本：图书 (书名、作者、库存)、借书证和未还借阅记录保存在本地 SQLite 文件中，借还台的查询和借还都只访问本地文件。
+# - 待同步队列 (outbox)：每次借还在同一个本地事务中修改副本并记入队列；后台同步线程按发生顺序写入中心库，
+#   借书时在中心库再次检查库存 (Storage > 0)，库存不足、记录已被别处归还等情况记为冲突，留给管理员处理
+#   (discard 撤销本地操作 / retry 重新同步)，不会静默覆盖中心库的数据。
+# - 中心库恢复后先同步队列，再按 UpdateTime 增量拉取变化的图书和借书证，并整体替换未还记录。
+# 启用: 配置文件中设置 DESK_REPLICA = 'desk_replica.sqlite' 或设置环境变量 LIBRARY_DESK_REPLICA=<文件路径>。
+import time
+import sqlite3
+import datetime
+import threading
+
+from mysql.connector import Error, IntegrityError, DataError, ProgrammingError
+
+import metrics
+import db_utils
+from db_utils import transaction, iter_query
+
+SYNC_INTERVAL = 5 # 秒，后台同步线程的轮询间隔 (借还之后立即唤醒)
+REFRESH_INTERVAL = 60 # 秒，增量拉取中心库变化的间隔
+FULL_REFRESH_INTERVAL = 3600 # 秒，全量拉取的间隔 (清除中心库中已删除的图书和借书证)
+STOP_TIMEOUT = 2 # 秒，关闭时最多等待同步线程这么久 (中心库无响应时不能卡住界面)
+REFRESH_BATCH = 1000 # 每个本地事务写入的行数，界面线程的借还最多等待一批
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# 数据本身的问题，重试也不会成功，记为冲突；其余错误视为中心库不可用，操作留在队列中稍后重试
+CONFLICT_ERRORS = (IntegrityError, DataError, ProgrammingError)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    BookNo     TEXT PRIMARY KEY,
+    BookName   TEXT,
+    Author     TEXT,
+    BookType   TEXT,
+    Year       INTEGER,
+    Total      INTEGER,
+    Storage    INTEGER,
+    Generation INTEGER NOT NULL DEFAULT 0  -- 最近一次拉取到该行的全量拉取批次
+);
+CREATE TABLE IF NOT EXISTS cards (
+    CardNo     TEXT PRIMARY KEY,
+    Name       TEXT,
+    Department TEXT,
+    CardType   TEXT,
+    Generation INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS loans (
+    LoanID   INTEGER PRIMARY KEY AUTOINCREMENT,
+    FID      INTEGER,                -- 中心库 LibraryRecords.FID，借书尚未同步时为 NULL
+    CardNo   TEXT NOT NULL,
+    BookNo   TEXT NOT NULL,
+    LentDate TEXT NOT NULL,
+    Operator TEXT,
+    OpID     INTEGER                 -- 在本借还台借出时对应的借书操作
+);
+CREATE INDEX IF NOT EXISTS loans_card ON loans (CardNo);
+CREATE TABLE IF NOT EXISTS outbox (
+    OpID       INTEGER PRIMARY KEY AUTOINCREMENT,
+    Operation  TEXT NOT NULL,        -- borrow / return
+    CardNo     TEXT NOT NULL,
+    BookNo     TEXT NOT NULL,
+    FID        INTEGER,              -- 还书: 归还的记录；借书: 同步后中心库分配的记录
+    BorrowOpID INTEGER,              -- 归还的是尚未同步的借书时，对应的借书操作
+    Operator   TEXT,                 -- 借书的经手人 (LibraryRecords.Operator)
+    OccurredAt TEXT NOT NULL,        -- 借还台上实际发生的时间，同步时作为 LentDate / ReturnDate
+    Status     TEXT NOT NULL DEFAULT 'pending', -- pending / synced / conflict / discarded
+    Attempts   INTEGER NOT NULL DEFAULT 0,
+    Error      TEXT,
+    SyncedAt   TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_status ON outbox (Status, OpID);
+CREATE TABLE IF NOT EXISTS meta (
+    Key   TEXT PRIMARY KEY,
+    Value TEXT
+);
+"""
+
+BOOKS_QUERY = "SELECT BookNo, BookName, Author, BookType, Year, Total, Storage, UpdateTime FROM Books"
+CARDS_QUERY = "SELECT CardNo, Name, Department, CardType, UpdateTime FROM LibraryCard"
+OPEN_LOANS_QUERY = "SELECT FID, CardNo, BookNo, LentDate, Operator FROM LibraryRecords WHERE ReturnDate IS NULL"
+# 有待同步操作的图书，本地库存已包含这些操作，拉取时不覆盖
+PENDING_BOOKS = "SELECT BookNo FROM outbox WHERE Status = 'pending'"
+
+
+def _now():
+    return datetime.datetime.now().strftime(DATETIME_FORMAT)
+
+def _text(value):
+    return value.strftime(DATETIME_FORMAT) if isinstance(value, datetime.datetime) else value
+
+
+class DeskReplica:
+    """借还台的本地副本和待同步队列。
+
+    借还和查询方法在界面线程中调用，只访问本地文件；sync / refresh 访问中心库，
+    由后台同步线程 (start) 依次调用，也可在测试中直接调用 run_once。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock() # 本地连接在界面线程和同步线程之间共用
+        self.sync_lock = threading.Lock() # 同步和拉取不能同时进行
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.online = None # 最近一次访问中心库是否成功，None 表示尚未访问
+        self.last_refresh = None # 最近一次成功拉取的 time.monotonic()
+        self.last_full_refresh = None
+        self.wake = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        metrics.DESK_OUTBOX_PENDING.set(self.pending_count())
+
+    # --- 本地查询 (界面线程) ---
+
+    def find_card(self, card_no):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT CardNo, Name, Department, CardType FROM cards WHERE CardNo = ?", (card_no,)).fetchone()
+        return dict(row) if row else None
+
+    def find_book(self, book_no):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT BookNo, BookName, Author, BookType, Total, Storage FROM books WHERE BookNo = ?", (book_no,)).fetchone()
+        return dict(row) if row else None
+
+    def open_loans(self, card_no, newest_first=False):
+        """卡号当前未还的借阅 (含尚未同步的借书)，字段与借还页面原来的查询相同，另有 LoanID 和 SyncStatus"""
+        with self.lock:
+            rows = self.conn.execute(f"""
+                SELECT l.LoanID, l.FID, l.BookNo, b.BookName, b.Author, l.LentDate,
+                       CASE WHEN l.FID IS NOT NULL THEN 'synced' ELSE o.Status END AS SyncStatus
+                FROM loans l
+                LEFT JOIN books b ON b.BookNo = l.BookNo
+                LEFT JOIN outbox o ON o.OpID = l.OpID
+                WHERE l.CardNo = ?
+                ORDER BY l.LentDate {'DESC' if newest_first else 'ASC'}, l.LoanID
+            """, (card_no,)).fetchall()
+        loans = [dict(row) for row in rows]
+        for loan in loans:
+            loan['LentDate'] = datetime.datetime.strptime(loan['LentDate'], DATETIME_FORMAT)
+        return loans
+
+    # --- 借还 (界面线程)：修改副本并记入队列，返回错误提示，成功时为 None ---
+
+    def borrow(self, card_no, book_no, operator):
+        """借书，返回 (书名, 错误提示)"""
+        with self.lock, self.conn:
+            book = self.conn.execute("SELECT BookName, Storage FROM books WHERE BookNo = ?", (book_no,)).fetchone()
+            if book is None:
+                return None, f"未找到书号为 '{book_no}' 的图书！"
+            book_name = book['BookName'] or '未知书名'
+            if (book['Storage'] or 0) <= 0:
+                return book_name, f"图书 '{book_name}' (ID: {book_no}) 当前库存为 0，无法借阅！"
+            if self.conn.execute("SELECT 1 FROM loans WHERE CardNo = ? AND BookNo = ?", (card_no, book_no)).fetchone():
+                return book_name, f"您已借阅图书 '{book_name}' (ID: {book_no}) 且尚未归还！"
+            occurred_at = _now()
+            op_id = self.conn.execute(
+                "INSERT INTO outbox (Operation, CardNo, BookNo, Operator, OccurredAt) VALUES ('borrow', ?, ?, ?, ?)",
+                (card_no, book_no, operator, occurred_at)).lastrowid
+            self.conn.execute("UPDATE books SET Storage = Storage - 1 WHERE BookNo = ?", (book_no,))
+            self.conn.execute("INSERT INTO loans (CardNo, BookNo, LentDate, Operator, OpID) VALUES (?, ?, ?, ?, ?)",
+                              (card_no, book_no, occurred_at, operator, op_id))
+        self._queued()
+        return book_name, None
+
+    def return_book(self, loan_id):
+        """归还 open_loans 返回的一条借阅 (按 LoanID)，返回错误提示"""
+        with self.lock, self.conn:
+            loan = self.conn.execute("SELECT FID, CardNo, BookNo, OpID FROM loans WHERE LoanID = ?", (loan_id,)).fetchone()
+            if loan is None:
+                return "该借阅记录不存在或已归还。"
+            self.conn.execute(
+                "INSERT INTO outbox (Operation, CardNo, BookNo, FID, BorrowOpID, OccurredAt) VALUES ('return', ?, ?, ?, ?, ?)",
+                (loan['CardNo'], loan['BookNo'], loan['FID'], loan['OpID'] if loan['FID'] is None else None, _now()))
+            self.conn.execute("DELETE FROM loans WHERE LoanID = ?", (loan_id,))
+            self.conn.execute("UPDATE books SET Storage = Storage + 1 WHERE BookNo = ?", (loan['BookNo'],))
+        self._queued()
+        return None
+
+    def _queued(self):
+        metrics.DESK_OUTBOX_PENDING.set(self.pending_count())
+        self.wake.set() # 立即唤醒同步线程
+
+    # --- 队列状态与冲突处理 ---
+
+    def pending_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox WHERE Status = 'pending'").fetchone()[0]
+
+    def conflicts(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM outbox WHERE Status = 'conflict' ORDER BY OpID").fetchall()
+        return [dict(row) for row in rows]
+
+    def retry(self, op_id):
+        """中心库的数据修正后 (如补上了库存)，把冲突的操作重新放回队列"""
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE outbox SET Status = 'pending', Error = NULL WHERE OpID = ? AND Status = 'conflict'", (op_id,))
+        self._queued()
+
+    def discard(self, op_id):
+        """放弃一个冲突的操作并撤销它在副本中的修改；放弃借书时，依赖它的还书一并放弃"""
+        with self.lock, self.conn:
+            op = self.conn.execute("SELECT * FROM outbox WHERE OpID = ? AND Status = 'conflict'", (op_id,)).fetchone()
+            if op is None:
+                return
+            self.conn.execute("UPDATE outbox SET Status = 'discarded' WHERE OpID = ?", (op_id,))
+            if op['Operation'] == 'borrow':
+                if self.conn.execute("DELETE FROM loans WHERE OpID = ?", (op_id,)).rowcount:
+                    self.conn.execute("UPDATE books SET Storage = Storage + 1 WHERE BookNo = ?", (op['BookNo'],))
+                self.conn.execute("UPDATE outbox SET Status = 'discarded' WHERE BorrowOpID = ? AND Status IN ('pending', 'conflict')", (op_id,))
+            self.conn.execute("DELETE FROM meta WHERE Key = 'watermark'") # 下次全量拉取，以中心库的库存为准
+        metrics.DESK_OUTBOX_PENDING.set(self.pending_count())
+
+    # --- 与中心库同步 (同步线程) ---
+
+    def _set_online(self, online):
+        self.online = online
+        metrics.DESK_ONLINE.set(1 if online else 0)
+
+    def sync(self):
+        """按发生顺序把待同步的操作写入中心库，返回本次同步成功的操作数；中心库不可用时停止，留待下次重试"""
+        synced = 0
+        while not self.stop_event.is_set():
+            with self.lock:
+                row = self.conn.execute("SELECT * FROM outbox WHERE Status = 'pending' ORDER BY OpID LIMIT 1").fetchone()
+                op = dict(row) if row else None
+                if op and op['Operation'] == 'return' and op['FID'] is None:
+                    borrow = self.conn.execute("SELECT Status, FID FROM outbox WHERE OpID = ?", (op['BorrowOpID'],)).fetchone()
+                    op['FID'] = borrow['FID'] if borrow and borrow['Status'] == 'synced' else None
+            if op is None:
+                break
+            try:
+                if op['Operation'] == 'return' and op['FID'] is None:
+                    fid, error = None, "对应的借书操作未能同步"
+                else:
+                    fid, error = self._apply(op)
+            except CONFLICT_ERRORS as e:
+                fid, error = None, str(e)
+            except Error as e:
+                print(f"借还台同步失败，{self.pending_count()} 个操作等待中心库恢复: {e}")
+                self._set_online(False)
+                with self.lock, self.conn:
+                    self.conn.execute("UPDATE outbox SET Attempts = Attempts + 1, Error = ? WHERE OpID = ?", (str(e), op['OpID']))
+                break
+            self._set_online(True)
+            with self.lock, self.conn:
+                if error is None:
+                    self.conn.execute("UPDATE outbox SET Status = 'synced', FID = ?, Error = NULL, SyncedAt = ? WHERE OpID = ?",
+                                      (fid, _now(), op['OpID']))
+                    if op['Operation'] == 'borrow':
+                        self.conn.execute("UPDATE loans SET FID = ? WHERE OpID = ?", (fid, op['OpID']))
+                    synced += 1
+                else:
+                    self.conn.execute("UPDATE outbox SET Status = 'conflict', Attempts = Attempts + 1, Error = ? WHERE OpID = ?",
+                                      (error, op['OpID']))
+            if error is not None:
+                print(f"借还台同步冲突 (操作 {op['OpID']}，{op['Operation']} {op['CardNo']}/{op['BookNo']}): {error}")
+                metrics.DESK_SYNC_CONFLICTS.inc(operation=op['Operation'])
+        metrics.DESK_OUTBOX_PENDING.set(self.pending_count())
+        return synced
+
+    def _apply(self, op):
+        """在中心库的一个事务中执行一个操作，返回 (FID, 冲突说明)；已执行过的操作 (重试) 直接返回原来的 FID"""
+        occurred_at = op['OccurredAt']
+        with transaction() as cursor:
+            if op['Operation'] == 'borrow':
+                # 上次提交后没来得及标记为已同步时，按卡号、书号和借出时间识别已写入的记录
+                cursor.execute("SELECT FID FROM LibraryRecords WHERE CardNo = %s AND BookNo = %s AND LentDate = %s",
+                               (op['CardNo'], op['BookNo'], occurred_at))
+                existing = cursor.fetchall()
+                if existing:
+                    return existing[0][0], None
+                cursor.execute("UPDATE Books SET Storage = Storage - 1 WHERE BookNo = %s AND Storage > 0", (op['BookNo'],))
+                if cursor.rowcount != 1:
+                    return None, "中心库中该书已无库存 (可能已在其他借还台借出)"
+                cursor.execute("INSERT INTO LibraryRecords (CardNo, BookNo, LentDate, Operator) VALUES (%s, %s, %s, %s)",
+                               (op['CardNo'], op['BookNo'], occurred_at, op['Operator']))
+                return cursor.lastrowid, None
+            cursor.execute("UPDATE LibraryRecords SET ReturnDate = %s WHERE FID = %s AND ReturnDate IS NULL",
+                           (occurred_at, op['FID']))
+            if cursor.rowcount == 1:
+                cursor.execute("UPDATE Books SET Storage = Storage + 1 WHERE BookNo = %s", (op['BookNo'],))
+                return op['FID'], None
+            cursor.execute("SELECT ReturnDate FROM LibraryRecords WHERE FID = %s", (op['FID'],))
+            record = cursor.fetchall()
+            if not record:
+                return None, "中心库中已没有该借阅记录"
+            if _text(record[0][0]) == occurred_at:
+                return op['FID'], None
+            return None, f"该书已于 {_text(record[0][0])} 在其他地方归还"
+
+    def refresh(self, full=False):
+        """从中心库拉取图书、借书证 (按 UpdateTime 增量，必要时全量) 和全部未还记录，返回是否成功"""
+        with self.lock:
+            meta = dict(self.conn.execute("SELECT Key, Value FROM meta").fetchall())
+        watermark = None if full else meta.get('watermark')
+        generation = int(meta.get('generation', 0)) + (1 if watermark is None else 0)
+        try:
+            latest = [
+                self._pull(BOOKS_QUERY, watermark, generation, """
+                    INSERT INTO books (BookNo, BookName, Author, BookType, Year, Total, Storage, Generation)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (BookNo) DO UPDATE SET BookName = excluded.BookName, Author = excluded.Author,
+                        BookType = excluded.BookType, Year = excluded.Year, Total = excluded.Total,
+                        Storage = excluded.Storage, Generation = excluded.Generation
+                    WHERE books.BookNo NOT IN (""" + PENDING_BOOKS + ")"),
+                self._pull(CARDS_QUERY, watermark, generation, """
+                    INSERT INTO cards (CardNo, Name, Department, CardType, Generation) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (CardNo) DO UPDATE SET Name = excluded.Name, Department = excluded.Department,
+                        CardType = excluded.CardType, Generation = excluded.Generation"""),
+            ]
+            open_loans = [(fid, card_no, book_no, _text(lent_date), operator)
+                          for fid, card_no, book_no, lent_date, operator in iter_query(OPEN_LOANS_QUERY, row_format='tuple')]
+        except Error as e:
+            print(f"借还台拉取中心库数据失败，继续使用本地副本: {e}")
+            self._set_online(False)
+            return False
+        self._set_online(True)
+        with self.lock, self.conn:
+            if watermark is None: # 全量拉取：删除中心库中已不存在的行
+                self.conn.execute(f"DELETE FROM books WHERE Generation < ? AND BookNo NOT IN ({PENDING_BOOKS})", (generation,))
+                self.conn.execute("DELETE FROM cards WHERE Generation < ?", (generation,))
+            # 未还记录整体替换；本地已还但尚未同步的记录、本地借出尚未拿到 FID 的记录以本地为准
+            returning = {row[0] for row in self.conn.execute("""
+                SELECT COALESCE(r.FID, b.FID) FROM outbox r LEFT JOIN outbox b ON b.OpID = r.BorrowOpID
+                WHERE r.Operation = 'return' AND r.Status IN ('pending', 'conflict')""")}
+            unsynced = {tuple(row) for row in self.conn.execute("SELECT CardNo, BookNo FROM loans WHERE FID IS NULL")}
+            self.conn.execute("DELETE FROM loans WHERE FID IS NOT NULL")
+            self.conn.executemany(
+                "INSERT INTO loans (FID, CardNo, BookNo, LentDate, Operator) VALUES (?, ?, ?, ?, ?)",
+                [loan for loan in open_loans if loan[0] not in returning and (loan[1], loan[2]) not in unsynced])
+            new_watermark = max([value for value in latest + [watermark] if value], default=None)
+            self.conn.executemany("INSERT OR REPLACE INTO meta (Key, Value) VALUES (?, ?)",
+                                  [('watermark', new_watermark), ('generation', str(generation)), ('refreshed_at', _now())])
+        self.last_refresh = time.monotonic()
+        if watermark is None or self.last_full_refresh is None: # 启动后的第一次增量拉取也作为全量拉取间隔的起点
+            self.last_full_refresh = self.last_refresh
+        return True
+
+    def _pull(self, query, watermark, generation, upsert_sql):
+        """流式读取中心库的一张表并分批写入副本，返回读到的最大 UpdateTime"""
+        if watermark: # 同一秒内可能还有后来的修改，用 >= 重新读取水位所在的那一秒
+            rows = iter_query(query + " WHERE UpdateTime >= %s", (watermark,), row_format='tuple')
+        else:
+            rows = iter_query(query, row_format='tuple')
+        latest = None
+        batch = []
+        for row in rows:
+            update_time = _text(row[-1])
+            if update_time and (latest is None or update_time > latest):
+                latest = update_time
+            batch.append(row[:-1] + (generation,))
+            if len(batch) >= REFRESH_BATCH:
+                self._write_batch(upsert_sql, batch)
+                batch = []
+        if batch:
+            self._write_batch(upsert_sql, batch)
+        return latest
+
+    def _write_batch(self, sql, rows):
+        with self.lock, self.conn:
+            self.conn.executemany(sql, rows)
+
+    def run_once(self):
+        """同步队列，然后按间隔拉取中心库的变化 (中心库不可用时跳过拉取)"""
+        with self.sync_lock:
+            self.sync()
+            if self.online is False:
+                return
+            now = time.monotonic()
+            full = self.last_full_refresh is not None and now - self.last_full_refresh >= FULL_REFRESH_INTERVAL
+            if full or self.last_refresh is None or now - self.last_refresh >= REFRESH_INTERVAL:
+                self.refresh(full=full)
+
+    # --- 后台同步线程 ---
+
+    def start(self, interval=SYNC_INTERVAL):
+        self.stop_event.clear()
+        if self.thread is not None and self.thread.is_alive():
+            return # 包括上次 stop 等待超时、仍在运行的线程，清除停止标志后它会继续工作
+        self.thread = threading.Thread(target=self._run, args=(interval,), name='desk-sync', daemon=True)
+        self.thread.start()
+
+    def _run(self, interval):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e: # 同步线程不能因意外错误退出，否则队列不再同步
+                print(f"借还台同步线程出错: {e}")
+            self.wake.wait(interval)
+            self.wake.clear()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """通知同步线程退出，最多等待 timeout 秒；返回线程是否已经退出。
+
+        线程正在全量拉取或卡在无响应的中心库上时不再等待：它是守护线程，
+        未同步的操作保存在副本文件中，下次启动后继续同步。
+        """
+        self.stop_event.set()
+        self.wake.set()
+        if self.thread is None:
+            return True
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            print(f"借还台同步线程未在 {timeout} 秒内结束，未同步的操作将在下次启动时继续")
+            return False
+        self.thread = None
+        return True
+
+    def close(self):
+        if self.stop():
+            with self.lock:
+                self.conn.close()
+
+    def status_text(self):
+        """状态栏上显示的离线模式状态"""
+        pending = self.pending_count()
+        conflicts = len(self.conflicts())
+        parts = ["借还台: " + ("中心库连接中断，使用本地副本" if self.online is False else "本地副本")]
+        if pending:
+            parts.append(f"待同步 {pending}")
+        if conflicts:
+            parts.append(f"冲突 {conflicts}")
+        return "，".join(parts)
+
+
+_desk = None
+_desk_lock = threading.Lock()
+
+def get_desk():
+    """离线模式已启用时返回进程内共用的 DeskReplica，否则返回 None (借还台直接访问中心库)"""
+    global _desk
+    if not db_utils.DESK_REPLICA_PATH:
+        return None
+    with _desk_lock:
+        if _desk is None:
+            _desk = DeskReplica(db_utils.DESK_REPLICA_PATH)
+        return _desk
@@ -0,0 +1,199 @@
+# desk_simulator.py
+# 借还台并发负载模拟：N 个借还台 (线程或进程) 同时对同一个 MySQL/MariaDB 执行查卡、借书、还书和图书查询，
+# 操作与页面完全相同 (语句和 db_utils 调用方式见 bench_queries.py)。
+# 报告各操作的吞吐量和延迟分位数、服务器的行锁等待/死锁计数，以及库存一致性 (Storage 与未还册数) 的破坏情况。
+# 用法: LIBRARY_CONFIG=test_config.py python desk_simulator.py --desks 8 --duration 60 [--mode process]
+#       [--mix lookup=35,borrow=25,return=20,search=20] [--think-ms 200] [--json result.json]
+import argparse
+import json
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import db_utils
+from db_utils import execute_query, close_thread_connection
+from bench_queries import (
+    BenchContext, sample_parameters, summarize, card_lookup, borrow, return_record, search_by_name,
+    CURRENT_RECORDS_QUERY, OK, REFUSED, FAILED
+)
+
+DEFAULT_MIX = {'lookup': 35, 'borrow': 25, 'return': 20, 'search': 20}
+RECENT_CARDS = 20 # 每个借还台记住最近借出过书的读者，还书时优先为他们还
+
+LOCK_STATUS_QUERY = ("SHOW GLOBAL STATUS WHERE Variable_name IN "
+                     "('Innodb_row_lock_waits', 'Innodb_row_lock_time', 'Innodb_deadlocks')")
+# MySQL 没有 Innodb_deadlocks 状态变量，死锁数在 INNODB_METRICS 中
+DEADLOCK_METRIC_QUERY = "SELECT `COUNT` AS Value FROM information_schema.INNODB_METRICS WHERE NAME = 'lock_deadlocks'"
+# 库存一致性：每本书的 Storage 应等于 Total 减去未还册数，且不能为负
+STOCK_CONSISTENCY_QUERY = """
+SELECT b.BookNo, b.Total, b.Storage, COUNT(lr.FID) AS OpenLoans
+FROM Books b
+LEFT JOIN LibraryRecords lr ON lr.BookNo = b.BookNo AND lr.ReturnDate IS NULL
+GROUP BY b.BookNo, b.Total, b.Storage
+HAVING b.Storage < 0 OR b.Storage <> b.Total - COUNT(lr.FID)
+"""
+
+
+def desk_borrow(ctx):
+    card_no = ctx.pick(ctx.card_nos)
+    outcome = borrow(ctx, card_no=card_no)
+    ctx.pending_returns.clear() # 还书走 ReturnPage 的完整流程，不用基准的待还列表
+    if outcome == OK:
+        ctx.recent_cards.append(card_no)
+    return outcome
+
+
+def desk_return(ctx):
+    """ReturnPage 的流程：查出读者借阅中的图书，归还其中一本。
+
+    其他借还台可能同时在为同一位读者还同一本书，与真实的并发情况相同。
+    """
+    card_no = ctx.pick(ctx.recent_cards) if ctx.recent_cards else ctx.pick(ctx.card_nos)
+    records = execute_query(CURRENT_RECORDS_QUERY, (card_no,))
+    if records is None:
+        return FAILED
+    if not records:
+        return REFUSED
+    record = ctx.pick(records)
+    return return_record(record['FID'], record['BookNo'])
+
+
+OPERATIONS = {'lookup': card_lookup, 'borrow': desk_borrow, 'return': desk_return, 'search': search_by_name}
+
+
+def parse_mix(text):
+    """'lookup=35,borrow=25' -> {'lookup': 35.0, 'borrow': 25.0}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"未知的操作: {name} (可用: {', '.join(OPERATIONS)})")
+        mix[name] = float(weight)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("操作比例不能全为 0")
+    return mix
+
+
+def run_desk(desk_id, sample, mix, duration, seed=42, think_ms=0):
+    """一个借还台：在 duration 秒内按 mix 的比例随机执行操作。
+
+    返回 ({操作: 耗时毫秒列表}, {操作: {结果: 次数}})；可在线程或子进程中运行。
+    """
+    ctx = BenchContext(seed + desk_id, sample)
+    ctx.recent_cards = deque(maxlen=RECENT_CARDS)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    timings = {name: [] for name in names}
+    outcomes = {name: Counter() for name in names}
+    deadline = time.monotonic() + duration
+    try:
+        while time.monotonic() < deadline:
+            name = ctx.rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            outcome = OPERATIONS[name](ctx) or OK
+            timings[name].append((time.perf_counter() - start) * 1000)
+            outcomes[name][outcome] += 1
+            if think_ms:
+                time.sleep(ctx.rng.expovariate(1.0 / think_ms) / 1000) # 馆员操作之间的间隔
+    finally:
+        close_thread_connection()
+    return timings, {name: dict(counter) for name, counter in outcomes.items()}
+
+
+def lock_counters():
+    """服务器累计的行锁等待次数、等待总时长 (毫秒) 和死锁次数"""
+    counters = {row['Variable_name']: int(row['Value']) for row in execute_query(LOCK_STATUS_QUERY) or []}
+    if 'Innodb_deadlocks' not in counters:
+        rows = execute_query(DEADLOCK_METRIC_QUERY)
+        if rows:
+            counters['Innodb_deadlocks'] = int(rows[0]['Value'])
+    return counters
+
+
+def stock_violations():
+    """库存与未还记录不一致的图书: {BookNo: (Total, Storage, 未还册数)}"""
+    rows = execute_query(STOCK_CONSISTENCY_QUERY)
+    if rows is None:
+        raise RuntimeError("库存一致性检查查询失败")
+    return {row['BookNo']: (row['Total'], row['Storage'], row['OpenLoans']) for row in rows}
+
+
+def simulate(desks, duration, mix=None, mode='thread', seed=42, think_ms=0):
+    """运行模拟并返回结果字典 (各操作统计、锁计数增量、新出现的库存不一致)"""
+    mix = mix or DEFAULT_MIX
+    sample = sample_parameters(seed)
+    violations_before = stock_violations()
+    locks_before = lock_counters()
+
+    executor_class = ProcessPoolExecutor if mode == 'process' else ThreadPoolExecutor
+    start = time.perf_counter()
+    with executor_class(max_workers=desks) as executor:
+        futures = [executor.submit(run_desk, desk_id, sample, mix, duration, seed, think_ms)
+                   for desk_id in range(desks)]
+        desk_results = [future.result() for future in futures]
+    wall = time.perf_counter() - start
+
+    timings = {name: [] for name in mix}
+    outcomes = {name: Counter() for name in mix}
+    for desk_timings, desk_outcomes in desk_results:
+        for name in mix:
+            timings[name].extend(desk_timings[name])
+            outcomes[name].update(desk_outcomes[name])
+    operations = {}
+    for name in mix:
+        if timings[name]:
+            operations[name] = dict(summarize(timings[name], wall), outcomes=dict(outcomes[name]))
+
+    locks_after = lock_counters()
+    violations_after = stock_violations()
+    new_violations = {book_no: state for book_no, state in violations_after.items()
+                      if violations_before.get(book_no) != state}
+    return {
+        'desks': desks, 'mode': mode, 'duration_s': wall, 'mix': mix,
+        'total_ops': sum(len(values) for values in timings.values()),
+        'throughput_ops': sum(len(values) for values in timings.values()) / wall,
+        'operations': operations,
+        'lock_counters': {name: locks_after[name] - locks_before.get(name, 0) for name in locks_after},
+        'stock_violations': {book_no: list(state) for book_no, state in new_violations.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多个借还台并发访问数据库的负载模拟")
+    parser.add_argument('--desks', type=int, default=8, help="同时工作的借还台数")
+    parser.add_argument('--duration', type=float, default=30, help="模拟时长 (秒)")
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread', help="每个借还台用线程还是进程")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="各操作的比例，如 lookup=35,borrow=25,return=20,search=20")
+    parser.add_argument('--think-ms', type=float, default=0, help="每次操作后的平均间隔 (毫秒，0 表示连续操作)")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    parser.add_argument('--json', metavar='PATH', help="把结果另存为 JSON")
+    args = parser.parse_args()
+
+    probe = db_utils.create_connection()
+    if not probe:
+        print("数据库连接失败，无法运行负载模拟。")
+        raise SystemExit(1)
+    db_utils.close_connection(probe)
+
+    print(f"数据库: {db_utils.DB_CONFIG.get('database')}，{args.desks} 个借还台 ({args.mode})，"
+          f"持续 {args.duration:g} 秒，操作比例 {args.mix}")
+    result = simulate(args.desks, args.duration, args.mix, args.mode, args.seed, args.think_ms)
+    for name, stats in result['operations'].items():
+        print(f"{name:8s} n={stats['count']:<6d} {stats['throughput_ops']:8.1f} 次/秒  p50 {stats['p50_ms']:8.2f} ms  "
+              f"p95 {stats['p95_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms  结果 {stats['outcomes']}")
+    print(f"合计 {result['total_ops']} 次操作，{result['throughput_ops']:.1f} 次/秒")
+    locks = result['lock_counters']
+    print(f"行锁等待 {locks.get('Innodb_row_lock_waits', 'N/A')} 次 (共 {locks.get('Innodb_row_lock_time', 'N/A')} ms)，"
+          f"死锁 {locks.get('Innodb_deadlocks', 'N/A')} 次")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    violations = result['stock_violations']
+    if violations:
+        print(f"库存一致性被破坏的图书 {len(violations)} 本 (书号: 总数, 库存, 未还册数):")
+        for book_no, (total, storage, open_loans) in list(violations.items())[:20]:
+            print(f"  {book_no}: {total}, {storage}, {open_loans}")
+        raise SystemExit(1)
+    print("库存一致性检查通过。")
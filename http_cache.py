@@ -0,0 +1,97 @@
+# http_cache.py
+# On-disk HTTP response cache for the crawler.
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class HttpCache:
+    """Stores fetched pages on disk, keyed by URL.
+
+    Each entry is two files named after the SHA-1 of the URL: `<key>.json` holds
+    the validators (ETag / Last-Modified) and fetch time, `<key>.html.gz` holds
+    the gzip-compressed, already decoded page text. Writes go through a temp
+    file + os.replace, so readers never see a half-written entry.
+    """
+
+    def __init__(self, cache_dir='.crawler_cache'):
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.hits = 0        # Served from cache without transferring a body (304 or offline)
+        self.misses = 0      # Body had to be downloaded
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + '.json', base + '.html.gz'
+
+    def get(self, url):
+        """Returns the cached entry for `url` (metadata dict with a 'body' key) or None."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            with gzip.open(body_path, 'rt', encoding='utf-8') as f:
+                entry['body'] = f.read()
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """Saves a freshly downloaded page together with its validators."""
+        meta_path, body_path = self._paths(url)
+        entry = {'url': url, 'etag': etag, 'last_modified': last_modified, 'fetched_at': time.time()}
+        with self.lock:
+            self.misses += 1
+            self._atomic_write(body_path, gzip.compress(body.encode('utf-8')))
+            self._atomic_write(meta_path, json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+
+    def record_hit(self):
+        """Counts a page served from the cache without downloading its body."""
+        with self.lock:
+            self.hits += 1
+
+    def revalidated(self, url):
+        """Records that the server answered 304 for `url` (the cached body is still current)."""
+        meta_path, _ = self._paths(url)
+        entry = self.get(url)
+        if entry is None:
+            return
+        entry.pop('body')
+        entry['fetched_at'] = time.time()
+        self.record_hit()
+        with self.lock:
+            self._atomic_write(meta_path, json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Request headers that let the server answer 304 Not Modified for a cached entry."""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def urls(self):
+        """Lists every URL currently in the cache."""
+        cached_urls = []
+        for name in sorted(os.listdir(self.cache_dir)):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.cache_dir, name), 'r', encoding='utf-8') as f:
+                        cached_urls.append(json.load(f)['url'])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return cached_urls
+
+    @staticmethod
+    def _atomic_write(path, data):
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,296 @@
+# local_search.py
+# 本地离线搜书引擎：在 Books (及 BookDetails 的标签) 上建立 BM25 倒排索引，
+# 中文按字符二元组 (bigram) 切分，索引以 NumPy 数组保存并以内存映射方式加载，
+# 查询时对命中的倒排表做向量化累加打分，不需要网络，毫秒级返回。
+# 用法: python local_search.py --rebuild        重建索引
+#       python local_search.py "雨果写的关于巴黎圣母院的小说"
+import argparse
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+try:
+    from db_utils import execute_query, iter_query
+except ImportError as e:
+    print(f"错误：导入数据库工具时出错 - {e}")
+    def execute_query(query, params=None, row_format='dict'): return None
+    def iter_query(query, params=None, batch_size=500, row_format='dict'): return iter(())
+
+INDEX_DIR = '.local_search_index'
+BM25_K1 = 1.2
+BM25_B = 0.75
+# 各字段的词频权重：书名最重要，其次是作者和标签
+FIELD_WEIGHTS = (('BookName', 3), ('Author', 2), ('Tags', 2), ('BookType', 1), ('Publisher', 1))
+
+# 连续的中日韩文字，或连续的字母数字 (英文单词、数字)
+TOKEN_RUN_RE = re.compile(r'[㐀-鿿豈-﫿]+|[0-9a-z]+')
+
+CATALOGUE_QUERY = """
+SELECT b.BookNo, b.BookName, b.Author, b.Publisher, b.BookType, d.Tags
+FROM Books b LEFT JOIN BookDetails d ON d.BookNo = b.BookNo
+ORDER BY b.BookNo
+"""
+# 用于判断索引是否过期：书目数量或最近修改时间变化时需要重建
+SIGNATURE_QUERY = """
+SELECT (SELECT COUNT(*) FROM Books) AS BookCount,
+       (SELECT MAX(UpdateTime) FROM Books) AS BooksUpdated,
+       (SELECT MAX(UpdateTime) FROM BookDetails) AS DetailsUpdated
+"""
+
+
+def tokenize(text):
+    """中文切成相邻字符二元组 (单字时保留单字)，英文和数字按整词，统一全半角和大小写"""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKC', str(text)).casefold()
+    tokens = []
+    for run in TOKEN_RUN_RE.findall(text):
+        if run[0].isascii():
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class LocalSearchIndex:
+    """BM25 倒排索引。
+
+    词 t 的倒排表为 doc_ids[indptr[t]:indptr[t+1]]，对应的 weights 已经是
+    该词在该文档上的完整 BM25 得分 (idf * 饱和后的词频)，查询时只需把各查询词的
+    倒排表累加到得分数组上。数组可以用 np.load(mmap_mode='r') 直接映射，
+    启动时不必把整个索引读入内存。
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, weights, book_nos, book_names, signature=None):
+        self.vocab = vocab # 词 -> 词号
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.book_nos = book_nos
+        self.book_names = book_names
+        self.signature = signature
+
+    @classmethod
+    def build(cls, rows, signature=None):
+        """由 (BookNo, BookName, Author, Publisher, BookType, Tags) 行构建索引"""
+        vocab = {}
+        doc_terms = [] # 每个文档: Counter(词号 -> 加权词频)
+        book_nos, book_names = [], []
+        for row in rows:
+            fields = dict(zip(('BookNo', 'BookName', 'Author', 'Publisher', 'BookType', 'Tags'), row))
+            counts = Counter()
+            for field, weight in FIELD_WEIGHTS:
+                for token in tokenize(fields[field]):
+                    counts[vocab.setdefault(token, len(vocab))] += weight
+            doc_terms.append(counts)
+            book_nos.append(fields['BookNo'])
+            book_names.append(fields['BookName'])
+
+        n_docs, n_terms = len(doc_terms), len(vocab)
+        doc_lengths = np.array([sum(counts.values()) for counts in doc_terms], dtype=np.float32)
+        avg_length = float(doc_lengths.mean()) if n_docs else 1.0
+
+        # 按词号分桶，得到 CSR 形式的倒排表
+        nnz = sum(len(counts) for counts in doc_terms)
+        term_ids = np.empty(nnz, dtype=np.int32)
+        posting_docs = np.empty(nnz, dtype=np.int32)
+        term_freqs = np.empty(nnz, dtype=np.float32)
+        position = 0
+        for doc_id, counts in enumerate(doc_terms):
+            size = len(counts)
+            term_ids[position:position + size] = list(counts.keys())
+            term_freqs[position:position + size] = list(counts.values())
+            posting_docs[position:position + size] = doc_id
+            position += size
+        order = np.argsort(term_ids, kind='stable')
+        term_ids, posting_docs, term_freqs = term_ids[order], posting_docs[order], term_freqs[order]
+        doc_freqs = np.bincount(term_ids, minlength=n_terms)
+        indptr = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(doc_freqs, out=indptr[1:])
+
+        idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths[posting_docs] / avg_length)
+        weights = (idf[term_ids] * term_freqs * (BM25_K1 + 1) / (term_freqs + norm)).astype(np.float32)
+        return cls(vocab, indptr, posting_docs, weights, book_nos, book_names, signature)
+
+    def search(self, text, top_k=10):
+        """返回按得分降序的 [(BookNo, BookName, 得分)]"""
+        term_ids = [self.vocab[token] for token in set(tokenize(text)) if token in self.vocab]
+        if not term_ids or not self.book_nos:
+            return []
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        doc_ids = np.concatenate([self.doc_ids[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        scores = np.bincount(doc_ids, weights=weights, minlength=len(self.book_nos))
+        top_k = min(top_k, np.count_nonzero(scores))
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(self.book_nos[i], self.book_names[i], float(scores[i])) for i in best]
+
+    def save(self, index_dir=INDEX_DIR):
+        """写入 index_dir；每次保存的数组用新文件名，最后替换的 meta.json 指向它们，
+        读取方以 meta.json 为准，保存中途退出也不会读到新旧混杂的索引"""
+        os.makedirs(index_dir, exist_ok=True)
+        stamp = f"{time.time_ns():x}"
+        files = {}
+        for name in ('indptr', 'doc_ids', 'weights'):
+            files[name] = f"{name}.{stamp}.npy"
+            np.save(os.path.join(index_dir, files[name]), getattr(self, name))
+        meta = {'vocab': self.vocab, 'book_nos': self.book_nos, 'book_names': self.book_names,
+                'signature': self.signature, 'built_at': time.time(), 'files': files}
+        tmp_path = os.path.join(index_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(index_dir, 'meta.json'))
+        # 清理旧版本的数组 (Windows 上仍被映射的文件删不掉，留到下次保存)
+        for entry in os.listdir(index_dir):
+            if entry.endswith('.npy') and entry not in files.values():
+                try:
+                    os.remove(os.path.join(index_dir, entry))
+                except OSError:
+                    pass
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR):
+        """以内存映射方式加载索引，不存在或损坏时返回 None"""
+        try:
+            with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            files = meta.get('files') or {name: f"{name}.npy" for name in ('indptr', 'doc_ids', 'weights')}
+            arrays = {name: np.load(os.path.join(index_dir, file_name), mmap_mode='r')
+                      for name, file_name in files.items()}
+        except (OSError, ValueError) as e:
+            print(f"加载本地搜索索引失败: {e}")
+            return None
+        return cls(meta['vocab'], arrays['indptr'], arrays['doc_ids'], arrays['weights'],
+                   meta['book_nos'], meta['book_names'], meta.get('signature'))
+
+
+def catalogue_signature():
+    """当前书目的 (数量, 最近修改时间) 签名，数据库出错时返回 None"""
+    result = execute_query(SIGNATURE_QUERY)
+    if not result:
+        return None
+    row = result[0]
+    return [row['BookCount'], str(row['BooksUpdated']), str(row['DetailsUpdated'])]
+
+
+def build_index_from_db(index_dir=INDEX_DIR, signature=None):
+    """从数据库流式读取书目并重建索引"""
+    if signature is None:
+        signature = catalogue_signature()
+    index = LocalSearchIndex.build(iter_query(CATALOGUE_QUERY, row_format='tuple'), signature)
+    index.save(index_dir)
+    return index
+
+
+_index = None
+_index_loaded = False # 是否已尝试从磁盘加载
+_index_lock = threading.Lock() # 只保护 _index 的读取和替换，重建期间不持有
+_refresh_lock = threading.Lock() # 同一时间只允许一个线程重建
+_refresh_thread = None
+
+def get_index(index_dir=INDEX_DIR):
+    """返回进程内共享的索引，首次调用时从磁盘加载 (内存映射，很快)。
+
+    从不在调用方线程中重建：还没有索引时返回 None，由 refresh_index 在后台建立。
+    """
+    global _index, _index_loaded
+    if not _index_loaded:
+        loaded = LocalSearchIndex.load(index_dir)
+        with _index_lock:
+            if not _index_loaded:
+                _index, _index_loaded = loaded, True
+    return _index
+
+
+def refresh_index(index_dir=INDEX_DIR):
+    """书目有变化 (或还没有索引) 时重建并替换共享索引，返回当前索引。
+
+    重建会读取整个书目，只应在后台线程调用；重建期间 get_index 继续返回旧索引。
+    """
+    global _index, _index_loaded
+    with _refresh_lock:
+        index = get_index(index_dir)
+        try:
+            signature = catalogue_signature()
+            if index is not None and (signature is None or signature == index.signature):
+                return index
+            index = build_index_from_db(index_dir, signature)
+        except Exception as e:
+            print(f"构建本地搜索索引失败: {e}")
+            return get_index(index_dir)
+        with _index_lock:
+            _index, _index_loaded = index, True
+        return index
+
+
+def start_refresh(on_done=None, index_dir=INDEX_DIR):
+    """在后台守护线程中运行 refresh_index，立即返回；已有刷新在进行时不重复启动。
+
+    结束后在该线程中调用 on_done(索引或 None)。守护线程不会拖住程序退出，
+    中途退出时磁盘上的索引仍是完整的旧版本 (见 LocalSearchIndex.save)。
+    """
+    global _refresh_thread
+    def run():
+        index = refresh_index(index_dir)
+        if on_done is not None:
+            on_done(index)
+    with _index_lock:
+        if _refresh_thread is not None and _refresh_thread.is_alive():
+            return False
+        _refresh_thread = threading.Thread(target=run, name='local-search-refresh', daemon=True)
+        _refresh_thread.start()
+    return True
+
+
+def search_local(text, top_k=10, index_dir=INDEX_DIR):
+    """在本地书目中搜索，返回 [(BookNo, BookName, 得分)]；索引不可用或尚未建好时返回空列表"""
+    index = get_index(index_dir)
+    return index.search(text, top_k) if index is not None else []
+
+
+
+def search_local_books(text, top_k=10):
+    """search_local 的结果补上作者和当前库存 (一次按书号查询)，按相关度排序返回字典列表"""
+    matches = search_local(text, top_k)
+    if not matches:
+        return []
+    placeholders = ", ".join(["%s"] * len(matches))
+    rows = execute_query(f"SELECT BookNo, BookName, Author, Total, Storage FROM Books WHERE BookNo IN ({placeholders})",
+                         tuple(book_no for book_no, _, _ in matches)) or []
+    by_book_no = {row['BookNo']: row for row in rows}
+    # 索引建立后被删除的书不再返回
+    return [dict(by_book_no[book_no], Score=score) for book_no, _, score in matches if book_no in by_book_no]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地离线搜书 (BM25 索引)")
+    parser.add_argument('query', nargs='?', help="要搜索的描述")
+    parser.add_argument('--rebuild', action='store_true', help="从数据库重建索引")
+    parser.add_argument('-k', '--top-k', type=int, default=10, help="返回的结果数")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        start = time.perf_counter()
+        built = build_index_from_db()
+        print(f"索引已重建: {len(built.book_nos)} 本书，{len(built.vocab)} 个词，"
+              f"耗时 {time.perf_counter() - start:.2f} 秒")
+    if args.query:
+        if get_index() is None:
+            parser.exit(1, "本地搜索索引尚未建立，请先运行 --rebuild\n")
+        start = time.perf_counter()
+        matches = search_local(args.query, args.top_k)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for book_no, book_name, score in matches:
+            print(f"{score:7.3f}  《{book_name}》 ({book_no})")
+        print(f"共 {len(matches)} 条结果，耗时 {elapsed_ms:.1f} ms")
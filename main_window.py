@@ -1,4 +1,5 @@
 # main_window.py
+from startup_trace import TRACE # First, so the trace covers every import below
 import sys
 import os
 import time # For simulated loading in splash test
@@ -8,10 +9,16 @@ from PyQt6.QtWidgets import (
     QDialog, QMessageBox, QGraphicsOpacityEffect, QGraphicsDropShadowEffect
 )
 from PyQt6.QtCore import Qt, QTimer, QDateTime, QSize, QPropertyAnimation, QEasingCurve, pyqtProperty
-from PyQt6.QtGui import QIcon, QFont, QColor
+from PyQt6.QtGui import QIcon, QFont, QColor, QShortcut, QKeySequence
+TRACE.mark("import.PyQt6")
 
 # --- Theme ---
 from qt_material import apply_stylesheet
+TRACE.mark("import.qt_material")
+
+import metrics
+from ui_watchdog import UIWatchdog, GuiProfiler
+TRACE.mark("import.monitoring")
 
 # --- Splash Screen ---
 try:
@@ -19,57 +26,68 @@ try:
 except ImportError:
     print("错误：无法导入 SplashScreen。将不显示启动画面。")
     SplashScreen = None
+TRACE.mark("import.splash_screen")
 
 # --- Page Imports ---
+TRACE.import_modules() # Heavy dependencies of the pages, timed separately
 try:
     from login_dialog import LoginDialog
 except ImportError:
     print("错误：无法导入 LoginDialog.");
     class LoginDialog(QDialog): pass
+TRACE.mark("import.login_dialog")
 
 try:
     from patron_login_dialog import PatronLoginDialog
 except ImportError:
     print("错误：无法导入 PatronLoginDialog.");
     class PatronLoginDialog(QDialog): pass
+TRACE.mark("import.patron_login_dialog")
 
 try:
     from query_page import QueryPage
 except ImportError:
     print("错误：无法导入 QueryPage.");
     class QueryPage(QWidget): pass
+TRACE.mark("import.query_page")
 
 try:
     from add_book_page import AddBookPage
 except ImportError:
     print("错误：无法导入 AddBookPage.");
     class AddBookPage(QWidget): pass
+TRACE.mark("import.add_book_page")
 
 try:
     from borrow_page import BorrowPage
 except ImportError:
     print("错误：无法导入 BorrowPage.");
     class BorrowPage(QWidget): pass
+TRACE.mark("import.borrow_page")
 
 try:
     from return_page import ReturnPage
 except ImportError:
     print("错误：无法导入 ReturnPage.");
     class ReturnPage(QWidget): pass
+TRACE.mark("import.return_page")
 
 try:
     from card_manage_page import CardManagePage
 except ImportError:
     print("错误：无法导入 CardManagePage.");
     class CardManagePage(QWidget): pass
+TRACE.mark("import.card_manage_page")
 
 try:
     from overdue_page import OverduePage
 except ImportError:
     print("错误：无法导入 OverduePage.");
     class OverduePage(QWidget): pass
+TRACE.mark("import.overdue_page")
 
 from patron_borrowing_page import PatronBorrowingPage
+TRACE.mark("import.patron_borrowing_page")
 
 
 
@@ -78,6 +96,21 @@ try:
 except ImportError:
     print("错误：无法导入 AIAssistantPage.");
     class AIAssistantPage(QWidget): pass
+TRACE.mark("import.ai_assistant_page")
+
+try:
+    from query_stats_dialog import QueryStatsDialog
+except ImportError:
+    print("错误：无法导入 QueryStatsDialog.");
+    QueryStatsDialog = None
+TRACE.mark("import.query_stats_dialog")
+
+try:
+    from desk_replica import get_desk
+except ImportError:
+    print("错误：无法导入 desk_replica，借还台离线模式不可用。");
+    def get_desk(): return None
+TRACE.mark("import.desk_replica")
 
 
 # --- Resource Path Function ---
@@ -111,6 +144,7 @@ class MainWindow(QMainWindow):
         self.animation_running = False
         self.page_effects = {}
         self.active_button_name = None # Track active button for styling
+        self.query_stats_dialog = None # Created on first use
 
         self.setWindowTitle("✨ 智能图书管理系统 ✨")
         self.setGeometry(100, 100, 1150, 720)
@@ -179,6 +213,7 @@ class MainWindow(QMainWindow):
             ("还书管理", "btn_return", True, False, "arrow-down-circle.svg"),
             ("借书证管理", "btn_card_manage", True, False, "users.svg"),
             ("逾期提醒", "btn_overdue", True, False, "alert-triangle.svg"),
+            ("查询统计", "btn_query_stats", True, False, "cpu.svg"),
         ]
 
         for text, name, is_admin, is_patron, icon_file in buttons_info:
@@ -207,16 +242,19 @@ class MainWindow(QMainWindow):
         # Create Pages and add effects
         self.pages = {}
         page_definitions = {
-            "query": ("图书查询", QueryPage()),
-            "ai_search": ("AI 搜书", AIAssistantPage()),
-            "my_borrowing": ("我的借阅", PatronBorrowingPage()),
-            "add_book": ("图书入库", AddBookPage()),
-            "borrow": ("借书管理", BorrowPage()),
-            "return": ("还书管理", ReturnPage()),
-            "card_manage": ("借书证管理", CardManagePage()),
-            "overdue": ("逾期提醒", OverduePage()),
+            "query": ("图书查询", QueryPage),
+            "ai_search": ("AI 搜书", AIAssistantPage),
+            "my_borrowing": ("我的借阅", PatronBorrowingPage),
+            "add_book": ("图书入库", AddBookPage),
+            "borrow": ("借书管理", BorrowPage),
+            "return": ("还书管理", ReturnPage),
+            "card_manage": ("借书证管理", CardManagePage),
+            "overdue": ("逾期提醒", OverduePage),
         }
-        for name, (title, page_widget) in page_definitions.items():
+        TRACE.mark("main_window.layout")
+        for name, (title, page_class) in page_definitions.items():
+            page_widget = page_class()
+            TRACE.mark(f"page.{name}")
             if isinstance(page_widget, QWidget):
                 opacity_effect = QGraphicsOpacityEffect(page_widget)
                 opacity_effect.setOpacity(1.0)
@@ -240,6 +278,12 @@ class MainWindow(QMainWindow):
         self.user_label = QLabel("当前状态: 未登录")
         self.time_label = QLabel(" ")
         self.status_bar.addPermanentWidget(self.user_label, stretch=1)
+        # Offline desk mode: local replica + background sync queue (only when DESK_REPLICA is configured)
+        self.desk = get_desk()
+        self.desk_label = QLabel(" ")
+        if self.desk is not None:
+            self.status_bar.addPermanentWidget(self.desk_label)
+            self.desk.start()
         self.status_bar.addPermanentWidget(self.time_label)
 
         # Timer for clock
@@ -248,6 +292,13 @@ class MainWindow(QMainWindow):
         self.timer.start(1000)
         self.update_time() # Initial time update
 
+        # Event-loop stall detection (logs stalls to ui_stalls.log) and on-demand profiling
+        self.watchdog = UIWatchdog(parent=self)
+        self.watchdog.start()
+        self.profiler = GuiProfiler()
+        self.profile_shortcut = QShortcut(QKeySequence("Ctrl+Shift+P"), self)
+        self.profile_shortcut.activated.connect(self.toggle_profiling)
+
         # --- Connect Signals ---
         self.nav_buttons["btn_query"].clicked.connect(lambda: self.switch_page("query"))
         self.nav_buttons["btn_ai_search"].clicked.connect(lambda: self.switch_page("ai_search"))
@@ -260,6 +311,7 @@ class MainWindow(QMainWindow):
         self.nav_buttons["btn_return"].clicked.connect(lambda: self.switch_page("return"))
         self.nav_buttons["btn_card_manage"].clicked.connect(lambda: self.switch_page("card_manage"))
         self.nav_buttons["btn_overdue"].clicked.connect(lambda: self.switch_page("overdue"))
+        self.nav_buttons["btn_query_stats"].clicked.connect(self.show_query_stats)
 
         # --- Set Initial View State (without showing window yet) ---
         self.update_view_for_state()
@@ -279,6 +331,12 @@ class MainWindow(QMainWindow):
             self.page_effects[current_initial_widget].setOpacity(1.0)
 
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not TRACE.finished:
+            TRACE.finish("first_paint") # Writes the startup report when LIBRARY_STARTUP_TRACE is set
+            if TRACE.exit_requested(): QTimer.singleShot(0, QApplication.instance().quit)
+
     # --- Method to Start Fade-in Animation ---
     def start_fade_in_animation(self):
         """Starts the main window fade-in animation. Call after show()."""
@@ -364,12 +422,21 @@ class MainWindow(QMainWindow):
 
     def refresh_page_data(self, page_name, page_widget):
          print(f"Refreshing data for page: {page_name}")
+         start = time.perf_counter()
          if page_name == "my_borrowing" and hasattr(page_widget, 'set_patron_info'): page_widget.set_patron_info(self.logged_in_patron)
          elif page_name == "overdue" and hasattr(page_widget, 'load_overdue_records'): page_widget.load_overdue_records()
          elif page_name == "query" and hasattr(page_widget, 'load_borrow_ranking'): page_widget.load_borrow_ranking(); page_widget.perform_search(initial_load=True)
          elif page_name == "add_book" and hasattr(page_widget, 'load_recent_books'): page_widget.load_recent_books()
          elif page_name == "card_manage" and hasattr(page_widget, 'load_cards'): page_widget.load_cards(); page_widget.clear_stats_display()
          elif page_name == "borrow" and hasattr(page_widget, 'set_operator'): page_widget.set_operator(self.logged_in_user['UserID'] if self.logged_in_user else None)
+         elif page_name == "ai_search" and hasattr(page_widget, 'refresh_local_index'): page_widget.refresh_local_index()
+         metrics.PAGE_REFRESH_SECONDS.observe(time.perf_counter() - start, page=page_name)
+
+    def show_query_stats(self):
+        """Opens the (non-modal) query statistics dialog, reusing it if already open."""
+        if QueryStatsDialog is None: QMessageBox.warning(self, "查询统计", "查询统计模块加载失败。"); return
+        if self.query_stats_dialog is None: self.query_stats_dialog = QueryStatsDialog(self)
+        self.query_stats_dialog.show(); self.query_stats_dialog.raise_(); self.query_stats_dialog.activateWindow()
 
     # --- Login/Logout Handlers ---
     def handle_admin_login(self):
@@ -409,6 +476,7 @@ class MainWindow(QMainWindow):
         if self.logged_in_user: logged_out_user = f"管理员 '{self.logged_in_user['UserID']}'"
         elif self.logged_in_patron: logged_out_user = f"读者 '{self.logged_in_patron['CardNo']}'"
         self.logged_in_user = None; self.logged_in_patron = None
+        if self.query_stats_dialog is not None: self.query_stats_dialog.close() # Admin-only view
         if logged_out_user: print(f"用户 '{logged_out_user}' 正在退出登录")
         self.update_view_for_state()
         if "query" in self.pages: self.switch_page("query")
@@ -441,6 +509,13 @@ class MainWindow(QMainWindow):
         current_time = QDateTime.currentDateTime()
         formatted_time = current_time.toString("yyyy-MM-dd hh:mm:ss")
         self.time_label.setText(formatted_time)
+        if self.desk is not None: self.desk_label.setText(self.desk.status_text())
+
+    # --- Profiling (Ctrl+Shift+P) ---
+    def toggle_profiling(self):
+        running, path = self.profiler.toggle()
+        if running: self.status_bar.showMessage(f"性能分析中… 再按 Ctrl+Shift+P 停止 (py-spy 可附加到 PID {os.getpid()})")
+        else: self.status_bar.showMessage(f"性能分析结果已保存到 {path}", 10000)
 
     # --- Close Event ---
     def closeEvent(self, event):
@@ -455,13 +530,19 @@ class MainWindow(QMainWindow):
                 try: page_widget.closeEvent(event)
                 except Exception as e: print(f"调用页面 {page_name} 的 closeEvent 时出错: {e}")
         print("已尝试通知所有页面关闭...")
+        if self.profiler.running: print(f"性能分析结果已保存到 {self.profiler.stop()}")
+        self.watchdog.stop()
+        if self.desk is not None: self.desk.stop() # Queued operations stay in the replica file and sync on next start
         super().closeEvent(event)
 
 
 # --- Application Entry Point ---
 if __name__ == '__main__':
     app = QApplication(sys.argv)
+    metrics.start_metrics_server() # Only listens when LIBRARY_METRICS_PORT is set
+    TRACE.mark("qapplication")
     apply_stylesheet(app, theme='light_blue.xml', extra={'density_scale': '0'}) # Apply theme
+    TRACE.mark("stylesheet")
 
     splash = None
     main_win = None # Define main_win here
@@ -470,9 +551,11 @@ if __name__ == '__main__':
     def show_main_window():
         global main_win
         print("Splash finished. Creating and showing main window...")
+        TRACE.mark("splash.hold", idle=True) # Deliberate splash display time, not counted in the budget
         main_win = MainWindow()
         main_win.show()
         main_win.start_fade_in_animation() # Start fade-in AFTER show()
+        TRACE.mark("main_window.show")
         if splash:
             splash.close()
 
@@ -482,6 +565,7 @@ if __name__ == '__main__':
         splash.show_splash()
         splash.show_message("正在初始化...", alignment=Qt.AlignmentFlag.AlignBottom | Qt.AlignmentFlag.AlignCenter)
         app.processEvents() # Ensure splash is visible
+        TRACE.mark("splash.show")
         # Simulate loading (optional)
         # time.sleep(0.5); splash.show_message("加载配置..."); app.processEvents()
         # time.sleep(0.5); splash.show_message("准备就绪..."); app.processEvents()
@@ -491,5 +575,6 @@ if __name__ == '__main__':
         main_win = MainWindow()
         main_win.show()
         main_win.start_fade_in_animation()
+        TRACE.mark("main_window.show")
 
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,261 @@
+# metrics.py
+# 进程内运行指标 (计数器、仪表、直方图) 和可选的本地 HTTP 导出端点 (Prometheus 文本格式)。
+# 只依赖标准库；db_utils、页面和主窗口在各自的代码路径上更新下面定义的指标。
+# 启用端点: 设置环境变量 LIBRARY_METRICS_PORT (如 9464) 后启动 main_window.py，
+# 然后由 Prometheus 抓取 http://127.0.0.1:9464/metrics；未设置时不监听任何端口。
+import os
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT_ENV = 'LIBRARY_METRICS_PORT'
+METRICS_HOST = '127.0.0.1' # 只在本机监听，由本机的采集代理转发
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 直方图默认分桶 (秒)，覆盖 1 毫秒的索引查询到数秒的卡顿
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """带标签的指标基类：每组标签值对应一个样本，标签按定义时的顺序以关键字参数传入"""
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.samples = {} # 标签值元组 -> 样本
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，传入的是 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self.lock:
+            samples = sorted(self.samples.items())
+            lines.extend(self._render_samples(samples))
+        return lines
+
+    def _render_samples(self, samples):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in samples]
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.samples.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """仪表：可以 set/inc/dec，也可以传入 callback 在导出时取值 (不带标签)"""
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.samples[key] = self.samples.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        if self.callback is not None:
+            return self.callback()
+        with self.lock:
+            return self.samples.get(self._key(labels), 0)
+
+    def render(self):
+        if self.callback is None:
+            return super().render()
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge",
+                f"{self.name} {_format_value(self.callback())}"]
+
+
+class Histogram(_Metric):
+    """直方图：每组标签一个 [各桶计数, 总和, 总数]，导出时按 Prometheus 约定累加为 le 桶"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value) # 等于上界的值落在该桶 (le 语义)
+        with self.lock:
+            sample = self.samples.get(key)
+            if sample is None:
+                sample = self.samples[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            sample[0][index] += 1
+            sample[1] += value
+            sample[2] += 1
+
+    def count(self, **labels):
+        with self.lock:
+            sample = self.samples.get(self._key(labels))
+            return sample[2] if sample else 0
+
+    def _render_samples(self, samples):
+        lines = []
+        for key, (bucket_counts, total, count) in samples:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, (('le', _format_value(float(bound))),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"指标 {metric.name} 已注册")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name):
+        with self.lock:
+            self.metrics.pop(name, None)
+
+    def render(self):
+        """全部指标的 Prometheus 文本格式"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+def gauge(name, documentation, labelnames=(), callback=None):
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# --- 应用指标 ---
+# 数据库 (db_utils)
+DB_STATEMENT_SECONDS = histogram('library_db_statement_duration_seconds',
+                                 "经由 db_utils 执行的语句总耗时 (含连接、执行、取数)", ('kind',))
+DB_STATEMENT_ERRORS = counter('library_db_statement_errors_total', "执行失败的语句数", ('kind',))
+DB_CONNECTIONS_OPENED = counter('library_db_connections_opened_total', "建立的数据库连接数")
+DB_CONNECTIONS_OPEN = gauge('library_db_connections_open', "当前打开的数据库连接数 (短连接与长连接)")
+DB_THREAD_CONNECTIONS = gauge('library_db_thread_connections', "预处理语句使用的线程长连接数")
+# 缓存命中 (cache: prepared_statement / ai_search_query)
+CACHE_REQUESTS = counter('library_cache_requests_total', "缓存查找次数", ('cache', 'result'))
+# AI 搜书的后台线程池
+SEARCH_TASKS_IN_FLIGHT = gauge('library_search_tasks_in_flight', "AI 搜书线程池中尚未结束的来源查询数")
+# 借还业务 (每分钟借还量用 rate(library_circulation_total[5m]) * 60 计算)
+CIRCULATION = counter('library_circulation_total', "借还台完成的借书/还书次数", ('operation',))
+# 借还台离线模式 (desk_replica)
+DESK_OUTBOX_PENDING = gauge('library_desk_outbox_pending', "本地队列中等待同步到中心库的借还操作数")
+DESK_SYNC_CONFLICTS = counter('library_desk_sync_conflicts_total', "同步时与中心库冲突的借还操作数", ('operation',))
+DESK_ONLINE = gauge('library_desk_online', "借还台最近一次访问中心库是否成功 (1/0)")
+# 界面
+PAGE_REFRESH_SECONDS = histogram('library_page_refresh_duration_seconds', "切换到页面时刷新数据的耗时", ('page',))
+UI_EVENT_LOOP_LAG_SECONDS = histogram('library_ui_event_loop_lag_seconds', "界面事件循环心跳的延迟")
+UI_STALLS = counter('library_ui_stalls_total', "事件循环延迟超过卡顿阈值的次数")
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+# --- HTTP 导出端点 ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # 不把每次抓取都打印到控制台
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=None, host=METRICS_HOST):
+    """在后台线程中启动导出端点，返回实际监听的端口；未指定端口且未设置 LIBRARY_METRICS_PORT 时不启动，返回 None"""
+    global _server
+    if port is None:
+        port = os.environ.get(METRICS_PORT_ENV)
+        if not port:
+            return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            except (OSError, ValueError) as e:
+                print(f"启动指标端点失败 ({host}:{port}): {e}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+            print(f"指标端点已启动: http://{host}:{_server.server_address[1]}/metrics")
+        return _server.server_address[1]
+
+def stop_metrics_server():
+    global _server
+    with _server_lock:
+        if _server is not None:
+            _server.shutdown()
+            _server.server_close()
+            _server = None
@@ -1,22 +1,29 @@
 # overdue_page.py
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QPushButton, QTableWidget, QTableWidgetItem,
-    QHeaderView, QMessageBox, QGroupBox, QLabel, QHBoxLayout
+    QHeaderView, QMessageBox, QGroupBox, QLabel, QHBoxLayout, QFileDialog
 )
 from PyQt6.QtCore import Qt, QDate # 导入 QDate 用于日期比较
 from PyQt6.QtGui import QFont, QColor
 import datetime
+import csv
+import os
 
 # 假设 db_utils.py 在可访问路径
 try:
-    from db_utils import execute_query
+    from db_utils import execute_query, iter_query
 except ImportError as e:
     print(f"错误：导入数据库工具时出错 - {e}")
     def execute_query(query, params=None): return None
+    def iter_query(query, params=None, batch_size=500, row_format='dict'): return iter(())
 
 class OverduePage(QWidget):
     # 假设借阅期限（天）
     BORROW_DURATION_DAYS = 30
+    # 流式填充表格时每次扩展的行数
+    ROW_GROW_STEP = 500
+    COLUMN_KEYS = ["FID", "CardNo", "BorrowerName", "BookNo", "BookName", "LentDate", "OverdueDays"]
+    COLUMN_HEADERS = ["记录ID", "卡号", "持卡人姓名", "书号(ID)", "书名", "借出日期", "已逾期(天)"]
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -39,9 +46,13 @@ class OverduePage(QWidget):
         # 刷新按钮
         self.refresh_button = QPushButton("刷新列表")
         self.refresh_button.clicked.connect(self.load_overdue_records)
+        # 导出按钮
+        self.export_button = QPushButton("导出CSV")
+        self.export_button.clicked.connect(self.export_overdue_records)
         # 将按钮放在布局右侧
         button_layout = QHBoxLayout()
         button_layout.addStretch()
+        button_layout.addWidget(self.export_button)
         button_layout.addWidget(self.refresh_button)
         main_layout.addLayout(button_layout)
 
@@ -49,9 +60,7 @@ class OverduePage(QWidget):
         # 显示逾期记录的表格
         self.table_widget = QTableWidget()
         self.table_widget.setColumnCount(7) # FID, 卡号, 姓名, 书号, 书名, 借出日期, 逾期天数
-        self.table_widget.setHorizontalHeaderLabels([
-            "记录ID", "卡号", "持卡人姓名", "书号(ID)", "书名", "借出日期", "已逾期(天)"
-        ])
+        self.table_widget.setHorizontalHeaderLabels(self.COLUMN_HEADERS)
         header = self.table_widget.horizontalHeader()
         header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(4, QHeaderView.ResizeMode.Interactive) # 书名可调
@@ -66,8 +75,8 @@ class OverduePage(QWidget):
         """)
         main_layout.addWidget(self.table_widget)
 
-    def load_overdue_records(self):
-        """查询并加载所有逾期未还的记录"""
+    def build_overdue_query(self):
+        """构造查询所有逾期未还记录的 SQL (表格和导出共用)"""
         # 计算截止日期 (今天 - 借阅期限)
         # 使用数据库的日期函数通常更可靠
         # MySQL: DATE_SUB(CURDATE(), INTERVAL 30 DAY)
@@ -92,29 +101,29 @@ class OverduePage(QWidget):
         ORDER BY OverdueDays DESC, lr.LentDate ASC
         """
         # 注意：这里直接格式化了天数，对于固定值是安全的。如果天数是变量，应考虑其他方式。
+        return query
 
-        results = execute_query(query) # 无需参数
-        self.populate_overdue_table(results)
+    def load_overdue_records(self):
+        """查询并加载所有逾期未还的记录 (流式读取，逾期记录再多也不会一次性读入内存)"""
+        try:
+            self.populate_overdue_table(iter_query(self.build_overdue_query(), row_format='record')) # 无需参数
+        except Exception as e:
+            QMessageBox.critical(self, "查询错误", f"获取逾期记录时发生错误！\n{e}")
 
 
     def populate_overdue_table(self, data):
-        """填充逾期记录表格"""
+        """填充逾期记录表格 (data 可以是列表，也可以是 iter_query 返回的生成器)"""
         self.table_widget.setRowCount(0)
         if data is None:
             QMessageBox.critical(self, "查询错误", "获取逾期记录时发生错误！")
             return
-        if not data:
-            self.table_widget.setRowCount(1)
-            no_overdue_item = QTableWidgetItem("当前没有逾期未还的记录。")
-            no_overdue_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-            self.table_widget.setItem(0, 0, no_overdue_item)
-            self.table_widget.setSpan(0, 0, 1, self.table_widget.columnCount())
-            return
 
-        self.table_widget.setRowCount(len(data))
-        column_keys = ["FID", "CardNo", "BorrowerName", "BookNo", "BookName", "LentDate", "OverdueDays"]
+        row_count = 0
         for row_index, row_data in enumerate(data):
-            for col_index, key in enumerate(column_keys):
+            if row_index >= self.table_widget.rowCount():
+                # 行数未知，按批扩展，避免逐行 insertRow
+                self.table_widget.setRowCount(row_index + self.ROW_GROW_STEP)
+            for col_index, key in enumerate(self.COLUMN_KEYS):
                 value = row_data.get(key)
                 display_text = ""
                 if value is not None:
@@ -135,6 +144,39 @@ class OverduePage(QWidget):
                      item.setTextAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
 
                 self.table_widget.setItem(row_index, col_index, item)
+            row_count = row_index + 1
+
+        if row_count == 0:
+            self.table_widget.setRowCount(1)
+            no_overdue_item = QTableWidgetItem("当前没有逾期未还的记录。")
+            no_overdue_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+            self.table_widget.setItem(0, 0, no_overdue_item)
+            self.table_widget.setSpan(0, 0, 1, self.table_widget.columnCount())
+        else:
+            self.table_widget.setRowCount(row_count) # 去掉多扩展的空行
+
+    def export_overdue_records(self):
+        """将逾期记录导出为 CSV (边读边写，内存占用与记录数无关)"""
+        default_path = os.path.join(os.path.expanduser("~"), f"逾期记录_{datetime.date.today():%Y%m%d}.csv")
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出逾期记录", default_path, "CSV 文件 (*.csv)")
+        if not file_path:
+            return
+
+        exported_count = 0
+        try:
+            # utf-8-sig 便于 Excel 正确识别中文
+            with open(file_path, 'w', newline='', encoding='utf-8-sig') as csvfile:
+                writer = csv.writer(csvfile)
+                writer.writerow(self.COLUMN_HEADERS)
+                for row_data in iter_query(self.build_overdue_query(), row_format='tuple'):
+                    writer.writerow(row_data) # SELECT 的列顺序与 COLUMN_KEYS 一致
+                    exported_count += 1
+        except Exception as e:
+            QMessageBox.critical(self, "导出错误", f"导出逾期记录时发生错误：\n{e}")
+            return
+
+        QMessageBox.information(self, "导出完成", f"已导出 {exported_count} 条逾期记录到：\n{file_path}")
+
 
 # --- 用于独立测试页面 ---
 if __name__ == '__main__':
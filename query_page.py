@@ -13,7 +13,7 @@ try:
     from db_utils import execute_query
 except ImportError:
     print("错误：无法从 db_utils 导入 execute_query。")
-    def execute_query(query, params=None): return None
+    def execute_query(query, params=None, row_format='dict'): return None
 
 class QueryPage(QWidget):
     def __init__(self, parent=None):
@@ -164,12 +164,12 @@ class QueryPage(QWidget):
 
         final_query += " ORDER BY UpdateTime DESC LIMIT 500"
 
-        print(f"Executing query: {final_query} with params: {params}")
-        results = execute_query(final_query, tuple(params))
+        # 最多 500 行 x 9 列，用元组行格式避免为每行分配字典
+        results = execute_query(final_query, tuple(params), row_format='tuple')
         self.populate_table(results)
 
     def populate_table(self, data):
-        """将查询结果填充到 QTableWidget"""
+        """将查询结果 (execute_query 的 'tuple' 行格式) 填充到 QTableWidget"""
         self.table_widget.setRowCount(0)
 
         if data is None:
@@ -181,9 +181,10 @@ class QueryPage(QWidget):
 
         self.table_widget.setRowCount(len(data))
         column_keys = ["BookNo", "BookType", "BookName", "Publisher", "Year", "Author", "Price", "Total", "Storage"]
+        column_positions = [data.index[key] for key in column_keys] # 列名到元组下标，整个结果只算一次
         for row_index, row_data in enumerate(data):
-            for col_index, key in enumerate(column_keys):
-                value = row_data.get(key)
+            for col_index, (key, position) in enumerate(zip(column_keys, column_positions)):
+                value = row_data[position]
                 display_text = ""
                 if value is None:
                     display_text = ""
@@ -0,0 +1,97 @@
+# query_stats_dialog.py
+# 查询统计：按总耗时列出经由 db_utils 执行的语句 (次数、平均/最大耗时、连接/执行/取数分段、调用位置)
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView
+)
+from PyQt6.QtCore import Qt, QTimer
+
+try:
+    import db_utils
+    from db_utils import query_stats
+except ImportError:
+    print("错误：无法从 db_utils 导入 query_stats。")
+    db_utils = None
+    query_stats = None
+
+REFRESH_INTERVAL_MS = 2000 # 对话框打开期间自动刷新的间隔
+TOP_STATEMENTS = 50
+
+
+class QueryStatsDialog(QDialog):
+    HEADERS = ["语句", "调用位置", "次数", "总耗时 (ms)", "平均 (ms)", "最大 (ms)", "连接/执行/取数 (ms)", "行数", "错误"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("查询统计")
+        self.resize(1100, 600)
+        self.setModal(False) # 非模态，可以一边操作页面一边观察
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(15, 15, 15, 15)
+
+        self.info_label = QLabel()
+        layout.addWidget(self.info_label)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setWordWrap(False)
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        self.refresh_button = QPushButton("刷新")
+        self.refresh_button.clicked.connect(self.refresh)
+        self.reset_button = QPushButton("清零")
+        self.reset_button.clicked.connect(self.reset_stats)
+        self.close_button = QPushButton("关闭")
+        self.close_button.clicked.connect(self.close)
+        button_layout.addWidget(self.refresh_button)
+        button_layout.addWidget(self.reset_button)
+        button_layout.addWidget(self.close_button)
+        layout.addLayout(button_layout)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def showEvent(self, event):
+        self.refresh_timer.start(REFRESH_INTERVAL_MS)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        if query_stats is None:
+            self.info_label.setText("无法加载查询统计 (db_utils 导入失败)。")
+            return
+        self.info_label.setText(f"慢查询阈值 {db_utils.SLOW_QUERY_MS} ms，日志文件: {db_utils.SLOW_QUERY_LOG}")
+        entries = query_stats.top(TOP_STATEMENTS)
+        self.table.setRowCount(len(entries))
+        for row, entry in enumerate(entries):
+            count = entry['count']
+            callers = ", ".join(f"{caller} ({n})" for caller, n in entry['callers'])
+            phases = f"{entry['connect_ms']:.1f} / {entry['execute_ms']:.1f} / {entry['fetch_ms']:.1f}"
+            values = [entry['statement'], callers, str(count), f"{entry['total_ms']:.1f}",
+                      f"{entry['total_ms'] / count:.2f}", f"{entry['max_ms']:.2f}", phases,
+                      str(entry['rows']), str(entry['errors'])]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column == 0:
+                    item.setToolTip(value) # 长语句在提示中显示全文
+                elif column >= 2:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, column, item)
+
+    def reset_stats(self):
+        if query_stats is not None:
+            query_stats.reset()
+        self.refresh()
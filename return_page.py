@@ -8,13 +8,22 @@ from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QFont, QColor
 import datetime
 
+import metrics
+
 # 假设 db_utils.py 在可访问路径
 try:
-    from db_utils import execute_query, execute_modify
+    from db_utils import execute_query, execute_modify, execute_prepared_query, execute_prepared_modify
 except ImportError as e:
     print(f"错误：导入数据库工具时出错 - {e}")
     def execute_query(query, params=None): return None
     def execute_modify(query, params=None): return None
+    def execute_prepared_query(query, params=None): return None
+    def execute_prepared_modify(query, params=None): return None
+try:
+    from desk_replica import get_desk
+except ImportError as e:
+    print(f"错误：导入借还台离线模式时出错 - {e}")
+    def get_desk(): return None
 
 class ReturnPage(QWidget):
     def __init__(self, parent=None):
@@ -117,8 +126,13 @@ class ReturnPage(QWidget):
             self.reset_return_state()
             return
 
-        card_query = "SELECT Name, Department, CardType FROM LibraryCard WHERE CardNo = %s"
-        card_info = execute_query(card_query, (card_no,))
+        desk = get_desk()
+        if desk is not None: # 离线借还模式：从本地副本读取
+            card = desk.find_card(card_no)
+            card_info = [card] if card else None
+        else:
+            card_query = "SELECT Name, Department, CardType FROM LibraryCard WHERE CardNo = %s"
+            card_info = execute_prepared_query(card_query, (card_no,))
         if not card_info:
             QMessageBox.warning(self, "查询失败", f"未找到卡号为 '{card_no}' 的借书证！")
             self.reset_return_state()
@@ -132,6 +146,11 @@ class ReturnPage(QWidget):
         self.book_no_input.setFocus()
 
         self.load_current_borrowed_books(card_no)
+        if desk is not None and desk.online is False: # 中心库不可用时跳过借阅习惯和推荐，避免等待连接超时
+            self.most_common_book_type = None
+            self.habit_label.setText("最常借阅类别: 中心库连接中断，暂不可用")
+            self.recommendation_group.setVisible(False)
+            return
         self.load_borrowing_habit(card_no)
 
         if self.most_common_book_type:
@@ -142,19 +161,24 @@ class ReturnPage(QWidget):
 
     def load_current_borrowed_books(self, card_no):
         """根据卡号加载当前借阅中的图书列表"""
-        records_query = """
-        SELECT lr.FID, lr.BookNo, b.BookName, b.Author, lr.LentDate
-        FROM LibraryRecords lr
-        JOIN Books b ON lr.BookNo = b.BookNo
-        WHERE lr.CardNo = %s AND lr.ReturnDate IS NULL
-        ORDER BY lr.LentDate ASC
-        """
-        results = execute_query(records_query, (card_no,))
+        desk = get_desk()
+        if desk is not None:
+            results = desk.open_loans(card_no)
+        else:
+            records_query = """
+            SELECT lr.FID, lr.BookNo, b.BookName, b.Author, lr.LentDate
+            FROM LibraryRecords lr
+            JOIN Books b ON lr.BookNo = b.BookNo
+            WHERE lr.CardNo = %s AND lr.ReturnDate IS NULL
+            ORDER BY lr.LentDate ASC
+            """
+            results = execute_query(records_query, (card_no,))
         self.populate_borrowed_table(results)
         self.current_borrowed_records.clear()
         if results:
             for record in results:
-                self.current_borrowed_records[record['FID']] = record
+                # 离线模式下尚未同步的借书没有 FID，改用本地副本的 LoanID
+                self.current_borrowed_records[record.get('LoanID', record['FID'])] = record
 
     def populate_borrowed_table(self, data):
         """填充当前借阅表格"""
@@ -173,6 +197,8 @@ class ReturnPage(QWidget):
                         display_text = value.strftime('%Y-%m-%d %H:%M')
                     else:
                         display_text = str(value)
+                elif key == "FID" and row_data.get('SyncStatus'): # 离线模式下尚未同步到中心库的借书
+                    display_text = "冲突" if row_data['SyncStatus'] == 'conflict' else "待同步"
                 item = QTableWidgetItem(display_text)
                 if col_index == 0:
                     item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
@@ -265,23 +291,26 @@ class ReturnPage(QWidget):
             QMessageBox.warning(self, "操作失败", f"卡号 {self.current_card_no} 当前未借阅书号为 '{book_no_to_return}' 的图书，或该书已还。")
             return
 
+        desk = get_desk()
+        if desk is not None: # 离线借还模式：record_fid 为本地副本的 LoanID
+            error = desk.return_book(record_fid)
+            if error:
+                QMessageBox.warning(self, "操作失败", error)
+                return
+            metrics.CIRCULATION.inc(operation='return')
+            self.return_succeeded(book_no_to_return, record_to_return)
+            return
+
         # --- 执行还书 ---
         update_record_sql = "UPDATE LibraryRecords SET ReturnDate = %s WHERE FID = %s AND ReturnDate IS NULL"
         update_stock_sql = "UPDATE Books SET Storage = Storage + 1 WHERE BookNo = %s"
         return_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
         try:
-            execute_modify(update_record_sql, (return_date, record_fid))
-            execute_modify(update_stock_sql, (book_no_to_return,))
-
-            book_name = record_to_return.get('BookName', '未知书名')
-            QMessageBox.information(self, "操作成功", f"图书 '{book_name}' (ID: {book_no_to_return})\n已成功归还！")
-            self.book_no_input.clear()
-            self.load_current_borrowed_books(self.current_card_no) # 刷新列表
-             # 还书后也重新加载推荐
-            if self.most_common_book_type:
-                 self.load_recommendations(self.current_card_no, self.most_common_book_type)
-            self.book_no_input.setFocus()
+            execute_prepared_modify(update_record_sql, (return_date, record_fid))
+            execute_prepared_modify(update_stock_sql, (book_no_to_return,))
+            metrics.CIRCULATION.inc(operation='return')
+            self.return_succeeded(book_no_to_return, record_to_return)
 
         except Exception as e:
             QMessageBox.critical(self, "数据库错误", f"还书操作失败：\n{e}")
@@ -297,6 +326,17 @@ class ReturnPage(QWidget):
                  print(f"!!! 严重错误：回滚借阅记录 {record_fid} 的 ReturnDate 失败：{rollback_e} !!! 数据可能不一致！")
                  QMessageBox.critical(self, "严重错误", "还书操作失败，且记录状态回滚失败！请联系管理员处理。")
 
+    def return_succeeded(self, book_no, record):
+        """还书成功后提示并刷新借阅列表和推荐"""
+        book_name = record.get('BookName', '未知书名')
+        QMessageBox.information(self, "操作成功", f"图书 '{book_name}' (ID: {book_no})\n已成功归还！")
+        self.book_no_input.clear()
+        self.load_current_borrowed_books(self.current_card_no) # 刷新列表
+        # 还书后也重新加载推荐
+        if self.most_common_book_type:
+            self.load_recommendations(self.current_card_no, self.most_common_book_type)
+        self.book_no_input.setFocus()
+
 # --- 用于独立测试页面 ---
 if __name__ == '__main__':
     import sys
@@ -45,4 +45,14 @@ CREATE TABLE LibraryRecords (
     FOREIGN KEY (CardNo) REFERENCES LibraryCard(CardNo) ON DELETE CASCADE ON UPDATE CASCADE, -- 外键约束
     FOREIGN KEY (BookNo) REFERENCES Books(BookNo) ON DELETE CASCADE ON UPDATE CASCADE,       -- 外键约束
     FOREIGN KEY (Operator) REFERENCES Users(UserID) ON DELETE CASCADE ON UPDATE CASCADE      -- 外键约束 (如果管理员被删除，记录保留但经手人设为NULL)
-);
\ No newline at end of file
+);
+
+-- 5.图书详情（BookDetails），由 book_enrichment.py 从豆瓣详情页补充
+CREATE TABLE BookDetails (
+    BookNo VARCHAR(50) PRIMARY KEY,        -- 书号（主键，外键关联Books）
+    ISBN VARCHAR(20),                      -- ISBN
+    Pages INT,                             -- 页数
+    Tags VARCHAR(255),                     -- 豆瓣常用标签（逗号分隔，第一个用作图书类别）
+    UpdateTime DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP, -- 补充或更新时间
+    FOREIGN KEY (BookNo) REFERENCES Books(BookNo) ON DELETE CASCADE ON UPDATE CASCADE
+);
@@ -5,20 +5,14 @@ from PyQt6.QtWidgets import QSplashScreen, QApplication
 from PyQt6.QtGui import QPixmap, QPainter, QColor, QFont
 from PyQt6.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, pyqtProperty, pyqtSignal
 
-# Import the resource_path function (assuming it's in main_window or a utils file)
-# If it's in main_window.py, you might need to adjust the import structure slightly
-# or duplicate the function here for standalone testing.
-try:
-    # Adjust this import based on your project structure
-    from main_window import resource_path
-except ImportError:
-    # Fallback if running standalone or structure differs
-    def resource_path(relative_path):
-        try:
-            base_path = sys._MEIPASS
-        except Exception:
-            base_path = os.path.abspath(os.path.dirname(__file__))
-        return os.path.join(base_path, relative_path)
+# Same as main_window.resource_path. Importing it from main_window would re-run the whole
+# main_window module (as a second copy) when the app is started with `python main_window.py`.
+def resource_path(relative_path):
+    try:
+        base_path = sys._MEIPASS
+    except Exception:
+        base_path = os.path.abspath(os.path.dirname(__file__))
+    return os.path.join(base_path, relative_path)
 
 class SplashScreen(QSplashScreen):
     # Signal emitted when the splash screen has finished its fade-out
@@ -0,0 +1,482 @@
+# sqlite_backend.py
+# 嵌入式 SQLite 后端：在没有 MySQL 服务器的开发机上运行程序和测试 (LIBRARY_DB_BACKEND=sqlite，见 db_utils)。
+# connect() 返回的连接/游标模仿 mysql.connector 的接口 (cursor(dictionary=...)、column_names、autocommit、
+# start_transaction 等)，出错时抛出 mysql.connector 的异常类型，所以 db_utils 和各页面的代码无需改动。
+# 程序中的 MySQL 方言在执行前翻译为 SQLite：
+#   - 参数占位符 %s / %(name)s -> ? / :name，<=> -> IS，INSERT IGNORE -> INSERT OR IGNORE
+#   - ON DUPLICATE KEY UPDATE col = VALUES(col) -> ON CONFLICT DO UPDATE SET col = excluded.col (需要 SQLite 3.35+)
+#   - LIKE 默认以反斜杠转义 (与 MySQL 相同)；INTERVAL n DAY 改为 DATE_SUB/DATE_ADD 的两个参数
+#   - CURDATE、NOW、DATEDIFF、DATE_SUB、DATE_ADD、CONCAT、CONCAT_WS、REGEXP 注册为 Python 函数
+# 表结构由 schema.sql 翻译而来 (AUTO_INCREMENT、DEFAULT CURRENT_TIMESTAMP)，
+# ON UPDATE CURRENT_TIMESTAMP 用 AFTER UPDATE 触发器实现，只在其他列的值确实改变时更新时间。
+import os
+import re
+import sqlite3
+import datetime
+import calendar
+import functools
+import threading
+from decimal import Decimal
+
+from mysql.connector import errors
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+BUSY_TIMEOUT = 10 # 秒，等待其他连接释放写锁的时间
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+LOCAL_NOW_SQL = "(datetime('now', 'localtime'))" # SQLite 的 CURRENT_TIMESTAMP 是 UTC，MySQL 是本地时间
+# 不带冲突目标的 ON CONFLICT DO UPDATE (ON DUPLICATE KEY UPDATE 的翻译) 从 SQLite 3.35 起才支持
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+
+def check_sqlite_version():
+    """选用 SQLite 后端时检查 Python 自带的 SQLite 版本，太旧时给出明确的错误，而不是执行到 upsert 才报语法错误"""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        required = ".".join(map(str, MIN_SQLITE_VERSION))
+        raise RuntimeError(f"SQLite 后端需要 SQLite {required} 或更高版本，当前为 {sqlite3.sqlite_version}")
+
+# --- 类型转换：DATETIME/DATE/DECIMAL 列按 MySQL 的 Python 类型返回 ---
+
+sqlite3.register_adapter(datetime.datetime, lambda value: value.strftime(DATETIME_FORMAT))
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_converter('DATETIME', lambda value: datetime.datetime.fromisoformat(value.decode()))
+sqlite3.register_converter('DATE', lambda value: datetime.date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter('DECIMAL', lambda value: Decimal(value.decode()))
+
+# --- MySQL 函数 ---
+
+def _to_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        value = str(int(value))
+    return datetime.datetime.fromisoformat(str(value).strip())
+
+def _shift_months(value, months):
+    month = value.month - 1 + months
+    year, month = value.year + month // 12, month % 12 + 1
+    return value.replace(year=year, month=month, day=min(value.day, calendar.monthrange(year, month)[1]))
+
+INTERVAL_UNITS = {
+    'SECOND': lambda value, n: value + datetime.timedelta(seconds=n),
+    'MINUTE': lambda value, n: value + datetime.timedelta(minutes=n),
+    'HOUR': lambda value, n: value + datetime.timedelta(hours=n),
+    'DAY': lambda value, n: value + datetime.timedelta(days=n),
+    'WEEK': lambda value, n: value + datetime.timedelta(weeks=n),
+    'MONTH': lambda value, n: _shift_months(value, n),
+    'YEAR': lambda value, n: _shift_months(value, 12 * n),
+}
+TIME_UNITS = ('SECOND', 'MINUTE', 'HOUR')
+
+def _date_add(value, amount, unit, sign=1):
+    """DATE_ADD/DATE_SUB(日期, n, '单位')：纯日期且按天以上的单位时返回日期，否则返回日期时间 (与 MySQL 相同)"""
+    if value is None or amount is None:
+        return None
+    moment = _to_datetime(value)
+    result = INTERVAL_UNITS[unit.upper()](moment, sign * int(amount))
+    if len(str(value).strip()) <= 10 and unit.upper() not in TIME_UNITS:
+        return result.date().isoformat()
+    return result.strftime(DATETIME_FORMAT)
+
+def _datediff(end, start):
+    if end is None or start is None:
+        return None
+    return (_to_datetime(end).date() - _to_datetime(start).date()).days
+
+def _concat(*values):
+    if any(value is None for value in values):
+        return None
+    return "".join(str(value) for value in values)
+
+def _concat_ws(separator, *values):
+    if separator is None:
+        return None
+    return str(separator).join(str(value) for value in values if value is not None)
+
+@functools.lru_cache(maxsize=64)
+def _compile_regexp(pattern):
+    return re.compile(pattern, re.IGNORECASE) # MySQL 默认排序规则下 REGEXP 不区分大小写
+
+def _regexp(pattern, value):
+    if pattern is None or value is None:
+        return None
+    return 1 if _compile_regexp(pattern).search(str(value)) else 0
+
+FUNCTIONS = (
+    ('CURDATE', 0, lambda: datetime.date.today().isoformat(), False),
+    ('NOW', 0, lambda: datetime.datetime.now().strftime(DATETIME_FORMAT), False),
+    ('DATEDIFF', 2, _datediff, True),
+    ('DATE_ADD', 3, _date_add, True),
+    ('DATE_SUB', 3, lambda value, amount, unit: _date_add(value, amount, unit, -1), True),
+    ('CONCAT', -1, _concat, True),
+    ('CONCAT_WS', -1, _concat_ws, True),
+    ('REGEXP', 2, _regexp, True),
+)
+
+# --- SQL 翻译 ---
+
+_TOKEN_RE = re.compile(r"""
+    (?P<string>'(?:[^'\\]|\\.|'')*')
+  | (?P<quoted>`[^`]*`|"(?:[^"\\]|\\.)*")
+  | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+  | (?P<param>%s|%\((?P<name>\w+)\)s)
+  | (?P<op><=>)
+  | (?P<word>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<space>\s+)
+  | (?P<other>.)
+""", re.S | re.X)
+
+_MYSQL_ESCAPES = {'0': '\0', 'b': '\b', 'n': '\n', 'r': '\r', 't': '\t', 'Z': '\x1a'}
+
+def _string_literal(token):
+    """MySQL 字符串字面量 (反斜杠转义) -> SQLite 字面量；\\% 和 \\_ 保留反斜杠，供 LIKE 转义使用"""
+    body = token[1:-1]
+    if '\\' not in body:
+        return token
+    body = re.sub(r"\\(.)", lambda m: ('\\' + m.group(1)) if m.group(1) in '%_'
+                  else _MYSQL_ESCAPES.get(m.group(1), m.group(1)), body.replace("''", "\\'"), flags=re.S)
+    return "'" + body.replace("'", "''") + "'"
+
+def _tokenize(query):
+    tokens = []
+    for match in _TOKEN_RE.finditer(query):
+        kind = match.lastgroup
+        if kind == 'name': # %(name)s 的分组名
+            kind = 'param'
+        if kind == 'comment':
+            kind, text = 'space', ' '
+        elif kind == 'param':
+            text = f":{match.group('name')}" if match.group('name') else '?'
+        elif kind == 'string':
+            text = _string_literal(match.group())
+        else:
+            text = match.group()
+        tokens.append([kind, text])
+    return tokens
+
+def _next_word(tokens, i):
+    """i 之后第一个非空白 token 的下标 (没有时返回 len(tokens))"""
+    i += 1
+    while i < len(tokens) and tokens[i][0] == 'space':
+        i += 1
+    return i
+
+def _upper(tokens, i):
+    return tokens[i][1].upper() if i < len(tokens) and tokens[i][0] == 'word' else None
+
+@functools.lru_cache(maxsize=512)
+def translate(query):
+    """把 MySQL 方言的 SQL 翻译为 SQLite (结果按 SQL 文本缓存)"""
+    tokens = _tokenize(query)
+    out = []
+    upsert = False # 位于 ON DUPLICATE KEY UPDATE 之后
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        word = text.upper() if kind == 'word' else None
+        if kind == 'op':
+            out.append('IS')
+        elif word == 'INSERT' and _upper(tokens, _next_word(tokens, i)) == 'IGNORE':
+            out.append('INSERT OR IGNORE')
+            i = _next_word(tokens, i)
+        elif word == 'ON' and _upper(tokens, _next_word(tokens, i)) == 'DUPLICATE':
+            # ON DUPLICATE KEY UPDATE
+            j = _next_word(tokens, _next_word(tokens, _next_word(tokens, i)))
+            out.append('ON CONFLICT DO UPDATE SET')
+            upsert = True
+            i = j
+        elif word == 'VALUES' and upsert and tokens[_next_word(tokens, i)][1] == '(':
+            # VALUES(col) -> excluded.col
+            j = _next_word(tokens, i)
+            column = _next_word(tokens, j)
+            close = _next_word(tokens, column)
+            out.append(f"excluded.{tokens[column][1]}")
+            i = close
+        elif word == 'INTERVAL':
+            # INTERVAL <表达式> <单位> -> <表达式>, '<单位>'
+            j = _next_word(tokens, i)
+            expression = []
+            while j < len(tokens) and _upper(tokens, j) not in INTERVAL_UNITS:
+                expression.append(tokens[j][1])
+                j += 1
+            out.append(f"{''.join(expression).strip()}, '{_upper(tokens, j)}'")
+            i = j
+        elif word == 'LIKE':
+            # MySQL 的 LIKE 默认以反斜杠为转义符，SQLite 需要显式写出 ESCAPE
+            j = _next_word(tokens, i)
+            out.append(text)
+            out.extend(token[1] for token in tokens[i + 1:j + 1])
+            if tokens[j][0] in ('param', 'string') and _upper(tokens, _next_word(tokens, j)) != 'ESCAPE':
+                out.append(" ESCAPE '\\'")
+            i = j
+        else:
+            out.append(text)
+        i += 1
+    return "".join(out)
+
+# --- 表结构翻译 ---
+
+def load_schema_statements(path=SCHEMA_PATH):
+    """读取 schema.sql 中的建表语句 (去掉注释以及 CREATE DATABASE / USE)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = "\n".join(line.split('--', 1)[0] for line in f)
+    statements = []
+    for statement in text.split(';'):
+        statement = " ".join(statement.split())
+        if statement and not statement.upper().startswith(('CREATE DATABASE', 'USE ')):
+            statements.append(statement)
+    return statements
+
+_CREATE_TABLE_RE = re.compile(r"CREATE TABLE\s+(?:IF NOT EXISTS\s+)?`?(\w+)`?\s*\((.*)\)[^)]*$", re.I | re.S)
+_ON_UPDATE_RE = re.compile(r"\s+ON UPDATE CURRENT_TIMESTAMP(?:\(\))?", re.I)
+_CONSTRAINT_WORDS = ('PRIMARY', 'FOREIGN', 'UNIQUE', 'KEY', 'INDEX', 'CONSTRAINT', 'CHECK')
+
+def _split_definitions(body):
+    """按顶层逗号拆分列定义 (DECIMAL(10, 2) 中的逗号不拆)"""
+    parts, depth, current = [], 0, []
+    for char in body:
+        if char == ',' and depth == 0:
+            parts.append("".join(current).strip())
+            current = []
+            continue
+        depth += (char == '(') - (char == ')')
+        current.append(char)
+    parts.append("".join(current).strip())
+    return [part for part in parts if part]
+
+def translate_schema_statement(statement):
+    """CREATE TABLE -> [SQLite 建表语句, ON UPDATE CURRENT_TIMESTAMP 对应的触发器...]"""
+    match = _CREATE_TABLE_RE.match(statement.strip())
+    if not match:
+        return [statement]
+    table, body = match.groups()
+    definitions, columns, on_update = [], [], []
+    for definition in _split_definitions(body):
+        definition = definition.replace('`', '')
+        first = definition.split()[0].upper()
+        if first not in _CONSTRAINT_WORDS:
+            columns.append(definition.split()[0])
+            if _ON_UPDATE_RE.search(definition):
+                on_update.append(columns[-1])
+                definition = _ON_UPDATE_RE.sub('', definition)
+            definition = re.sub(r"\bINT(?:EGER)?\s+(?:NOT NULL\s+)?AUTO_INCREMENT\s+PRIMARY KEY\b",
+                                "INTEGER PRIMARY KEY AUTOINCREMENT", definition, flags=re.I)
+            definition = re.sub(r"\bDEFAULT CURRENT_TIMESTAMP(?:\(\))?", f"DEFAULT {LOCAL_NOW_SQL}", definition, flags=re.I)
+        elif first in ('KEY', 'INDEX'):
+            continue # 普通索引在 SQLite 中需要单独的 CREATE INDEX，本地库不需要
+        definitions.append(definition)
+    statements = [f"CREATE TABLE {table} (\n    " + ",\n    ".join(definitions) + "\n)"]
+    for column in on_update:
+        changed = " OR ".join(f"NEW.{other} IS NOT OLD.{other}" for other in columns if other != column)
+        statements.append(
+            f"CREATE TRIGGER {table}_{column}_on_update AFTER UPDATE ON {table} FOR EACH ROW "
+            f"WHEN NEW.{column} IS OLD.{column} AND ({changed}) "
+            f"BEGIN UPDATE {table} SET {column} = {LOCAL_NOW_SQL} WHERE rowid = NEW.rowid; END")
+    return statements
+
+def schema_statements(path=SCHEMA_PATH):
+    return [translated for statement in load_schema_statements(path) for translated in translate_schema_statement(statement)]
+
+# --- 错误类型：映射为 mysql.connector 的异常，调用方的 except Error 照常生效 ---
+
+def _mysql_error(e):
+    if isinstance(e, sqlite3.IntegrityError):
+        error_class = errors.IntegrityError
+    elif isinstance(e, sqlite3.OperationalError):
+        error_class = errors.OperationalError
+    elif isinstance(e, (sqlite3.ProgrammingError, sqlite3.InterfaceError)):
+        error_class = errors.ProgrammingError
+    else:
+        error_class = errors.DatabaseError
+    return error_class(msg=str(e))
+
+# --- 连接与游标 ---
+
+class Cursor:
+    """模仿 mysql.connector 游标 (buffered/prepared 参数被忽略：SQLite 本来就逐行读取并缓存已编译的语句)"""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._cursor = connection._raw.cursor()
+        self._dictionary = dictionary
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def with_rows(self):
+        return self._cursor.description is not None
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, query, params=()):
+        self._connection._begin_implicit()
+        try:
+            self._cursor.execute(translate(query), params or ())
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def executemany(self, query, seq_params):
+        self._connection._begin_implicit()
+        try:
+            self._cursor.executemany(translate(query), seq_params)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def _rows(self, rows):
+        if not self._dictionary:
+            return rows
+        names = self.column_names
+        return [dict(zip(names, row)) for row in rows]
+
+    def fetchone(self):
+        try:
+            row = self._cursor.fetchone()
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+        return self._rows([row])[0] if row is not None else None
+
+    def fetchmany(self, size=1):
+        try:
+            return self._rows(self._cursor.fetchmany(size))
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def fetchall(self):
+        try:
+            return self._rows(self._cursor.fetchall())
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """模仿 mysql.connector 连接：默认非自动提交，第一条语句隐式开始事务，commit/rollback 结束事务"""
+
+    unread_result = False # SQLite 游标之间互不阻塞，没有未读完的结果集
+
+    def __init__(self, path, timeout=BUSY_TIMEOUT):
+        self.path = path
+        # 事务由本类自己控制 (isolation_level=None)；长连接可能在别的线程中关闭，不检查线程
+        self._raw = sqlite3.connect(path, timeout=timeout, detect_types=sqlite3.PARSE_DECLTYPES,
+                                    isolation_level=None, check_same_thread=False)
+        self._autocommit = False
+        self._closed = False
+        self._raw.execute("PRAGMA foreign_keys = ON") # 外键 (含 ON DELETE CASCADE) 默认关闭
+        self._raw.execute("PRAGMA synchronous = NORMAL")
+        for name, arguments, function, deterministic in FUNCTIONS:
+            self._raw.create_function(name, arguments, function, deterministic=deterministic)
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if value and self._raw.in_transaction: # 与 MySQL 相同，打开自动提交时提交当前事务
+            self.commit()
+        self._autocommit = bool(value)
+
+    @property
+    def in_transaction(self):
+        return self._raw.in_transaction
+
+    def _begin_implicit(self):
+        if self._closed:
+            raise errors.OperationalError(msg="连接已关闭")
+        if not self._autocommit and not self._raw.in_transaction:
+            self._raw.execute("BEGIN")
+
+    def start_transaction(self):
+        if self._raw.in_transaction:
+            raise errors.ProgrammingError(msg="Transaction already in progress")
+        self._raw.execute("BEGIN")
+
+    def cursor(self, dictionary=False, buffered=None, prepared=False, **kwargs):
+        if self._closed:
+            raise errors.OperationalError(msg="连接已关闭")
+        return Cursor(self, dictionary=dictionary)
+
+    def commit(self):
+        try:
+            if self._raw.in_transaction:
+                self._raw.execute("COMMIT")
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def rollback(self):
+        try:
+            if self._raw.in_transaction:
+                self._raw.execute("ROLLBACK")
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def is_connected(self):
+        return not self._closed
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if self._closed:
+            raise errors.InterfaceError(msg="连接已关闭")
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._raw.close() # 未提交的事务随之回滚
+
+# 每个数据库文件只在本进程第一次连接时检查一次表结构
+_initialized = set()
+_initialized_lock = threading.Lock()
+
+def ensure_schema(connection):
+    """数据库文件中还没有表时按 schema.sql 建表，并切换为 WAL 模式 (读写互不阻塞)"""
+    raw = connection._raw
+    if raw.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]:
+        return
+    raw.execute("PRAGMA journal_mode = WAL")
+    raw.execute("BEGIN IMMEDIATE")
+    try:
+        if not raw.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]:
+            for statement in schema_statements():
+                raw.execute(statement)
+        raw.execute("COMMIT")
+    except sqlite3.Error:
+        raw.execute("ROLLBACK")
+        raise
+
+def connect(path, timeout=BUSY_TIMEOUT):
+    """打开 (必要时创建) SQLite 数据库文件，返回与 mysql.connector 连接接口相同的连接"""
+    try:
+        connection = Connection(path, timeout)
+        key = os.path.abspath(path)
+        if key not in _initialized:
+            with _initialized_lock:
+                if key not in _initialized:
+                    ensure_schema(connection)
+                    _initialized.add(key)
+        return connection
+    except sqlite3.Error as e:
+        raise _mysql_error(e) from e
+
+def forget(path):
+    """数据库文件被删除或替换后调用，下次连接时重新检查表结构"""
+    with _initialized_lock:
+        _initialized.discard(os.path.abspath(path))
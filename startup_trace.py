@@ -0,0 +1,83 @@
+# startup_trace.py
+# 启动耗时跟踪：main_window.py 在启动过程中依次调用 TRACE.mark(阶段名)，每个阶段的耗时为距上一次 mark 的时间；
+# 首次绘制主窗口时调用 TRACE.finish()。设置环境变量 LIBRARY_STARTUP_TRACE=<报告路径> 时把各阶段耗时写成 JSON 报告，
+# 另设 LIBRARY_STARTUP_EXIT=1 时写完报告后直接退出 (启动耗时预算测试用)。
+# 计时从本模块首次导入开始 (main_window 的第一条语句)，不含解释器自身的启动时间。
+import os
+import json
+import time
+import importlib
+
+TRACE_ENV = 'LIBRARY_STARTUP_TRACE'
+EXIT_ENV = 'LIBRARY_STARTUP_EXIT'
+
+# 启动耗时预算 (毫秒)，由 run_test.py 中的测试检查；不含启动画面刻意停留的时间 (idle 阶段)
+IMPORT_BUDGET_MS = 1500 # import.* 阶段合计
+STARTUP_BUDGET_MS = 5000 # 到主窗口首次绘制的合计
+
+# 页面模块会间接导入的重型依赖，先单独导入以便在报告中分别计时
+HEAVY_MODULES = ('mysql.connector', 'requests', 'bs4', 'lxml.html', 'numpy')
+
+
+class StartupTracer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.phases = [] # {'name', 'start_ms', 'duration_ms', 'idle'}
+        self.events = {} # 名称 -> {'at_ms', 'duration_ms'}，只记录第一次
+        self.finished = False
+
+    def mark(self, name, idle=False):
+        """结束一个阶段：耗时为距上一次 mark 的时间；idle=True 表示刻意等待 (如启动画面停留)，不计入预算"""
+        if self.finished:
+            return
+        now = time.perf_counter()
+        self.phases.append({'name': name, 'start_ms': round((self.last - self.start) * 1000, 2),
+                            'duration_ms': round((now - self.last) * 1000, 2), 'idle': idle})
+        self.last = now
+
+    def event(self, name, duration_s):
+        """记录启动过程中第一次发生的事件 (如首次数据库连接)，它包含在某个阶段之内"""
+        if not self.finished and name not in self.events:
+            self.events[name] = {'at_ms': round((time.perf_counter() - self.start) * 1000, 2),
+                                 'duration_ms': round(duration_s * 1000, 2)}
+
+    def import_modules(self, names=HEAVY_MODULES):
+        """逐个导入模块并各记一个 import.<模块> 阶段；未安装的模块跳过"""
+        for name in names:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                continue
+            self.mark(f"import.{name}")
+
+    def report(self):
+        busy = [phase for phase in self.phases if not phase['idle']]
+        return {
+            'phases': list(self.phases),
+            'events': dict(self.events),
+            'total_ms': round((self.last - self.start) * 1000, 2),
+            'import_ms': round(sum(p['duration_ms'] for p in busy if p['name'].startswith('import.')), 2),
+            'busy_ms': round(sum(p['duration_ms'] for p in busy), 2),
+            'budget': {'import_ms': IMPORT_BUDGET_MS, 'startup_ms': STARTUP_BUDGET_MS},
+        }
+
+    def finish(self, name='first_paint'):
+        """记录最后一个阶段并停止跟踪；启用时写出报告，返回报告字典"""
+        if self.finished:
+            return None
+        self.mark(name)
+        self.finished = True
+        report = self.report()
+        path = os.environ.get(TRACE_ENV)
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"启动耗时 {report['busy_ms']:.0f} ms (导入 {report['import_ms']:.0f} ms)，报告已写入 {path}")
+        return report
+
+    @staticmethod
+    def exit_requested():
+        return bool(os.environ.get(EXIT_ENV))
+
+TRACE = StartupTracer()
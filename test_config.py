@@ -1,7 +1,10 @@
 # test_config.py
+import os
+
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'root', # Or a dedicated test user
     'password': 'masterforliage20031003', # Your MySQL password
-    'database': 'test_library_system' # <<< Name of your TEST database
+    # <<< Name of your TEST database; run_test.py -j N points each worker at its own copy via LIBRARY_TEST_DATABASE
+    'database': os.environ.get('LIBRARY_TEST_DATABASE', 'test_library_system')
 }
\ No newline at end of file
@@ -0,0 +1,163 @@
+# ui_watchdog.py
+# 界面卡顿检测与按需性能分析。
+# UIWatchdog: 界面线程中的心跳定时器每 HEARTBEAT_MS 毫秒记录一次时间，后台监视线程发现心跳停顿超过
+# 阈值时抓取界面线程当时的 Python 调用栈和正在执行的槽函数；事件循环恢复后把卡顿时长、槽函数和调用栈
+# 以 JSON 行写入滚动日志 (ui_stalls.log)，同时更新 metrics 中的事件循环延迟和卡顿计数。
+# GuiProfiler: 在界面线程上开关 cProfile，停止时保存 .prof 文件 (可用 snakeviz / pstats 查看)；
+# 需要连同原生代码一起采样时，可对 os.getpid() 运行 py-spy record --pid <pid>。
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import logging.handlers
+import threading
+import traceback
+
+from PyQt6.QtCore import QObject, QTimer
+
+import metrics
+
+HEARTBEAT_MS = 100 # 心跳间隔；超出间隔的延迟即界面线程忙碌的时间
+STALL_THRESHOLD_MS = int(os.environ.get('LIBRARY_UI_STALL_MS', 500)) # 超过该延迟视为一次卡顿
+STALL_LOG = 'ui_stalls.log'
+STALL_LOG_BYTES = 5 * 1024 * 1024
+STALL_LOG_BACKUPS = 3
+PROFILE_DIR = 'profiles'
+
+
+def find_slot(frames):
+    """在界面线程的调用栈 (由外到内的 FrameSummary 列表) 中找出由事件循环直接调用的槽函数。
+
+    Qt 的 C++ 栈帧不可见，槽函数的上一个 Python 栈帧就是调用 exec() 的那一行 (app.exec()、dialog.exec())；
+    嵌套事件循环时取最内层的一个。找不到时返回最外层之后的第一个栈帧。
+    """
+    slot = None
+    for outer, inner in zip(frames, frames[1:]):
+        if 'exec(' in (outer.line or ''):
+            slot = inner
+    if slot is None and len(frames) > 1:
+        slot = frames[1]
+    if slot is None:
+        return "?"
+    return f"{os.path.splitext(os.path.basename(slot.filename))[0]}.{slot.name}"
+
+
+class UIWatchdog(QObject):
+    """界面事件循环的卡顿检测器，须在界面线程中创建和启动"""
+
+    def __init__(self, threshold_ms=STALL_THRESHOLD_MS, log_path=STALL_LOG, parent=None):
+        super().__init__(parent)
+        self.threshold = threshold_ms / 1000
+        self.log_path = log_path
+        self.gui_thread_id = threading.get_ident()
+        self.lock = threading.Lock()
+        self.last_beat = time.perf_counter()
+        self.capture = None # 本次卡顿中监视线程抓到的 (槽函数, 调用栈)，恢复后写日志
+        self.stop_event = threading.Event()
+        self.monitor = None
+        self.log = None
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.beat)
+
+    def start(self):
+        self.last_beat = time.perf_counter()
+        self.stop_event.clear()
+        self.timer.start(HEARTBEAT_MS)
+        self.monitor = threading.Thread(target=self._watch, name='ui-watchdog', daemon=True)
+        self.monitor.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.stop_event.set()
+        if self.monitor is not None:
+            self.monitor.join()
+            self.monitor = None
+        if self.log is not None:
+            for handler in list(self.log.handlers):
+                self.log.removeHandler(handler)
+                handler.close()
+            self.log = None
+
+    def beat(self):
+        """心跳 (界面线程)：记录事件循环延迟，刚结束的卡顿写入日志"""
+        now = time.perf_counter()
+        with self.lock:
+            lag = max(now - self.last_beat - HEARTBEAT_MS / 1000, 0.0)
+            self.last_beat = now
+            capture, self.capture = self.capture, None
+        metrics.UI_EVENT_LOOP_LAG_SECONDS.observe(lag)
+        if lag > self.threshold:
+            metrics.UI_STALLS.inc()
+            slot, stack = capture if capture else ("?", [])
+            self._log_stall(lag, slot, stack)
+
+    def _watch(self):
+        """监视线程：心跳停顿超过阈值时抓取一次界面线程的调用栈"""
+        interval = min(self.threshold / 4, HEARTBEAT_MS / 1000)
+        while not self.stop_event.wait(interval):
+            with self.lock:
+                if self.capture is not None or time.perf_counter() - self.last_beat - HEARTBEAT_MS / 1000 <= self.threshold:
+                    continue
+            frame = sys._current_frames().get(self.gui_thread_id)
+            if frame is None:
+                continue
+            frames = traceback.extract_stack(frame)
+            del frame
+            capture = (find_slot(frames), traceback.format_list(frames))
+            with self.lock:
+                if self.capture is None:
+                    self.capture = capture
+
+    def _log_stall(self, lag, slot, stack):
+        print(f"界面卡顿 {lag * 1000:.0f} ms，槽函数: {slot}")
+        if self.log is None:
+            self.log = logging.getLogger(f'library.ui_stall.{id(self)}')
+            self.log.propagate = False
+            self.log.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_path, maxBytes=STALL_LOG_BYTES, backupCount=STALL_LOG_BACKUPS, encoding='utf-8', delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.log.addHandler(handler)
+        self.log.info(json.dumps({
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'duration_ms': round(lag * 1000, 1),
+            'slot': slot, 'stack': [line.rstrip() for line in stack],
+        }, ensure_ascii=False))
+
+
+class GuiProfiler:
+    """界面线程的 cProfile 开关 (cProfile 只分析调用 enable 的线程)"""
+
+    def __init__(self, output_dir=PROFILE_DIR):
+        self.output_dir = output_dir
+        self.profile = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def start(self):
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop(self, top=20):
+        """停止分析并保存结果，返回 .prof 文件路径；同时在控制台打印累计耗时最多的 top 个函数"""
+        if self.profile is None:
+            return None
+        self.profile.disable()
+        profile, self.profile = self.profile, None
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"gui-{time.strftime('%Y%m%d-%H%M%S')}.prof")
+        profile.dump_stats(path)
+        pstats.Stats(profile).sort_stats('cumulative').print_stats(top)
+        return path
+
+    def toggle(self):
+        """开始或停止分析，返回 (是否正在分析, 停止时保存的文件路径)"""
+        if self.running:
+            return False, self.stop()
+        self.start()
+        return True, None
@@ -1,12 +1,24 @@
 # web_crawler.py (Revised)
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import html as lxml_html
+from lxml.etree import ParserError
+import os
 import time
 import random
 import re
+import argparse
+import queue
+import threading
+from urllib.parse import urlsplit
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http_cache import HttpCache
+from crawl_frontier import CrawlFrontier
 # Make sure db_utils.py is in the same directory or accessible via PYTHONPATH
 try:
-    from db_utils import execute_modify, execute_query
+    from db_utils import transaction, Error as DBError
 except ImportError as e:
     print(f"Error importing from db_utils: {e}")
     print("Please ensure db_utils.py is in the correct location and has no errors.")
@@ -20,15 +32,119 @@ HEADERS = {
     'Referer': 'https://book.douban.com/' # Added referer
 }
 
-def get_page_html(url):
-    """Fetches HTML content for a given URL."""
+# Optional on-disk HTTP cache consulted by get_page_html (see enable_http_cache).
+# In offline mode pages are served only from the cache and the network is never touched.
+_http_cache = None
+_offline_mode = False
+
+def enable_http_cache(cache_dir='.crawler_cache', offline=False):
+    """Turns on the HTTP cache (and optionally offline replay) for all later fetches."""
+    global _http_cache, _offline_mode
+    _http_cache = HttpCache(cache_dir)
+    _offline_mode = offline
+    return _http_cache
+
+def disable_http_cache():
+    global _http_cache, _offline_mode
+    _http_cache = None
+    _offline_mode = False
+
+def is_offline():
+    return _offline_mode
+
+
+# One keep-alive session shared by every fetch (and every worker thread), so
+# repeated requests to the same host reuse the TCP/TLS connection.
+_session = None
+_session_lock = threading.Lock()
+
+def get_session(pool_size=8):
+    """Returns the process-wide requests.Session used by the crawler."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+class TokenBucket:
+    """Thread-safe token bucket: refills `rate` tokens per second, holds at most `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until one token is available, then takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostRateLimiter:
+    """Keeps one TokenBucket per host, so every host gets its own request budget."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate, self.capacity)
+        bucket.acquire()
+
+
+def get_page_html(url, polite_delay=True):
+    """Fetches HTML content for a given URL.
+
+    polite_delay keeps the old random 0.5-1.5s pause before each request; the
+    concurrent crawler turns it off and paces requests with a HostRateLimiter instead.
+    With the HTTP cache enabled, a cached page is revalidated with a conditional
+    GET and its body is only transferred again if the server says it changed.
+    """
+    cache = _http_cache
+    cached = cache.get(url) if cache is not None else None
+    if _offline_mode:
+        if cached is None:
+            print(f"离线模式: 缓存中没有该页面，跳过: {url}")
+            return None
+        cache.record_hit()
+        return cached['body']
+
     try:
         # Add a small delay before each request
-        time.sleep(random.uniform(0.5, 1.5))
-        response = requests.get(url, headers=HEADERS, timeout=15) # Increased timeout
+        if polite_delay:
+            time.sleep(random.uniform(0.5, 1.5))
+        headers = HttpCache.conditional_headers(cached) if cached else None
+        response = get_session().get(url, headers=headers, timeout=15) # Increased timeout
+        if response.status_code == 304 and cached is not None:
+            cache.revalidated(url)
+            return cached['body']
         response.raise_for_status()
         response.encoding = response.apparent_encoding
         # print(f"Successfully fetched: {url}") # Debug fetch success
+        if cache is not None:
+            cache.store(url, response.text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
         return response.text
     except requests.exceptions.Timeout:
         print(f"Request timed out for URL: {url}")
@@ -44,220 +160,491 @@ def get_page_html(url):
         return None
 
 
+# Set CRAWLER_DEBUG=1 to dump the HTML of items that fail to parse
+DEBUG = os.environ.get('CRAWLER_DEBUG') == '1'
+
+# Patterns used for every item on every page, compiled once
+DOUBAN_ID_RE = re.compile(r'/subject/(\d+)/?')
+# Basic cleaning for author: remove country, translator, and potential extra slashes
+AUTHOR_CLEAN_RE = re.compile(r'^\s*\[.*?\]\s*|\s*\(.*?\)\s*|\s*/.*')
+# Price (e.g., CNY 1.00, 68.00元, USD 35.99, $29.95)
+PRICE_RE = re.compile(r'(?:CNY|RMB|￥|\$|USD|元)?\s*(\d+(?:\.\d{1,2})?)', re.IGNORECASE)
+# Year (YYYY or YYYY-MM), must match the full part
+YEAR_RE = re.compile(r'^\b(\d{4})\b(?:-\d{1,2})?$')
+
+DEFAULT_BOOK_TYPE = '综合推荐' # Placeholder category for books that came from the listing only
+
+# Only <tr class="item"> rows carry book data; everything else on the page is skipped
+ITEM_STRAINER = SoupStrainer('tr', class_='item')
+ITEM_XPATH = "//tr[contains(concat(' ', normalize-space(@class), ' '), ' item ')]"
+
+
 def extract_douban_id(url):
     """Extracts Douban subject ID from URL."""
-    match = re.search(r'/subject/(\d+)/?', url)
+    match = DOUBAN_ID_RE.search(url)
     if match:
         return match.group(1)
     return None
 
+def parse_pub_info(pub_info_text):
+    """Splits the 'author / publisher / year / price' line into (Author, Publisher, Year, Price)."""
+    parts = [p.strip() for p in pub_info_text.split('/') if p.strip()]
+    # print(f"Debug Pub Info Parts: {parts}") # Debug parts
+
+    # Extract Author (usually the first part, can be complex)
+    author = None
+    if len(parts) > 0:
+        author_text = AUTHOR_CLEAN_RE.sub('', parts[0]).strip()
+        author = author_text if len(author_text) < 100 else author_text[:100] # Limit length
+
+    # Extract Publisher, Year, Price (order varies, use regex and keywords)
+    publisher = None
+    year = None
+    price_decimal = None
+
+    # Iterate backwards for potentially more reliable Publisher/Year/Price detection
+    possible_publisher_parts = []
+    for part in reversed(parts[1:]): # Start from the end, skip author part
+        price_match = PRICE_RE.search(part)
+        if price_match and price_decimal is None:
+            price_decimal = float(price_match.group(1))
+            continue # Found price, continue to next part
+
+        year_match = YEAR_RE.search(part)
+        if year_match and not year:
+            year = int(year_match.group(1))
+            continue # Found year, continue
+
+        # If it's not clearly price or year, add to potential publisher parts
+        possible_publisher_parts.insert(0, part) # Insert at beginning to maintain order
+
+    # Combine remaining parts as publisher (handle potential translators mixed in)
+    if possible_publisher_parts:
+        full_publisher_text = " / ".join(possible_publisher_parts)
+        publisher = full_publisher_text if len(full_publisher_text) < 100 else full_publisher_text[:100] # Limit length
+
+    return author, publisher, year, price_decimal
+
+def build_book(book_name, detail_url, pub_info_text):
+    """Assembles one Books row from the raw fields of a listing item, or returns None if incomplete."""
+    book_data = {'BookName': book_name}
+    if detail_url:
+        book_data['BookNo'] = extract_douban_id(detail_url) # Use Douban ID as BookNo
+
+    if pub_info_text is not None:
+        author, publisher, year, price = parse_pub_info(pub_info_text)
+        if author is not None:
+            book_data['Author'] = author
+        book_data['Publisher'] = publisher
+        book_data['Year'] = year
+        book_data['Price'] = price # Store decimal price
+    else:
+        print(f"Could not find publication info tag for: {book_name}")
+
+    # Book Type (Generic for now; book_enrichment.py replaces it with the first Douban tag)
+    book_data['BookType'] = DEFAULT_BOOK_TYPE
+
+    # Default Stock (More realistic random numbers)
+    initial_stock = random.randint(5, 15)
+    book_data['Total'] = initial_stock
+    book_data['Storage'] = initial_stock
+
+    # Check if essential data (BookNo and BookName) is present
+    if book_data.get('BookNo') and book_data.get('BookName'):
+        return book_data
+    print(f"信息不完整，跳过: BookNo='{book_data.get('BookNo')}', BookName='{book_data.get('BookName')}'")
+    return None
+
+def _joined_text(element):
+    """lxml equivalent of BeautifulSoup's get_text(strip=True)."""
+    return ''.join(text.strip() for text in element.itertext())
+
 def parse_book_info(html):
-    """Parses HTML to extract book information."""
+    """Parses HTML to extract book information (fast path: lxml XPath over tr.item only)."""
     if not html:
         return []
 
-    soup = BeautifulSoup(html, 'lxml')
+    try:
+        tree = lxml_html.fromstring(html)
+    except ParserError: # Whitespace- or comment-only body; BeautifulSoup simply found no items here
+        return []
+    book_list = []
+    for item in tree.xpath(ITEM_XPATH):
+        try:
+            # 1. Title and Detail URL (which contains the ID)
+            title_tags = item.xpath(".//div[contains(concat(' ', normalize-space(@class), ' '), ' pl2 ')]//a")
+            if not title_tags:
+                continue # Skip if title tag not found
+            title_tag = title_tags[0]
+            book_name = title_tag.get('title', '').strip() or _joined_text(title_tag)
+
+            # 2. Publication Info (Author/Publisher/Year/Price)
+            pub_info_tags = item.xpath(".//p[contains(concat(' ', normalize-space(@class), ' '), ' pl ')]")
+            pub_info_text = _joined_text(pub_info_tags[0]) if pub_info_tags else None
+
+            book_data = build_book(book_name, title_tag.get('href', ''), pub_info_text)
+            if book_data:
+                book_list.append(book_data)
+        except Exception as e:
+            print(f"解析图书条目时发生意外错误: {e}")
+            if DEBUG:
+                print(f"Problematic Item Snippet:\n{lxml_html.tostring(item, encoding='unicode')[:500]}\n--------------------")
+
+    return book_list
+
+def parse_book_info_soup(html, only_items=True):
+    """BeautifulSoup version of parse_book_info.
+
+    only_items=True builds the tree for tr.item rows only (SoupStrainer);
+    only_items=False parses the whole page, as the crawler originally did,
+    and is kept so bench_parser.py can compare against it.
+    """
+    if not html:
+        return []
+
+    soup = BeautifulSoup(html, 'lxml', parse_only=ITEM_STRAINER if only_items else None)
     book_list = []
     items = soup.find_all('tr', class_='item')
     # print(f"Found {len(items)} items on the page.") # Debug item count
 
     for item in items:
-        book_data = {}
         try:
             # 1. Title and Detail URL (which contains the ID)
             title_tag = item.find('div', class_='pl2').find('a')
-            if title_tag:
-                book_data['BookName'] = title_tag.get('title', '').strip()
-                if not book_data['BookName']:
-                    book_data['BookName'] = title_tag.get_text(strip=True)
-
-                detail_url = title_tag.get('href', '')
-                if detail_url:
-                    book_data['BookNo'] = extract_douban_id(detail_url) # Use Douban ID as BookNo
-            else:
-                # print("Could not find title tag for an item.") # Debug missing title
+            if not title_tag:
                 continue # Skip if title tag not found
+            book_name = title_tag.get('title', '').strip() or title_tag.get_text(strip=True)
 
             # 2. Publication Info (Author/Publisher/Year/Price)
             pub_info_tag = item.find('p', class_='pl')
-            if pub_info_tag:
-                pub_info_text = pub_info_tag.get_text(strip=True)
-                parts = [p.strip() for p in pub_info_text.split('/') if p.strip()]
-                # print(f"Debug Pub Info Parts for {book_data.get('BookName')}: {parts}") # Debug parts
-
-                # Extract Author (usually the first part, can be complex)
-                if len(parts) > 0:
-                     # Basic cleaning for author: remove country/translator marks
-                    author_text = re.sub(r'^\s*\[.*?\]\s*|\s*\(.*?\)\s*|\s*/.*', '', parts[0]).strip() # Remove country, translator, and potential extra slashes
-                    book_data['Author'] = author_text if len(author_text) < 100 else author_text[:100] # Limit length
-
-
-                # Extract Publisher, Year, Price (order varies, use regex and keywords)
-                publisher = None
-                year = None
-                price_str = None
-                price_decimal = None
-
-                # Iterate backwards for potentially more reliable Publisher/Year/Price detection
-                possible_publisher_parts = []
-                for part in reversed(parts[1:]): # Start from the end, skip author part
-                    # Try Price (e.g., CNY 1.00, 68.00元, USD 35.99, $29.95)
-                    price_match = re.search(r'(?:CNY|RMB|￥|\$|USD|元)?\s*(\d+(?:\.\d{1,2})?)', part, re.IGNORECASE)
-                    if price_match and not price_str:
-                         price_str = part # Store original price string if needed
-                         price_decimal = float(price_match.group(1))
-                         continue # Found price, continue to next part
-
-                    # Try Year (YYYY or YYYY-MM)
-                    year_match = re.search(r'^\b(\d{4})\b(?:-\d{1,2})?$', part) # Match full part as year
-                    if year_match and not year:
-                        year = int(year_match.group(1))
-                        continue # Found year, continue
-
-                    # If it's not clearly price or year, add to potential publisher parts
-                    possible_publisher_parts.insert(0, part) # Insert at beginning to maintain order
-
-
-                # Combine remaining parts as publisher (handle potential translators mixed in)
-                if possible_publisher_parts:
-                     # Simple approach: join parts, filter common non-publisher keywords if needed
-                     full_publisher_text = " / ".join(possible_publisher_parts)
-                     # Further cleaning might be needed based on observed patterns
-                     publisher = full_publisher_text if len(full_publisher_text) < 100 else full_publisher_text[:100] # Limit length
-
-
-                book_data['Publisher'] = publisher
-                book_data['Year'] = year
-                book_data['Price'] = price_decimal # Store decimal price
+            pub_info_text = pub_info_tag.get_text(strip=True) if pub_info_tag else None
 
-            else:
-                 print(f"Could not find publication info tag for: {book_data.get('BookName')}")
-
-
-            # 3. Rating (Optional)
-            rating_tag = item.find('span', class_='rating_nums')
-            # if rating_tag:
-            #     try:
-            #         book_data['Rating'] = float(rating_tag.get_text(strip=True))
-            #     except ValueError:
-            #         book_data['Rating'] = None
-
-            # 4. Book Type (Generic for now)
-            book_data['BookType'] = '综合推荐'
-
-            # 5. Default Stock (More realistic random numbers)
-            initial_stock = random.randint(5, 15)
-            book_data['Total'] = initial_stock
-            book_data['Storage'] = initial_stock
-
-            # --- Debugging Print ---
-            # print(f"--- Parsed Data ---")
-            # print(f"  BookNo: {book_data.get('BookNo')}")
-            # print(f"  BookName: {book_data.get('BookName')}")
-            # print(f"  Author: {book_data.get('Author')}")
-            # print(f"  Publisher: {book_data.get('Publisher')}")
-            # print(f"  Year: {book_data.get('Year')}")
-            # print(f"  Price: {book_data.get('Price')}")
-            # print("--------------------")
-
-            # Check if essential data (BookNo and BookName) is present
-            if book_data.get('BookNo') and book_data.get('BookName'):
+            book_data = build_book(book_name, title_tag.get('href', ''), pub_info_text)
+            if book_data:
                 book_list.append(book_data)
-            else:
-                print(f"信息不完整，跳过: BookNo='{book_data.get('BookNo')}', BookName='{book_data.get('BookName')}'")
-
         except Exception as e:
-            # Log detailed error including the problematic item's HTML if possible
-            item_html_snippet = item.prettify()[:500] # Get first 500 chars of the item's HTML
             print(f"解析图书条目时发生意外错误: {e}")
-            # print(f"Problematic Item Snippet:\n{item_html_snippet}\n--------------------")
-
+            if DEBUG:
+                # Only pay for prettify() when someone is going to read it
+                print(f"Problematic Item Snippet:\n{item.prettify()[:500]}\n--------------------")
 
     return book_list
 
-def save_books_to_db(book_list):
-    """Saves a list of book data dictionaries to the database."""
-    if not book_list:
-        return 0
+# Columns refreshed for books that are already in the catalogue when update_existing=True.
+# BookType/Total/Storage are left alone: librarians re-classify books and stock counts
+# belong to circulation, not to the crawler.
+BOOK_INSERT_SQL = """
+INSERT INTO Books
+(BookNo, BookType, BookName, Publisher, Year, Author, Price, Total, Storage)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+# Both backends report *matched* rows in rowcount (mysql-connector sets CLIENT_FOUND_ROWS
+# by default, SQLite always does), so the <=> guard is what makes rowcount mean "changed":
+# it keeps rows whose values are already current out of the match. Do not drop it.
+BOOK_REFRESH_SQL = """
+UPDATE Books SET BookName = %s, Publisher = %s, Year = %s, Author = %s, Price = %s
+WHERE BookNo = %s
+  AND NOT (BookName <=> %s AND Publisher <=> %s AND Year <=> %s AND Author <=> %s AND Price <=> %s)
+"""
+
+def save_books_batch(book_list, update_existing=False):
+    """Saves a page of parsed books in one transaction on one connection.
+
+    One `SELECT ... WHERE BookNo IN (...)` finds the books already stored, new
+    books go in with a single executemany (sent as one multi-row INSERT) and,
+    with update_existing, existing books get their bibliographic fields refreshed.
+    Returns a dict of counts: inserted / updated / skipped / failed.
+    """
+    counts = {'inserted': 0, 'updated': 0, 'skipped': 0, 'failed': 0}
+    unique_books = {}
+    for book in book_list or []:
+        if book['BookNo'] in unique_books:
+            counts['skipped'] += 1 # Same book listed twice in one batch
+        else:
+            unique_books[book['BookNo']] = book
+    if not unique_books:
+        return counts
+
+    placeholders = ", ".join(["%s"] * len(unique_books))
+    try:
+        with transaction() as cursor:
+            cursor.execute(f"SELECT BookNo FROM Books WHERE BookNo IN ({placeholders})", tuple(unique_books))
+            existing = {row[0] for row in cursor.fetchall()}
+            new_rows = [
+                (book['BookNo'], book.get('BookType', '未分类'), book.get('BookName'), book.get('Publisher'),
+                 book.get('Year'), book.get('Author'), book.get('Price'), book.get('Total', 0), book.get('Storage', 0))
+                for book_no, book in unique_books.items() if book_no not in existing
+            ]
+            if new_rows:
+                cursor.executemany(BOOK_INSERT_SQL, new_rows)
+            updated = 0
+            if update_existing and existing:
+                refresh_rows = []
+                for book_no, book in unique_books.items():
+                    if book_no in existing:
+                        values = (book.get('BookName'), book.get('Publisher'), book.get('Year'),
+                                  book.get('Author'), book.get('Price'))
+                        refresh_rows.append(values + (book_no,) + values)
+                cursor.executemany(BOOK_REFRESH_SQL, refresh_rows)
+                updated = max(cursor.rowcount, 0) # Rows whose values actually changed
+    except DBError as e:
+        print(f"批量保存图书失败，本批 {len(unique_books)} 本已回滚: {e}")
+        counts['failed'] = len(unique_books)
+        return counts
+
+    counts['inserted'] = len(new_rows)
+    counts['updated'] = updated
+    counts['skipped'] += len(existing) - updated
+    return counts
+
+def add_counts(total, counts):
+    """Accumulates save_books_batch results into `total` (in place) and returns it."""
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+def crawl_concurrent(urls, max_workers=4, rate_per_host=1.0, burst=2, update_existing=False):
+    """Crawls `urls` concurrently and returns the save counts (see save_books_batch).
+
+    Pipeline: a thread pool fetches pages (paced per host by a token bucket and
+    sharing one keep-alive session), the calling thread parses pages as they
+    complete, and a single writer thread saves parsed books to the database,
+    so network I/O, parsing and DB writes overlap.
+    """
+    limiter = HostRateLimiter(rate_per_host, burst)
+    save_queue = queue.Queue(maxsize=max_workers * 2) # Bounded: parsing waits if the DB falls behind
+    save_totals = {}
+
+    def fetch(url):
+        if not is_offline(): # Replaying from the cache needs no pacing
+            limiter.acquire(url)
+        return get_page_html(url, polite_delay=False)
+
+    def db_writer():
+        while True:
+            books = save_queue.get()
+            if books is None:
+                break
+            try:
+                add_counts(save_totals, save_books_batch(books, update_existing))
+            except Exception as e:
+                print(f"保存图书时发生错误: {e}")
+
+    get_session(pool_size=max_workers)
+    writer_thread = threading.Thread(target=db_writer, name="crawler-db-writer", daemon=True)
+    writer_thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawler-fetch") as pool:
+            futures = {pool.submit(fetch, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    page_html = future.result()
+                    if not page_html:
+                        print(f"无法获取页面内容，跳过此页: {url}")
+                        continue
+                    parsed_books = parse_book_info(page_html)
+                except Exception as e: # One bad page must not stop the rest of the crawl
+                    print(f"处理页面时发生错误，跳过此页: {url} ({e})")
+                    continue
+                print(f"页面解析完成，找到 {len(parsed_books)} 本有效图书信息: {url}")
+                if parsed_books:
+                    save_queue.put(parsed_books)
+    finally:
+        save_queue.put(None)
+        writer_thread.join()
+    return save_totals
+
+
+# How a crawl job handles one kind of page (frontier 'kind'): parse(html, url) -> items,
+# save(items) -> counts dict (see save_books_batch), and optionally follow(items) ->
+# {kind: [urls]} for new pages to queue, e.g. detail pages linked from a list page.
+# save() may receive the items of several pages of the same kind at once. fetch(url) -> html
+# replaces the rate-limited HTTP fetch, e.g. for pages read from local files.
+PageHandler = namedtuple('PageHandler', ['parse', 'save', 'follow', 'fetch'], defaults=[None, None])
+
+SAVE_BATCH_PAGES = 20 # The job writer merges up to this many queued pages into one save() call
+
+def default_handlers(update_existing=False):
+    """Handlers for the Top250 list pages."""
+    return {'list': PageHandler(parse=lambda html, url: parse_book_info(html),
+                                save=lambda books: save_books_batch(books, update_existing))}
+
+def run_crawl_job(frontier, handlers=None, max_workers=4, rate_per_host=1.0, burst=2, max_attempts=3,
+                  max_rate=None):
+    """Runs every unfinished URL in `frontier` through fetch -> parse -> save.
+
+    Same pipeline as crawl_concurrent, but each step is checkpointed in the
+    frontier: saved pages are never fetched again, pages parsed before an
+    interruption are saved straight from their checkpoint, and failed pages
+    are retried on later runs up to max_attempts. URLs queued by a handler's
+    follow() during the run are crawled in the same run. Returns the save counts.
+    Requests are paced per host by rate_per_host and, if max_rate is set, also
+    by one budget shared by all hosts.
+    """
+    handlers = handlers or default_handlers()
+    kinds = list(handlers)
+    limiter = HostRateLimiter(rate_per_host, burst)
+    budget = TokenBucket(max_rate, burst) if max_rate else None
+    save_queue = queue.Queue(maxsize=max_workers * 2)
+    save_totals = {}
+
+    def save(jobs):
+        """Saves [(url, kind, items)] with one save() call per kind."""
+        by_kind = {}
+        for url, kind, items in jobs:
+            by_kind.setdefault(kind, []).append((url, items))
+        for kind, pages in by_kind.items():
+            items = [item for _, page_items in pages for item in page_items]
+            try:
+                counts = handlers[kind].save(items)
+            except Exception as e:
+                print(f"保存 {len(pages)} 个页面的数据时发生错误: {e}")
+                counts = {'failed': len(items)}
+            add_counts(save_totals, counts)
+            for url, _ in pages:
+                if counts.get('failed'):
+                    frontier.mark_failed(url, "保存到数据库失败")
+                else:
+                    frontier.mark_saved(url)
+
+    resumed = frontier.parsed_items(kinds)
+    if resumed:
+        print(f"恢复上次中断时已解析未保存的 {len(resumed)} 个页面...")
+    for start in range(0, len(resumed), SAVE_BATCH_PAGES):
+        save(resumed[start:start + SAVE_BATCH_PAGES])
+
+    def fetch(url, kind):
+        if handlers[kind].fetch:
+            return handlers[kind].fetch(url)
+        if not is_offline():
+            if budget is not None:
+                budget.acquire()
+            limiter.acquire(url)
+        return get_page_html(url, polite_delay=False)
+
+    def db_writer():
+        finished = False
+        while not finished:
+            jobs = [save_queue.get()]
+            # Take whatever else is already waiting, so a burst of small pages is one transaction
+            while len(jobs) < SAVE_BATCH_PAGES and not save_queue.empty():
+                jobs.append(save_queue.get())
+            if None in jobs:
+                finished = True
+                jobs.remove(None)
+            if jobs:
+                save(jobs)
+
+    get_session(pool_size=max_workers)
+    writer_thread = threading.Thread(target=db_writer, name="crawler-db-writer", daemon=True)
+    writer_thread.start()
+    attempted = set() # Each URL is tried at most once per run
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crawler-fetch") as pool:
+            while True:
+                batch = frontier.todo(kinds, max_attempts, exclude=attempted)
+                if not batch:
+                    break
+                attempted.update(url for url, _ in batch)
+                futures = {pool.submit(fetch, url, kind): (url, kind) for url, kind in batch}
+                for future in as_completed(futures):
+                    url, kind = futures[future]
+                    handler = handlers[kind]
+                    try:
+                        page_html = future.result()
+                        if not page_html:
+                            frontier.mark_failed(url, "无法获取页面内容")
+                            continue
+                        frontier.mark_fetched(url)
+                        items = handler.parse(page_html, url)
+                        if not items:
+                            frontier.mark_failed(url, "未能从页面解析出数据")
+                            continue
+                        followed = handler.follow(items) if handler.follow else {}
+                    except Exception as e: # One bad page must not stop the job; it is retried on a later run
+                        print(f"处理页面时发生错误: {url} ({e})")
+                        frontier.mark_failed(url, str(e))
+                        continue
+                    frontier.mark_parsed(url, items)
+                    for follow_kind, follow_urls in followed.items():
+                        frontier.add(follow_urls, follow_kind)
+                    save_queue.put((url, kind, items))
+    finally:
+        save_queue.put(None)
+        writer_thread.join()
+    return save_totals
 
-    saved_count = 0
-    for book in book_list:
-        # Check if book with the same BookNo (Douban ID) already exists
-        check_sql = "SELECT BookNo FROM Books WHERE BookNo = %s"
-        try:
-            existing_book = execute_query(check_sql, (book['BookNo'],))
-        except Exception as query_err:
-             print(f"查询数据库时出错 (BookNo: {book['BookNo']}): {query_err}")
-             continue # Skip this book if query fails
-
-        if existing_book:
-            print(f"图书 '{book.get('BookName', 'N/A')}' (ID: {book['BookNo']}) 已存在，跳过。")
-            continue
-
-        # Prepare SQL INSERT statement
-        sql = """
-        INSERT INTO Books
-        (BookNo, BookType, BookName, Publisher, Year, Author, Price, Total, Storage)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        params = (
-            book.get('BookNo'),
-            book.get('BookType', '未分类'),
-            book.get('BookName'),
-            book.get('Publisher'),
-            book.get('Year'),
-            book.get('Author'),
-            book.get('Price'), # Can be None
-            book.get('Total', 0),
-            book.get('Storage', 0)
-        )
-
-        # Execute the insert operation
-        try:
-             # execute_modify returns lastrowid for INSERT, which might be 0 or None if not applicable/supported.
-             # Success is better determined by lack of exception here.
-             execute_modify(sql, params)
-             # We assume success if no exception was raised
-             saved_count += 1
-             print(f"成功插入: {book.get('BookName', 'N/A')} (ID: {book['BookNo']})")
-        except Exception as modify_err:
-             print(f"插入图书失败 (ID: {book['BookNo']}, Name: {book.get('BookName', 'N/A')}): {modify_err}")
-             # You might want to log the failing 'params' here for debugging
-             # print(f"Failing Params: {params}")
-
-    return saved_count
 
 # --- Main Execution ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="爬取豆瓣图书 Top 250 并存入数据库")
+    parser.add_argument('--pages', type=int, default=3, help="爬取的页数 (每页 25 本，默认 3 页)")
+    parser.add_argument('--concurrent', action='store_true', help="使用并发抓取模式")
+    parser.add_argument('--workers', type=int, default=4, help="并发模式下的抓取线程数")
+    parser.add_argument('--rate', type=float, default=1.0, help="并发模式下每个主机每秒最多请求数")
+    parser.add_argument('--job', metavar='STATE_FILE', help="可恢复的抓取任务: 进度保存在该 SQLite 文件中，中断后再次运行会从断点继续")
+    parser.add_argument('--max-attempts', type=int, default=3, help="任务模式下每个页面最多尝试的次数 (跨多次运行累计)")
+    parser.add_argument('--update', action='store_true', help="更新已存在图书的书名、作者、出版信息和价格")
+    parser.add_argument('--cache-dir', default='.crawler_cache', help="HTTP 缓存目录")
+    parser.add_argument('--no-cache', action='store_true', help="不使用 HTTP 缓存")
+    parser.add_argument('--offline', action='store_true', help="离线回放: 只从 HTTP 缓存读取页面，不访问网络")
+    args = parser.parse_args()
+    if args.offline and args.no_cache:
+        parser.error("--offline 需要使用 HTTP 缓存，不能与 --no-cache 同时使用")
+    http_cache = None if args.no_cache else enable_http_cache(args.cache_dir, offline=args.offline)
+
     base_url = "https://book.douban.com/top250?start={}"
     start_page = 0  # Start from the first page (index 0)
-    max_pages_to_crawl = 3 # Limit the crawl to 3 pages (75 books) for testing
-    total_saved_books = 0
+    max_pages_to_crawl = args.pages # Limit the crawl to 3 pages (75 books) by default
+    save_totals = {}
 
     print("开始爬取豆瓣图书 Top 250...")
 
-    for i in range(start_page, max_pages_to_crawl):
-        page_offset = i * 25
-        current_url = base_url.format(page_offset)
-        print(f"\n>>> 正在爬取页面 {i+1}/{max_pages_to_crawl}: {current_url}")
-
-        page_html = get_page_html(current_url)
-
-        if page_html:
-            parsed_books = parse_book_info(page_html)
-            if parsed_books:
-                print(f"页面解析完成，找到 {len(parsed_books)} 本有效图书信息。准备存入数据库...")
-                saved_this_page = save_books_to_db(parsed_books)
-                total_saved_books += saved_this_page
-                print(f"本页成功存入 {saved_this_page} 本图书。")
+    if args.job:
+        frontier = CrawlFrontier(args.job)
+        added = frontier.add([base_url.format(i * 25) for i in range(start_page, max_pages_to_crawl)], 'list')
+        print(f"抓取任务 {args.job}: 新加入 {added} 个页面，当前进度 {frontier.stats()}")
+        try:
+            save_totals = run_crawl_job(frontier, default_handlers(args.update), max_workers=args.workers,
+                                        rate_per_host=args.rate, max_attempts=args.max_attempts)
+            print(f"任务进度: {frontier.stats()}")
+        finally:
+            frontier.close()
+    elif args.concurrent:
+        page_urls = [base_url.format(i * 25) for i in range(start_page, max_pages_to_crawl)]
+        print(f"并发模式: {args.workers} 个抓取线程，每个主机每秒最多 {args.rate} 个请求")
+        save_totals = crawl_concurrent(page_urls, max_workers=args.workers, rate_per_host=args.rate,
+                                       update_existing=args.update)
+    else:
+        for i in range(start_page, max_pages_to_crawl):
+            page_offset = i * 25
+            current_url = base_url.format(page_offset)
+            print(f"\n>>> 正在爬取页面 {i+1}/{max_pages_to_crawl}: {current_url}")
+
+            page_html = get_page_html(current_url, polite_delay=not is_offline())
+
+            if page_html:
+                parsed_books = parse_book_info(page_html)
+                if parsed_books:
+                    print(f"页面解析完成，找到 {len(parsed_books)} 本有效图书信息。准备存入数据库...")
+                    page_counts = save_books_batch(parsed_books, update_existing=args.update)
+                    add_counts(save_totals, page_counts)
+                    print(f"本页新增 {page_counts['inserted']} 本，更新 {page_counts['updated']} 本，"
+                          f"跳过 {page_counts['skipped']} 本，失败 {page_counts['failed']} 本。")
+                else:
+                    print("未能从页面解析出有效图书信息。")
             else:
-                print("未能从页面解析出有效图书信息。")
-        else:
-            print(f"无法获取页面内容，跳过此页。")
-
-        # Wait a bit before the next request
-        sleep_duration = random.uniform(1.5, 3.5) # Slightly longer random delay
-        print(f"暂停 {sleep_duration:.2f} 秒...")
-        time.sleep(sleep_duration)
-
-    print(f"\n爬取任务完成！总共成功存入 {total_saved_books} 本图书到数据库。")
\ No newline at end of file
+                print(f"无法获取页面内容，跳过此页。")
+
+            # Wait a bit before the next request
+            if not is_offline():
+                sleep_duration = random.uniform(1.5, 3.5) # Slightly longer random delay
+                print(f"暂停 {sleep_duration:.2f} 秒...")
+                time.sleep(sleep_duration)
+
+    print(f"\n爬取任务完成！总共新增 {save_totals.get('inserted', 0)} 本图书，"
+          f"更新 {save_totals.get('updated', 0)} 本，跳过 {save_totals.get('skipped', 0)} 本，"
+          f"失败 {save_totals.get('failed', 0)} 本。")
+    if http_cache is not None:
+        print(f"HTTP 缓存: 命中 {http_cache.hits} 页，下载 {http_cache.misses} 页 (目录: {args.cache_dir})")
\ No newline at end of file